@@ -0,0 +1,165 @@
+"""
+Cold-start report: how long each entry point takes from a fresh process to its first answer.
+- imports: import time of server, agent, execution and client_app, with their heaviest imports (python -X importtime)
+- server: spawn to listening, then the first MCP session, upload, execute_code_geninfo and execute_code_plotting,
+  plus the startup spans the server recorded (imports, background warm-up)
+- agent: AgentReAct construction and its first scripted turn in a fresh process
+- client: client_app import and its background warm-up
+
+    python bench/cold_start.py
+    python bench/cold_start.py --output cold_start.json
+"""
+import time
+STARTED = time.perf_counter() # first answers of the fresh subprocesses are timed from here
+import io
+import os
+import re
+import sys
+import json
+import base64
+import asyncio
+import argparse
+import subprocess
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(os.path.dirname(BENCH_DIR), "src")
+sys.path.insert(0, SRC_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from run_benchmarks import free_port, start_server, load_script
+
+MODULES = ["server", "agent", "execution", "client_app"]
+TOP_IMPORTS = 5 # heaviest imports listed per module
+SAMPLE_CSV = b"city,value,flag\nParis,1.5,true\nLyon,2.5,false\nNice,,true\n"
+PLOT_CODE = "import matplotlib.pyplot as plt\nfig, ax = plt.subplots()\nax.bar(df['city'], df['value'])"
+
+
+def import_times(module: str) -> dict:
+    """Seconds to import module in a fresh interpreter and its heaviest direct or second-level imports"""
+    stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=SRC_DIR,
+                            capture_output=True, text=True).stderr
+    rows = []
+    for line in stderr.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \| ( *)(\S+)", line)
+        if match:
+            rows.append((int(match.group(1)) / 1e6, len(match.group(2)) // 2, match.group(3)))
+    total = next((seconds for seconds, depth, name in rows if depth == 0 and name == module), None)
+    heaviest = sorted(((seconds, name) for seconds, depth, name in rows if depth in (1, 2)), reverse=True)[:TOP_IMPORTS]
+    return {"import_s": total, "heaviest": {name: round(seconds, 3) for seconds, name in heaviest}}
+
+
+async def first_calls(port: int, started: float) -> dict:
+    """The first session against a freshly started server, timed from the moment it was spawned"""
+    from fastmcp import Client
+    report = {}
+    start = time.perf_counter()
+    async with Client(f"http://127.0.0.1:{port}/mcp") as client:
+        report["connect_s"] = time.perf_counter() - start
+        start = time.perf_counter()
+        await client.call_tool("upload_csv", {"base64_csv": base64.b64encode(SAMPLE_CSV).decode()})
+        report["first_upload_s"] = time.perf_counter() - start
+        start = time.perf_counter()
+        await client.call_tool("execute_code_geninfo", {"code": "print(df['value'].mean())"})
+        report["first_geninfo_s"] = time.perf_counter() - start
+        report["first_answer_s"] = time.perf_counter() - started
+        start = time.perf_counter()
+        await client.call_tool("execute_code_plotting", {"code": PLOT_CODE})
+        report["first_plot_s"] = time.perf_counter() - start
+        metrics = json.loads((await client.read_resource("resource://metrics"))[0].text)
+    for histogram in metrics["histograms"]:
+        if histogram["labels"].get("span") == "startup":
+            report[f"startup.{histogram['labels']['phase']}_s"] = histogram["sum"]
+    return report
+
+
+def run_server(warm_up_wait: float) -> dict:
+    """Spawns server.py and times it up to its first answers. warm_up_wait seconds pass between listening and the first call"""
+    port = free_port()
+    started = time.perf_counter()
+    server = start_server(port)
+    try:
+        report = {"listen_s": time.perf_counter() - started}
+        if warm_up_wait:
+            time.sleep(warm_up_wait) # a user connecting a little after a deploy
+        return {**report, **asyncio.run(first_calls(port, started))}
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def run_agent() -> dict:
+    """AgentReAct from a fresh process: import, construction and the first scripted turn (first_answer_s counts from process start)"""
+    import pandas as pd
+    from fake_model import ScriptedChatModel
+    report = {}
+    start = time.perf_counter()
+    import agent as agent_module
+    report["import_s"] = time.perf_counter() - start
+    script = load_script("agent")[:1]
+    agent_module.init_chat_model = lambda *args, **kwargs: ScriptedChatModel(script=script)
+    df = pd.read_csv(io.BytesIO(SAMPLE_CSV))
+    start = time.perf_counter()
+    bot = agent_module.AgentReAct(df=df)
+    report["init_s"] = time.perf_counter() - start
+    start = time.perf_counter()
+    bot.get_response(script[0]["question"])
+    report["first_turn_s"] = time.perf_counter() - start
+    report["first_answer_s"] = time.perf_counter() - STARTED
+    return report
+
+
+def run_client() -> dict:
+    """client_app from a fresh process: import (builds the Gradio UI) and the background warm-up it starts at launch"""
+    os.environ.setdefault("OPENAI_API_KEY", "cold-start") # the model client is created, never called
+    report = {}
+    start = time.perf_counter()
+    import client_app
+    report["import_s"] = time.perf_counter() - start
+    start = time.perf_counter()
+    client_app.warm_up()
+    report["warm_up_s"] = time.perf_counter() - start
+    return report
+
+
+def in_subprocess(target: str) -> dict:
+    output = subprocess.run([sys.executable, __file__, "--run", target], cwd=SRC_DIR, capture_output=True, text=True)
+    if output.returncode != 0:
+        raise RuntimeError(f"{target} run failed:\n{output.stderr[-2000:]}")
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def print_report(results: dict):
+    for section, values in results.items():
+        print(f"\n{section}")
+        for name, value in values.items():
+            if isinstance(value, dict):
+                print(f"  {name:<32}" + ", ".join(f"{k} {v:.3f}" for k, v in value.items()))
+            else:
+                print(f"  {name:<32}{value:>10.3f}" if isinstance(value, float) else f"  {name:<32}{value:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold-start report: import times and time to the first answer")
+    parser.add_argument("--modules", nargs="+", default=MODULES, help="modules whose import time is measured")
+    parser.add_argument("--warm-up-wait", type=float, default=0.0,
+                        help="seconds between the server listening and the first call (0 measures the worst case)")
+    parser.add_argument("--output", help="also write the report as json to this file")
+    parser.add_argument("--run", choices=["agent", "client"], help=argparse.SUPPRESS) # a single run in this subprocess
+    args = parser.parse_args()
+
+    if args.run:
+        print(json.dumps(run_agent() if args.run == "agent" else run_client()))
+        return
+
+    results = {f"imports/{module}": import_times(module) for module in args.modules}
+    results["server"] = run_server(args.warm_up_wait)
+    results["agent"] = in_subprocess("agent")
+    results["client"] = in_subprocess("client")
+    print_report(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+from typing import Any, Optional
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+
+class ScriptedChatModel(BaseChatModel):
+    """
+    Deterministic stand-in for the chat model: replays recorded tool calls instead of calling OpenAI.
+    script is one entry per user turn: {"question", "steps": [[{"tool", "args"}, ...], ...], "answer"}, tool names
+    already mapped to the agent's tools. Each model call returns the calls of the next step of the current turn
+    (several calls in one step run in parallel), then the answer.
+    """
+    script: list
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def bind_tools(self, tools, **kwargs):
+        return self # tool calls come from the script
+
+    def _generate(self, messages: list, stop: Optional[list] = None, run_manager: Any = None, **kwargs) -> ChatResult:
+        turn = sum(1 for m in messages if isinstance(m, HumanMessage)) - 1
+        last_human = max(i for i, m in enumerate(messages) if isinstance(m, HumanMessage))
+        step = sum(1 for m in messages[last_human:] if isinstance(m, AIMessage))
+        entry = self.script[turn % len(self.script)]
+        if step < len(entry["steps"]):
+            calls = entry["steps"][step]
+            message = AIMessage(content="", tool_calls=[
+                {"name": call["tool"], "args": call["args"], "id": f"call-{turn}-{step}-{i}"} for i, call in enumerate(calls)
+            ])
+        else:
+            outputs = [m.content for m in messages[last_human:] if isinstance(m, ToolMessage)]
+            message = AIMessage(content=entry["answer"] + (f" ({len(outputs)} tool results)" if outputs else ""))
+        return ChatResult(generations=[ChatGeneration(message=message)])
@@ -0,0 +1,416 @@
+"""
+Offline end-to-end benchmarks. The chat model is replaced by ScriptedChatModel, which replays the tool calls
+in script.json, so no API key or network is needed. For each dataset size it runs
+- agent: AgentReAct in-process
+- server: the FastMCP server over local HTTP, driven through the client app's own upload/chat/sync code
+each in a fresh subprocess (so peak RSS is per run), prints a report and compares it with a stored baseline.
+
+    python bench/run_benchmarks.py --sizes 10000 100000 1000000
+    python bench/run_benchmarks.py --save-baseline
+    python bench/run_benchmarks.py --fail-on-regression
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import resource
+import asyncio
+import subprocess
+from types import SimpleNamespace
+from collections import defaultdict
+import numpy as np
+import pandas as pd
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(os.path.dirname(BENCH_DIR), "src")
+sys.path.insert(0, SRC_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from langchain_core.callbacks import BaseCallbackHandler
+from fake_model import ScriptedChatModel
+
+SIZES = [10_000, 100_000, 1_000_000] # 10_000_000 is opt-in (about 700MB of csv)
+TARGETS = ["agent", "server"]
+BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+THRESHOLD = 0.25 # relative slowdown/growth reported as a regression
+NOISE_SECONDS = 0.05 # timing differences below this are never regressions
+GENERATE_ROWS = 1_000_000 # rows generated and written per chunk
+
+# script tool kinds -> (tool name, argument name) of each target
+TOOLS = {
+    "agent": {
+        "geninfo": ("CodeExecutionGenInfo", "__arg1"),
+        "plotting": ("CodeExecutionPlotting", "__arg1"),
+        "modifying": ("CodeExecutionModification", "__arg1")
+    },
+    "server": {
+        "geninfo": ("execute_code_geninfo", "code"),
+        "plotting": ("execute_code_plotting", "code"),
+        "modifying": ("execute_code_modifying", "code")
+    }
+}
+
+
+# ========== DATA ==========
+def generate_dataset(rows: int, path: str, seed: int = 0):
+    """Synthetic csv with integer, float (with nulls), low and high cardinality text, date and bool columns"""
+    rng = np.random.default_rng(seed)
+    categories = np.array([f"cat_{i:02d}" for i in range(20)])
+    cities = np.array([f"city_{i:03d}" for i in range(200)])
+    days = pd.date_range("2020-01-01", "2024-12-31").strftime("%Y-%m-%d").to_numpy()
+    with open(path + ".tmp", "w") as f:
+        for start in range(0, rows, GENERATE_ROWS):
+            n = min(GENERATE_ROWS, rows - start)
+            amount = rng.lognormal(3, 1, n).round(2)
+            amount[rng.random(n) < 0.01] = np.nan
+            pd.DataFrame({
+                "id": np.arange(start, start + n),
+                "category": categories[rng.integers(0, len(categories), n)],
+                "city": cities[rng.integers(0, len(cities), n)],
+                "value": rng.normal(50, 15, n).round(3),
+                "amount": amount,
+                "date": days[rng.integers(0, len(days), n)],
+                "flag": rng.random(n) < 0.3
+            }).to_csv(f, index=False, header=start == 0)
+    os.replace(path + ".tmp", path)
+
+
+def dataset_path(data_dir: str, rows: int) -> str:
+    path = os.path.join(data_dir, f"synthetic-{rows}.csv")
+    if not os.path.exists(path):
+        print(f"generating {rows} rows -> {path}", file=sys.stderr)
+        generate_dataset(rows, path)
+    return path
+
+
+def load_script(target: str) -> list:
+    """script.json with the tool kinds mapped to the target's tool names and arguments"""
+    with open(os.path.join(BENCH_DIR, "script.json")) as f:
+        script = json.load(f)
+    for turn in script:
+        steps = []
+        for step in turn["steps"]:
+            calls = [{"tool": TOOLS[target][call["tool"]][0], "args": {TOOLS[target][call["tool"]][1]: call["code"]}}
+                     for call in (step if isinstance(step, list) else [step])]
+            steps.append(calls)
+        turn["steps"] = steps
+    return script
+
+
+# ========== MEASUREMENT ==========
+class ToolTimer(BaseCallbackHandler):
+    """Wall-clock latency and output size of every tool call"""
+    run_inline = True
+
+    def __init__(self):
+        self.started = {}
+        self.calls = []
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        self.started[run_id] = (serialized.get("name"), time.perf_counter())
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        name, start = self.started.pop(run_id)
+        content = getattr(output, "content", output)
+        self.calls.append({"tool": name, "seconds": time.perf_counter() - start, "bytes": len(str(content).encode())})
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        name, start = self.started.pop(run_id)
+        self.calls.append({"tool": name, "seconds": time.perf_counter() - start, "bytes": 0, "error": str(error)})
+
+    def summary(self) -> dict:
+        tools = defaultdict(list)
+        for call in self.calls:
+            tools[call["tool"]].append(call)
+        return {name: {
+            "calls": len(calls),
+            "mean_s": sum(c["seconds"] for c in calls) / len(calls),
+            "max_s": max(c["seconds"] for c in calls),
+            "output_bytes": sum(c["bytes"] for c in calls),
+            "errors": sum("error" in c for c in calls)
+        } for name, calls in tools.items()}
+
+
+def timed(function, totals: dict, key: str):
+    """Wraps function to add its wall-clock time and call count to totals[key]"""
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            totals[key + "_s"] = totals.get(key + "_s", 0) + time.perf_counter() - start
+            totals[key + "_calls"] = totals.get(key + "_calls", 0) + 1
+    return wrapper
+
+
+def self_peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 # kilobytes on linux
+
+
+def process_peak_rss_mb(pid: int) -> tuple:
+    """(peak RSS of pid, largest peak RSS among its descendants) in MB, from /proc"""
+    def hwm(p):
+        try:
+            with open(f"/proc/{p}/status") as f:
+                return next(int(line.split()[1]) for line in f if line.startswith("VmHWM")) / 1024
+        except (OSError, StopIteration):
+            return 0.0
+
+    parents = {}
+    for entry in os.listdir("/proc"):
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                parents[int(entry)] = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (ValueError, OSError):
+            continue
+
+    def children(p):
+        kids = [child for child, parent in parents.items() if parent == p]
+        return kids + [g for k in kids for g in children(k)]
+
+    return hwm(pid), max([hwm(c) for c in children(pid)], default=0.0)
+
+
+# ========== TARGETS ==========
+def run_agent(path: str) -> dict:
+    """AgentReAct in-process: read, construction (dtype optimization and profiling), every scripted turn, export"""
+    import agent as agent_module
+    import plotting
+    encode = {}
+    plotting.render_figure = timed(plotting.render_figure, encode, "plot_encode")
+    plotting.make_thumbnail = timed(plotting.make_thumbnail, encode, "thumbnail_encode")
+    script = load_script("agent")
+    agent_module.init_chat_model = lambda *args, **kwargs: ScriptedChatModel(script=script)
+
+    report = {"file_bytes": os.path.getsize(path)}
+    start = time.perf_counter()
+    df = pd.read_csv(path)
+    report["read_s"] = time.perf_counter() - start
+    start = time.perf_counter()
+    bot = agent_module.AgentReAct(df=df)
+    report["init_s"] = time.perf_counter() - start
+    del df
+
+    timer = ToolTimer()
+    for tool in bot.tools:
+        tool.callbacks = [timer]
+    turns, plot_bytes = [], 0
+    for turn in script:
+        start = time.perf_counter()
+        response = bot.get_response(turn["question"])
+        turns.append(time.perf_counter() - start)
+        plot_bytes += sum(len(plot) for plot in response["plots"])
+    report["turn_s"] = turns
+    report["tools"] = timer.summary()
+    report.update(encode)
+    report["plot_bytes"] = plot_bytes
+    for file_format in ["parquet", "csv"]:
+        start = time.perf_counter()
+        report[f"export_{file_format}_bytes"] = len(bot.export(file_format))
+        report[f"export_{file_format}_s"] = time.perf_counter() - start
+    report["peak_rss_mb"] = self_peak_rss_mb()
+    return report
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(port: int) -> subprocess.Popen:
+    env = {**os.environ, "EDA_PORT": str(port), "EDA_HOST": "127.0.0.1"}
+    server = subprocess.Popen([sys.executable, "server.py"], cwd=SRC_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"server exited with {server.returncode}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return server
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError("server did not start")
+
+
+def resource_kind(uri: str) -> str:
+    """Groups uris of templated resources: resource://plots/ab12 -> resource://plots/{id}"""
+    parts = uri.split("/")
+    if len(parts) > 3:
+        return "/".join(parts[:3]) + "/{" + ("range" if parts[2] == "csv_file" else "id") + "}"
+    return uri
+
+
+async def drive_server(path: str, port: int) -> dict:
+    """One browser session of the client app against the server: chunked upload, every scripted turn, plot and dataframe sync"""
+    import client_app
+    script = load_script("server")
+    client_app.connection["url"] = f"http://127.0.0.1:{port}/mcp"
+    client_app.model = ScriptedChatModel(script=script)
+    client_app.warm_up() # what the app does at launch, before any browser session connects
+
+    fetches = defaultdict(lambda: {"reads": 0, "seconds": 0.0, "bytes": 0})
+    read_resource = client_app.read_resource
+
+    async def timed_read(user, uri):
+        start = time.perf_counter()
+        content = await read_resource(user, uri)
+        fetch = fetches[resource_kind(uri)]
+        fetch["reads"] += 1
+        fetch["seconds"] += time.perf_counter() - start
+        fetch["bytes"] += len(content.encode()) if content else 0
+        return content
+    client_app.read_resource = timed_read # the client's helpers look it up at call time
+
+    report = {"file_bytes": os.path.getsize(path)}
+    start = time.perf_counter()
+    user = await client_app.setup_mcp(client_app.UserSession())
+    report["connect_s"] = time.perf_counter() - start
+    timer = ToolTimer()
+    for tool in user.agent.nodes["tools"].bound.tools_by_name.values():
+        tool.callbacks = [timer]
+
+    start = time.perf_counter()
+    await client_app.handle_csv_upload(SimpleNamespace(name=path), user)
+    report["upload_s"] = time.perf_counter() - start
+    report["upload_fetches"] = {uri: dict(fetch) for uri, fetch in fetches.items()}
+    fetches.clear()
+
+    turns = []
+    for turn in script:
+        start = time.perf_counter()
+        async for _ in client_app.stream_chat_with_mcp(user, turn["question"]):
+            pass
+        turns.append(time.perf_counter() - start)
+    report["turn_s"] = turns
+    report["tools"] = timer.summary()
+    start = time.perf_counter()
+    await client_app.get_csv_from_mcp(user)
+    report["download_csv_s"] = time.perf_counter() - start
+    report["resources"] = {uri: dict(fetch) for uri, fetch in fetches.items()}
+    await user.close()
+    return report
+
+
+def run_server(path: str) -> dict:
+    port = free_port()
+    server = start_server(port)
+    try:
+        report = asyncio.run(drive_server(path, port))
+        report["server_peak_rss_mb"], report["worker_peak_rss_mb"] = process_peak_rss_mb(server.pid)
+        report["client_peak_rss_mb"] = self_peak_rss_mb()
+    finally:
+        server.terminate()
+        server.wait(10)
+    return report
+
+
+# ========== REPORT ==========
+def flatten(report: dict, prefix: str = "") -> dict:
+    """Scalar metrics keyed by path; per-turn lists are summed"""
+    metrics = {}
+    for key, value in report.items():
+        if isinstance(value, dict):
+            metrics.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, list):
+            metrics[f"{prefix}{key}"] = sum(value)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            metrics[f"{prefix}{key}"] = value
+    return metrics
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """Metrics that grew more than threshold over the baseline (every metric is lower-is-better)"""
+    regressions = []
+    for run, report in results.items():
+        base, metrics = flatten(baseline.get(run, {})), flatten(report)
+        for name, value in metrics.items():
+            if name not in base or name.endswith(("calls", "reads")):
+                continue
+            reads = name.rsplit(".", 1)[0] + ".reads"
+            if reads in base and base[reads] != metrics.get(reads):
+                continue # resources read a different number of times (plot notifications race the reads) aren't comparable
+            before = base[name]
+            noise = NOISE_SECONDS if name.endswith(("_s", "seconds")) else 0
+            if value > before * (1 + threshold) and value - before > noise:
+                regressions.append(f"{run} {name}: {before:.4g} -> {value:.4g} (+{(value / before - 1) * 100 if before else float('inf'):.0f}%)")
+    return regressions
+
+
+def print_report(results: dict):
+    for run, report in results.items():
+        print(f"\n== {run}")
+        for name, value in flatten(report).items():
+            print(f"  {name:<55} {value:>14.4f}" if isinstance(value, float) else f"  {name:<55} {value:>14}")
+
+
+def run_one(target: str, rows: int, data_dir: str) -> dict:
+    """Runs one target on one size in a fresh interpreter, so peak RSS covers only that run"""
+    path = dataset_path(data_dir, rows)
+    process = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--run", target, "--data", path],
+        capture_output=True, text=True
+    )
+    if process.returncode != 0:
+        raise RuntimeError(f"{target} on {rows} rows failed:\n{process.stderr[-4000:]}")
+    report = json.loads(process.stdout.strip().splitlines()[-1])
+    report["rows"] = rows
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmarks with a scripted chat model")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="dataset sizes in rows")
+    parser.add_argument("--targets", nargs="+", choices=TARGETS, default=TARGETS)
+    parser.add_argument("--data-dir", default=os.path.join(BENCH_DIR, "data"), help="where the synthetic csv files are cached")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="relative growth reported as a regression")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    parser.add_argument("--output", help="also write the results as json to this file")
+    parser.add_argument("--run", choices=TARGETS, help=argparse.SUPPRESS) # a single run in this subprocess
+    parser.add_argument("--data", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        report = run_agent(args.data) if args.run == "agent" else run_server(args.data)
+        print(json.dumps(report))
+        return
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    results = {}
+    for rows in args.sizes:
+        for target in args.targets:
+            print(f"running {target} on {rows} rows", file=sys.stderr)
+            results[f"{target}/{rows}"] = run_one(target, rows, args.data_dir)
+    print_report(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        with open(args.baseline, "w") as f:
+            json.dump({**baseline, **results}, f, indent=2)
+        print(f"\nbaseline saved to {args.baseline}")
+        return
+    if not os.path.exists(args.baseline):
+        print("\nno baseline to compare with (run with --save-baseline)")
+        return
+    with open(args.baseline) as f:
+        regressions = compare(results, json.load(f), args.threshold)
+    print("\nregressions against the baseline:" if regressions else "\nno regressions against the baseline")
+    for line in regressions:
+        print("  " + line)
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
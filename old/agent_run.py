@@ -15,6 +15,6 @@ while True:
     response = bot.get_response(user_input)
     print(f"agent: {response['text']}")
     print(f"plots: {len(response['plots'])}")
-    # save dataframe locally
-    new_df = response['df']
-    new_df.to_csv('new-df.csv', index=False)
\ No newline at end of file
+    # save dataframe locally (only when the turn changed it)
+    if response['df_changed']:
+        response['df'].export('csv', 'new-df.csv')
\ No newline at end of file
@@ -1,39 +1,89 @@
-from langchain.chat_models import init_chat_model
 from prompts import system_prompt_template
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
-from langchain_experimental.tools import PythonAstREPLTool
-from langchain.agents import Tool
-import numpy as np
-import pandas as pd
-from utils import base64encoding, csv_encoding
+from langchain_core.tools import Tool
+import base64
+import threading
+from execution import ExecutionNamespace, execute
+from profiling import DatasetProfile
+from optimize import OPTIMIZE, optimize_frame
+from utils import encode_table
+from history import HistoryManager
+from outputs import OutputStore
+from metrics import metrics, current_trace, new_trace_id
+from vectorize import notes
 from dotenv import load_dotenv
-from langgraph.prebuilt import create_react_agent
+
+
+def init_chat_model(*args, **kwargs):
+    """langchain's init_chat_model, imported on first use (langchain.chat_models takes about a second to import)"""
+    from langchain.chat_models import init_chat_model
+    return init_chat_model(*args, **kwargs)
+
+
+class DataFrameHandle():
+    """
+    Lazy reference to the dataframe as of one version. Nothing is serialized until export() is called,
+    and later modifications don't change it (generated code works on a copy-on-write copy, copy-on-write being
+    turned on by execution where pandas doesn't default to it).
+    """
+    def __init__(self, df, version: int):
+        self.df = df
+        self.version = version
+
+    @property
+    def shape(self):
+        return self.df.shape
+
+    @property
+    def columns(self):
+        return self.df.columns
+
+    def to_pandas(self):
+        return self.df
+
+    def export(self, file_format: str = "csv", path: str = None, compression: str = None) -> bytes:
+        """Encodes the dataframe as csv, parquet or arrow bytes, also writing them to path when given"""
+        data = encode_table(self.df, file_format, compression)
+        if path is not None:
+            with open(path, "wb") as f:
+                f.write(data)
+        return data
 
 
 class AgentReAct():
     def __init__(self, df):
         load_dotenv()
-        self.model = init_chat_model("gpt-4o-mini", model_provider="openai")
+        # the model client is created in the background while the dataframe is optimized and profiled
+        self.model = self.agent_executor = self.build_error = None
+        self.ready = threading.Thread(target=self.__build_model, daemon=True)
+        self.ready.start()
         self.df = df
-        self.messages = [SystemMessage(content=system_prompt_template.invoke({
-            "columns":str(self.df.columns.tolist()).replace('[', '').replace(']', '').replace("'", '')
-        }).text)] # init messages
+        self.optimization = None # memory before/after shrinking the dtypes and the converted columns
+        if OPTIMIZE:
+            self.df, self.optimization = optimize_frame(df)
+        self.profile = DatasetProfile(self.df) # profiled once here, then only changed columns are re-profiled
+        self.version = 0 # bumped only when a modification actually changed the dataframe
+        self.messages = [self.__system_message()] # init messages
+        self.history = HistoryManager() # keeps the messages sent each turn within a token budget
         
         self.plots = []
+        self.namespace = ExecutionNamespace() # kept across tool calls so intermediates can be reused
+        self.outputs = OutputStore() # full text of outputs too long to return to the model inline
+        self.lock = threading.Lock() # the agent may run tool calls in parallel threads, the namespace and pyplot are shared
 
         # define tools for agent to use
         self.tools = [
             Tool(
                 name="CodeExecutionPlotting", 
-                func=self.__execute_code_plotting, 
+                func=metrics.traced("tool", self.__execute_code_plotting, tool="CodeExecutionPlotting"), 
                 description=(
                     "Tool for executing code involving plotting. It expects code generated from the CodeGeneration tool. " 
-                    "Returns a base64 encoded image representing the plot"
+                    "Every open matplotlib figure is captured as the plot"
                 ), 
             ), 
             Tool(
                 name="CodeExecutionModification", 
-                func=self.__execute_code_modifying, 
+                func=metrics.traced("tool", self.__execute_code_modifying, tool="CodeExecutionModification"), 
                 description=(
                    "Tool for executing code involving dataframe 'df' modification. "
                     "Returns a base64 encoded file representing a new csv file and internally modifies the dataframe"
@@ -41,50 +91,131 @@ class AgentReAct():
             ), 
             Tool(
                 name="CodeExecutionGenInfo", 
-                func=self.__execute_code_geninfo, 
+                func=metrics.traced("tool", self.__execute_code_geninfo, tool="CodeExecutionGenInfo"), 
                 description=(
                     "Tool for executing code that involves asking a question about the dataframe (e.g. who is the oldest person or what is the standard deviation of column x). It expects code generated from the CodeGeneration tool. "
                     "Returns a string representing the output"
                 ), 
+            ),
+            Tool(
+                name="ReadOutput", 
+                func=metrics.traced("tool", self.__read_output, tool="ReadOutput"), 
+                description=(
+                    "Tool for reading a long CodeExecutionGenInfo output that was truncated. "
+                    "Expects the output id and optionally the page number separated by a space (e.g. '3f2a9c 1'). "
+                    "Prefer printing a more specific summary over reading many pages"
+                ), 
             )
         ]
 
-        # define the agent_executor
-        self.agent_executor = create_react_agent(self.model, self.tools)
+
+    def __build_model(self):
+        try:
+            with metrics.span("startup", phase="model"):
+                import langgraph.prebuilt # imported here too, off the first question's path
+                self.model = init_chat_model("gpt-4o-mini", model_provider="openai")
+        except Exception as e:
+            self.build_error = e
     
+    def __system_message(self):
+        return SystemMessage(content=system_prompt_template.invoke({
+            "columns":str(self.df.columns.tolist()).replace('[', '').replace(']', '').replace("'", ''),
+            "profile": self.profile.summary()
+        }).text)
+
     # tool_1
     def __execute_code_plotting(self, code: str):
-        self.plots = []
-        code_execution_tool = PythonAstREPLTool(locals={"df": self.df, "pd": pd, "np": np})
-        code_execution_tool.invoke(code) # execute the code
-        self.plots.append(base64encoding(code_execution_tool.locals['plt_figure'])) # add the plot
-        return "generated plot successfully"
+        with self.lock:
+            result = execute(self.namespace, "plotting", code, self.df) # execute the code
+        for span, seconds in result.pop("timings").items():
+            metrics.record_span(span, seconds, kind="plotting")
+        self.plots.extend(base64.b64encode(plot["data"]).decode() for plot in result["plots"]) # add the plots
+        return f"generated {len(result['plots'])} plots successfully" + notes(result.get("vectorize", {})) # plots accumulate over the turn
 
     # tool_3
     def __execute_code_modifying(self, code: str):
-        code_execution_tool = PythonAstREPLTool(locals={"df": self.df, "pd": pd, "np": np})
-        code_execution_tool.invoke(code) # execute the code
-        self.df = code_execution_tool.locals['df'] 
-        return "modified df successfully" # get the new encoded df
+        with self.lock:
+            # a shallow copy is copy-on-write (execution turns it on for pandas 2), so in-place edits, even ones
+            # made before the code raised, never reach the previous version or the handles returned for it
+            previous = self.df
+            with metrics.span("code", kind="modifying"):
+                _, self.df = self.namespace.run(code, self.df.copy(deep=False)) # execute the code
+            vectorized = self.namespace.vectorized
+            with metrics.span("profile"):
+                changed = self.profile.update(self.df)
+            if changed or not self.df.index.equals(previous.index):
+                self.version += 1
+            if OPTIMIZE and changed: # shrink the dtypes of the columns the code changed
+                with metrics.span("optimize"):
+                    self.df, report = optimize_frame(self.df, changed)
+                if report["converted"]:
+                    self.profile.update(self.df)
+                    self.optimization = {**report, "converted": {**self.optimization["converted"], **report["converted"]}}
+        # report the refreshed profile of the changed columns so the agent doesn't have to inspect them
+        return "modified df successfully\n" + "\n".join(
+            self.profile.column_summary(name) if name in self.profile.columns else f"- {name}: dropped" for name in changed
+        ) + notes(vectorized)
     
     # tool_4
     def __execute_code_geninfo(self, code: str) -> str:
-        code_execution_tool = PythonAstREPLTool(locals={"df": self.df, "pd": pd, "np": np})
-        output = code_execution_tool.invoke(code) # execute the code
-        return output # get output (usually in a print statemnet)     
+        with self.lock, metrics.span("code", kind="geninfo"):
+            output, _ = self.namespace.run(code, self.df) # execute the code
+            vectorized = self.namespace.vectorized
+        # long outputs come back as a head/tail preview, the full text is kept to read page by page
+        result = self.outputs.govern(output)
+        if not result.get("truncated"):
+            return result["output"] + notes(vectorized) # get output (usually in a print statemnet)
+        shape = f", table shape {result['table_shape']}" if "table_shape" in result else ""
+        return (f"{result['output']}\n[output truncated: {result['chars']} characters, {result['lines']} lines{shape}. "
+                f"Print a summary instead, or read it with ReadOutput '{result['output_id']} <page>' for pages 0 to {result['pages'] - 1}]"
+                + notes(vectorized))
+
+    def __read_output(self, query: str) -> str:
+        output_id, _, page = query.strip().partition(" ")
+        try:
+            return self.read_output(output_id, int(page or 0))["text"]
+        except (KeyError, ValueError) as e:
+            return str(e)
 
     def get_response(self, prompt):
+        if self.agent_executor is None:
+            self.ready.join()
+            if self.build_error is not None:
+                raise self.build_error
+            from langgraph.prebuilt import create_react_agent
+            self.agent_executor = create_react_agent(self.model, self.tools)
+        self.messages[0] = self.__system_message() # the profile may have changed in the last turn
         self.messages.append(HumanMessage(content=prompt))
+        self.messages = self.history.compact(self.messages)
         self.plots = []
-        # invoke the agent executor
-        response = self.agent_executor.invoke({"messages": self.messages})
+        version = self.version
+        # every span recorded during the turn (tools, code, plot rendering) carries the turn's trace id
+        trace_id = new_trace_id()
+        token = current_trace.set(trace_id)
+        try:
+            # invoke the agent executor
+            response = self.agent_executor.invoke({"messages": self.messages}, {"metadata": {"trace_id": trace_id}})
+        finally:
+            current_trace.reset(token)
 
         # update the messages list
         self.messages = response['messages']
 
         # return output
+        # the dataframe is handed back lazily, call export() on it to serialize
         return {
             "text": self.messages[-1].content, 
             "plots": self.plots, 
-            "df": self.df.to_csv(index=False)
-        }
\ No newline at end of file
+            "df": DataFrameHandle(self.df, self.version),
+            "df_version": self.version,
+            "df_changed": self.version != version,
+            "trace_id": trace_id
+        }
+
+    def read_output(self, output_id: str, page: int = 0) -> dict:
+        """One page of a truncated tool output: {"output_id", "page", "pages", "text"}"""
+        return self.outputs.page(output_id, page)
+
+    def export(self, file_format: str = "csv", path: str = None, compression: str = None) -> bytes:
+        """Encodes the current dataframe as csv, parquet or arrow bytes (optionally written to path)"""
+        return DataFrameHandle(self.df, self.version).export(file_format, path, compression)
\ No newline at end of file
@@ -0,0 +1,149 @@
+import os
+import ast
+import time
+import uuid
+import hashlib
+import builtins
+import threading
+from collections import OrderedDict
+
+CACHE_ENTRIES = int(os.environ.get("EDA_CACHE_ENTRIES", 256))
+CACHE_TTL = int(os.environ.get("EDA_CACHE_TTL", 60 * 60)) # seconds
+
+# names code may read and still be cached (everything else could come from the warm namespace)
+SAFE_NAMES = {"df", "df_sample", "pd", "np", "bin2d", "lttb", "stratified_sample"} | set(dir(builtins))
+# calls whose result changes between runs
+NONDETERMINISTIC = {"random", "rand", "randn", "randint", "sample", "shuffle", "choice", "permutation", "now", "today", "time", "uuid4"}
+
+
+def normalize_code(code: str) -> str:
+    """AST dump of the code, so whitespace and comment differences map to the same key"""
+    return ast.dump(ast.parse(code))
+
+
+def is_deterministic(tree: ast.AST) -> bool:
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Attribute) and node.attr in NONDETERMINISTIC:
+            return False
+        if isinstance(node, ast.Name) and node.id in NONDETERMINISTIC:
+            return False
+    return True
+
+
+def bound_names(node: ast.AST) -> set:
+    """Names a piece of code binds: assignment targets, loop/comprehension variables, arguments, imports and definitions"""
+    names = set()
+    for child in ast.walk(node):
+        if isinstance(child, ast.Name) and isinstance(child.ctx, (ast.Store, ast.Del)):
+            names.add(child.id)
+        elif isinstance(child, ast.arg):
+            names.add(child.arg)
+        elif isinstance(child, (ast.Import, ast.ImportFrom)):
+            names |= {(alias.asname or alias.name).split(".")[0] for alias in child.names}
+        elif isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            names.add(child.name)
+    return names
+
+
+def reads_only_df(tree: ast.Module) -> bool:
+    """
+    True when every name the code reads is df/pd/np, a builtin or something the code bound itself before,
+    i.e. nothing comes from variables left over from earlier calls.
+    """
+    bound = set(SAFE_NAMES)
+    for statement in tree.body:
+        own = bound_names(statement)
+        if isinstance(statement, (ast.Assign, ast.AugAssign, ast.AnnAssign)):
+            # the value is evaluated before the targets are bound (x = x + 1 reads an earlier x)
+            inner = bound | bound_names(statement.value) if statement.value is not None else bound
+        else:
+            inner = bound | own
+        loads = {node.id for node in ast.walk(statement) if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load)}
+        if not loads <= inner:
+            return False
+        bound |= own
+    return True
+
+
+def is_cacheable(code: str) -> bool:
+    """
+    Code can be served from the cache when its output only depends on df: it is deterministic,
+    reads no variables left over from earlier calls and binds no names later calls could rely on
+    (imports are fine, they are replayed on a hit).
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return False
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.Assign, ast.AugAssign, ast.AnnAssign, ast.For, ast.AsyncFor, ast.With, ast.AsyncWith,
+                             ast.NamedExpr, ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Global, ast.Nonlocal)):
+            return False
+    return reads_only_df(tree) and is_deterministic(tree)
+
+
+def import_statements(code: str) -> str:
+    """Just the top level imports of a piece of code"""
+    tree = ast.parse(code)
+    return ast.unparse(ast.Module([node for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))], type_ignores=[]))
+
+
+def content_version(data: bytes) -> str:
+    """Version of freshly uploaded data: identical uploads share a version (and so cached results)"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def next_version(version: str, code: str) -> str:
+    """
+    Version after a modification. Deterministic edits of the same data give the same version, as long as they
+    read nothing but df: code reading namespace variables (df = df[df['a'] > thr]) gets a fresh version,
+    since another session with a different thr would otherwise end up sharing its cached results
+    """
+    try:
+        tree = ast.parse(code)
+        if is_deterministic(tree) and reads_only_df(tree):
+            return hashlib.sha256(f"{version}\n{normalize_code(code)}".encode()).hexdigest()
+    except SyntaxError:
+        pass
+    return uuid.uuid4().hex
+
+
+class ResultCache():
+    """Bounded LRU cache whose entries also expire after a TTL. Counts hits and misses"""
+    def __init__(self, max_entries: int = CACHE_ENTRIES, ttl: int = CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict() # key -> (expires_at, value), least recently used first
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """Returns the cached value or None"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self.entries.pop(key, None)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
@@ -1,155 +1,414 @@
 import gradio as gr
-import pandas as pd
+import asyncio
 import json
 import base64
+import hashlib
+import os
+import time
+import tempfile
+import threading
 from io import BytesIO
-from PIL import Image
-from langchain_mcp_adapters.client import MultiServerMCPClient
-from langgraph.prebuilt import create_react_agent
-from langchain.chat_models import init_chat_model
-from langchain_core.messages import HumanMessage, SystemMessage
-from utils import csv_encoding
+from contextlib import AsyncExitStack
+# the MCP client, langgraph, the model client and PIL are imported on first use (or by warm_up at startup)
+from langchain_core.messages import HumanMessage, SystemMessage, AIMessage, AIMessageChunk, ToolMessage
+from utils import read_table, table_format
+from optimize import OPTIMIZE, optimize_frame
+from delta import apply_delta
+from history import HistoryManager
+from metrics import new_trace_id
 from prompts import system_prompt_template
 from dotenv import load_dotenv
 load_dotenv()
 
-# ========== GLOBAL VARIABLES ==========
-client = None
-tools = None
-csv_upload_tool = None
-agent = None
-messages = []
-df_memory = None
+# ========== CONFIGURATION ==========
+MCP_URL = os.environ.get("EDA_MCP_URL", "http://localhost:8001/mcp")
+CONCURRENCY = int(os.environ.get("EDA_CLIENT_CONCURRENCY", 8)) # events Gradio runs at once per handler
+QUEUE_SIZE = int(os.environ.get("EDA_CLIENT_QUEUE_SIZE", 64)) # events waiting beyond that, further requests are turned away
+AGENT_CONCURRENCY = int(os.environ.get("EDA_AGENT_CONCURRENCY", 4)) # agent runs (model calls) in flight across all users
+USER_SESSION_TTL = int(os.environ.get("EDA_USER_SESSION_TTL", 4 * 60 * 60)) # seconds before an idle browser session is closed
+
+APP_TOOL_NAMES = {"upload_csv", "upload_data", "begin_upload", "append_chunk", "upload_status", "commit_upload", "export_data", "start_turn"}
+UPLOAD_RETRIES = 3
+PREVIEW_ROWS = 1000 # rows kept on the client for out-of-core datasets
+
+# ========== SHARED STATE ==========
+# the connection settings and the model client are shared by every user; each user gets its own MCP session
+connection = {
+    "transport": "streamable_http",
+    "url": MCP_URL
+}
+model = None
+model_lock = threading.Lock()
+agent_slots = None # semaphore bounding concurrent agent runs, created on the running event loop
+history_manager = HistoryManager() # keeps the messages sent each turn within a token budget
+
+
+class UserSession():
+    """Everything that belongs to one browser session: its MCP session (and so its server-side data), agent and conversation"""
+    def __init__(self):
+        self.session = None # persistent MCP session (the server keeps the dataframe per session)
+        self.owner = None # task that opened the MCP session and closes it
+        self.closing = None # set to make the owner close the session
+        self.loop = None
+        self.app_tools = {} # tools called by the app directly (not given to the agent)
+        self.agent = None
+        self.messages = []
+        self.trace_id = None # trace id of the current turn
+        self.df_memory = None
+        self.df_version = None # server data version df_memory corresponds to
+        self.resource_versions = {} # uri -> version of the copy we last read
+        self.updated_uris = set() # uris the server notified as changed since we last read them
+        self.plots_memory = []
+        self.plots_list = [] # ids, formats and thumbnails of the current turn's plots
+        self.plot_images = {} # plot id -> decoded image. Ids are content hashes so a plot is only ever downloaded once
+        self.csv_file_memory = None
+        self.download_dir = tempfile.mkdtemp(prefix="eda-client-")
+
+    async def handle_server_message(self, message):
+        """Records resource-updated notifications pushed by the server."""
+        from mcp import types as mcp_types
+        if isinstance(message, mcp_types.ServerNotification) and isinstance(message.root, mcp_types.ResourceUpdatedNotification):
+            self.updated_uris.add(str(message.root.params.uri))
+
+    async def open(self):
+        """
+        Opens the MCP session in a task of its own that keeps it until close(). The streamable HTTP client's
+        cancel scopes have to be exited by the task that entered them, and every Gradio event (and the
+        delete callback) runs in a different task.
+        """
+        self.loop = asyncio.get_running_loop()
+        self.closing = asyncio.Event()
+        opened = self.loop.create_future()
+        self.owner = self.loop.create_task(self.own_session(opened))
+        self.session = await opened
+
+    async def own_session(self, opened):
+        from langchain_mcp_adapters.sessions import create_session
+        try:
+            async with AsyncExitStack() as stack:
+                session = await stack.enter_async_context(
+                    create_session({**connection, "session_kwargs": {"message_handler": self.handle_server_message}})
+                )
+                await session.initialize()
+                opened.set_result(session)
+                await self.closing.wait()
+        except Exception as e:
+            if opened.done():
+                print(f"❌ Closing MCP session failed: {e}")
+            else:
+                opened.set_exception(e)
+        finally:
+            if not opened.done(): # cancelled while connecting
+                opened.cancel()
+
+    def request_close(self):
+        """Asks the owner task to close the MCP session. Safe to call from any thread"""
+        if self.owner is None:
+            return
+        try:
+            self.loop.call_soon_threadsafe(self.closing.set)
+        except RuntimeError: # the event loop is already closed
+            pass
+
+    async def close(self):
+        if self.owner is None:
+            return
+        self.closing.set()
+        await self.owner
+
+
+def close_user_session(user):
+    """gr.State delete callback: closes the MCP session of a browser session that went away."""
+    if user is not None:
+        user.request_close()
+
+# ========== RESOURCES ==========
+async def read_resource(user, uri):
+    """Reads a single resource by uri (instead of downloading every resource)."""
+    from langchain_mcp_adapters.resources import load_mcp_resources
+    blobs = await load_mcp_resources(user.session, uris=[uri])
+    return blobs[0].as_string() if blobs else None
+
+async def read_if_changed(user, uri):
+    """Returns the resource content if it changed since the last read, otherwise None."""
+    versions = json.loads(await read_resource(user, "resource://versions"))
+    if uri not in user.updated_uris and uri in user.resource_versions and versions.get(uri) == user.resource_versions[uri]:
+        return None
+    content = await read_resource(user, uri)
+    user.resource_versions[uri] = versions.get(uri)
+    user.updated_uris.discard(uri)
+    return content
 
 # ========== ASYNC INITIALIZATION ==========
-async def setup_mcp():
-    """Initialize the MCP client, tools, and agent once."""
-    global client, tools, csv_upload_tool, agent
-    # connect to MCP server
-    client = MultiServerMCPClient({
-        "EDA Agent": {
-            "transport": "streamable_http",
-            "url": "http://localhost:8001/mcp"
-        },
-    })
-    tools = await client.get_tools()
-    csv_upload_tool = tools[0]
-    # load model
-    model = init_chat_model("gpt-4o-mini", model_provider="openai")
+def get_model():
+    """The model client shared by every user, created on first use."""
+    global model
+    with model_lock: # warm_up and the first user may get here at once
+        if model is None:
+            from langchain.chat_models import init_chat_model
+            model = init_chat_model("gpt-4o-mini", model_provider="openai")
+    return model
+
+def warm_up():
+    """Imports the MCP client and agent libraries and creates the model client while the UI starts, off the first user's path."""
+    start = time.perf_counter()
+    import langchain_mcp_adapters.sessions, langchain_mcp_adapters.tools, langchain_mcp_adapters.resources
+    import langgraph.prebuilt
+    import PIL.Image
+    get_model()
+    print(f"✅ Agent libraries and model client ready in {time.perf_counter() - start:.1f}s.")
+
+async def setup_mcp(user=None):
+    """Open the MCP session, tools, and agent of one user (the model client is created once and shared)."""
+    global agent_slots
+    from langchain_mcp_adapters.tools import load_mcp_tools
+    from langgraph.prebuilt import create_react_agent
+    await asyncio.to_thread(get_model) # not blocking the event loop while it imports
+    if agent_slots is None:
+        agent_slots = asyncio.Semaphore(AGENT_CONCURRENCY)
+    user = user or UserSession()
+    if user.session is not None:
+        return user
+    # keep one session open per user so their tool calls and resource reads hit the same server-side data
+    await user.open()
+    tools = await load_mcp_tools(user.session)
+    # upload tools are called by the app directly, the rest are given to the agent
+    user.app_tools = {tool.name: tool for tool in tools if tool.name in APP_TOOL_NAMES}
+    agent_tools = [tool for tool in tools if tool.name not in APP_TOOL_NAMES]
     # create agent
-    agent = create_react_agent(model, tools[1:])
+    user.agent = create_react_agent(get_model(), agent_tools)
     print("✅ MCP setup complete.")
-    return True
+    return user
+
+def system_message(profile):
+    """System prompt with the column names and the server's precomputed dataset profile."""
+    return SystemMessage(content=system_prompt_template.invoke({
+        "columns": ", ".join(map(str, profile["columns"])),
+        "profile": profile["summary"]
+    }).text)
 
 # ========== CSV UPLOAD ==========
-async def handle_csv_upload(file):
+async def call_app_tool(user, name, args):
+    """Calls one of the app tools and returns its parsed json result."""
+    result = await user.app_tools[name].ainvoke(args)
+    if isinstance(result, list): # content blocks
+        result = result[0]["text"] if isinstance(result[0], dict) else result[0]
+    result = json.loads(result) if isinstance(result, str) else result
+    if "Error" in result:
+        raise RuntimeError(result["Error"])
+    return result
+
+async def upload_file_chunked(user, path):
+    """Streams the raw file to MCP in checksummed chunks, resuming from the server's offset after a failure."""
+    file_format = table_format(path)
+    total_size = os.path.getsize(path)
+    upload = await call_app_tool(user, "begin_upload", {"file_format": file_format, "total_size": total_size})
+    upload_id, chunk_size = upload["upload_id"], upload["chunk_size"]
+    offset = 0
+    with open(path, "rb") as f:
+        while offset < total_size:
+            f.seek(offset)
+            chunk = f.read(chunk_size)
+            for attempt in range(UPLOAD_RETRIES):
+                try:
+                    offset = (await call_app_tool(user, "append_chunk", {
+                        "upload_id": upload_id,
+                        "offset": offset,
+                        "data": base64.b64encode(chunk).decode(),
+                        "checksum": hashlib.sha256(chunk).hexdigest()
+                    }))["offset"]
+                    break
+                except Exception:
+                    if attempt == UPLOAD_RETRIES - 1:
+                        raise
+                    # resume from wherever the server got to
+                    offset = (await call_app_tool(user, "upload_status", {"upload_id": upload_id}))["offset"]
+                    f.seek(offset)
+                    chunk = f.read(chunk_size)
+    return await call_app_tool(user, "commit_upload", {"upload_id": upload_id})
+
+async def handle_csv_upload(file, user):
     """Upload CSV to MCP and store DataFrame in memory."""
-    global df_memory, csv_upload_tool, messages
     if file is None:
-        return "❌ No file uploaded."
-    df_memory = pd.read_csv(file.name)
-    base64_df = csv_encoding(df_memory)
-    # upload to MCP
-    result = await csv_upload_tool.ainvoke({"base64_csv": base64_df})
-    # Initialize system prompt
-    sys_msg = SystemMessage(content=system_prompt_template.invoke({
-        "columns": str(df_memory.columns.tolist()).replace('[', '').replace(']', '').replace("'", '')
-    }).text)
-    messages = [sys_msg]
-    preview = df_memory.head().to_markdown()
-    return f"✅ CSV uploaded successfully to MCP.\n\n{result}\n\n**Preview:**\n{preview}"
+        return "❌ No file uploaded.", user
+    user = await setup_mcp(user) # connects on first use
+    # upload the raw file bytes in chunks (no re-serialization on the client)
+    result = await upload_file_chunked(user, file.name)
+    if result.get("out_of_core"):
+        # too big to hold in memory: the server streams it from disk, keep just the first rows here
+        user.df_memory = read_table(base64.b64decode(await read_resource(user, f"resource://csv_file/0/{PREVIEW_ROWS}")), "csv")
+    else:
+        user.df_memory = read_table(file.name, table_format(file.name))
+        if OPTIMIZE:
+            user.df_memory, _ = optimize_frame(user.df_memory)
+    user.df_version = None if result.get("out_of_core") else json.loads(await read_resource(user, "resource://versions"))["resource://csv_file"]
+    # Initialize system prompt from the profile the server computed at upload
+    user.messages = [system_message(json.loads(await read_resource(user, "resource://profile")))]
+    preview = user.df_memory.head().to_markdown()
+    return f"✅ CSV uploaded successfully to MCP.\n\n{result}\n\n**Preview:**\n{preview}", user
+
+async def sync_df_memory(user):
+    """Brings df_memory up to date after modifications by applying the server's deltas (only changed blocks travel)."""
+    if user.df_version is None:
+        return user.df_memory
+    version = json.loads(await read_resource(user, "resource://versions"))["resource://csv_file"]
+    if version == user.df_version:
+        return user.df_memory
+    result = json.loads(await read_resource(user, f"resource://delta/{user.df_version}"))
+    if result.get("full"): # too far behind, download the whole dataframe
+        export = await call_app_tool(user, "export_data", {"file_format": "parquet"})
+        user.df_memory, user.df_version = read_table(base64.b64decode(export["data"]), "parquet"), export["version"]
+        return user.df_memory
+    for delta in result["deltas"]:
+        user.df_memory = apply_delta(user.df_memory, delta)
+    user.df_version = result["version"]
+    return user.df_memory
 
 # ========== PLOT RETRIEVAL ==========
-async def get_plots_from_mcp():
-    """Retrieve plots from MCP resources and decode them."""
-    global client
+def decode_plot(plot):
+    """Turns a plot resource into something the gallery can show (svg is written to a file)."""
+    from PIL import Image
+    img_data = base64.b64decode(plot["data"])
+    if plot["format"] == "svg":
+        path = os.path.join(tempfile.gettempdir(), f"plot-{plot['id']}.svg")
+        with open(path, "wb") as f:
+            f.write(img_data)
+        return path
+    return Image.open(BytesIO(img_data))
+
+async def get_plots_from_mcp(user, thumbnails_only=False):
+    """Retrieve plots from MCP resources and decode them (only when they changed).
+    With thumbnails_only, plots not downloaded yet are shown by the thumbnails listed in resource://plots."""
+    from PIL import Image
     try:
-        resources = await client.get_resources(server_name="EDA Agent")
-        if len(resources) > 1:
-            plots_data = resources[1].data
-            plots_json = json.loads(plots_data)
-            plots_list = plots_json.get("plots", [])
-            
-            if plots_list:
-                # Decode base64 images
-                images = []
-                for plot_b64 in plots_list:
-                    img_data = base64.b64decode(plot_b64)
-                    img = Image.open(BytesIO(img_data))
-                    images.append(img)
-                return images
-        return []
+        plots_data = await read_if_changed(user, "resource://plots")
+        if plots_data is not None:
+            user.plots_list = json.loads(plots_data).get("plots", [])
+        # Fetch and decode only the images we have not seen before
+        images = []
+        for plot in user.plots_list:
+            if plot["id"] in user.plot_images:
+                images.append(user.plot_images[plot["id"]])
+            elif thumbnails_only:
+                images.append(Image.open(BytesIO(base64.b64decode(plot["thumbnail"]))))
+            else:
+                user.plot_images[plot["id"]] = decode_plot(json.loads(await read_resource(user, f"resource://plots/{plot['id']}")))
+                images.append(user.plot_images[plot["id"]])
+        user.plots_memory = images
+        return user.plots_memory
     except Exception as e:
         print(f"Error retrieving plots: {e}")
         return []
 
-async def get_csv_from_mcp():
-    """Retrieve processed CSV from MCP resources."""
-    global client
+async def get_csv_from_mcp(user):
+    """Retrieve processed CSV from MCP resources (only downloaded again when the data changed)."""
     try:
-        resources = await client.get_resources(server_name="EDA Agent")
-        if len(resources) > 0:
-            csv_base64 = resources[0].data
+        csv_base64 = await read_if_changed(user, "resource://csv_file")
+        if csv_base64 is not None:
             # Decode base64 to get CSV content
             csv_data = base64.b64decode(csv_base64)
-            # Save to temporary file for download
-            temp_file = "processed_data.csv"
-            with open(temp_file, "wb") as f:
+            # Save to temporary file for download (one directory per user)
+            user.csv_file_memory = os.path.join(user.download_dir, "processed_data.csv")
+            with open(user.csv_file_memory, "wb") as f:
                 f.write(csv_data)
-            return temp_file
-        return None
+        return user.csv_file_memory
     except Exception as e:
         print(f"Error retrieving CSV: {e}")
         return None
 
 # ========== CHAT HANDLER ==========
-async def chat_with_mcp(message, history):
-    """Handles user messages and gets responses from MCP."""
-    global messages, agent, df_memory
-    if df_memory is None:
-        return "⚠️ Please upload a CSV first before chatting.", None
-    
-    # Add user message
-    messages.append(HumanMessage(content=message))
-    # Get agent response
-    response = await agent.ainvoke({"messages": messages})
-    messages = response["messages"]
-    
-    # Get the text response
-    text_response = messages[-1].content
-    
+async def stream_chat_with_mcp(user, message):
+    """Handles user messages, yielding (tool progress, response text, plots) as tokens, tool events and plots arrive."""
+    if user is None or user.df_memory is None:
+        yield [], "⚠️ Please upload a CSV first before chatting.", None
+        return
+    progress, text, plots = [], "", None
+    yield progress, "⏳ Thinking...", plots
+
+    # at most AGENT_CONCURRENCY agent runs at once, other users wait here
+    async with agent_slots:
+        # Add user message (and start a new turn so plots from the last one are cleared).
+        # The turn's trace id tags the server's metrics spans and the agent run
+        user.trace_id = new_trace_id()
+        await call_app_tool(user, "start_turn", {"trace_id": user.trace_id})
+        # refresh the system prompt when modifications changed the profile
+        profile = await read_if_changed(user, "resource://profile")
+        if profile is not None:
+            user.messages[0] = system_message(json.loads(profile))
+        user.messages.append(HumanMessage(content=message))
+        user.messages = history_manager.compact(user.messages)
+
+        # Stream the agent: "messages" gives the LLM tokens, "updates" the finished messages of each step
+        new_messages, text_id = [], None
+        config = {"metadata": {"trace_id": user.trace_id}, "run_name": f"turn-{user.trace_id}"}
+        async for mode, chunk in user.agent.astream({"messages": user.messages}, config, stream_mode=["messages", "updates"]):
+            if mode == "messages":
+                token = chunk[0]
+                if isinstance(token, AIMessageChunk) and isinstance(token.content, str) and token.content:
+                    if token.id != text_id: # a new model call, show its text from the start
+                        text_id, text = token.id, ""
+                    text += token.content
+                    yield progress, text, plots
+                continue
+            for update in chunk.values():
+                for step_message in (update or {}).get("messages", []):
+                    new_messages.append(step_message)
+                    if isinstance(step_message, AIMessage) and step_message.tool_calls:
+                        progress = progress + [f"🔧 {call['name']} ..." for call in step_message.tool_calls]
+                    elif isinstance(step_message, ToolMessage):
+                        failed = '"Error"' in str(step_message.content)
+                        started = f"🔧 {step_message.name} ..."
+                        if started in progress:
+                            progress = list(progress)
+                            progress[progress.index(started)] = f"{'❌' if failed else '✅'} {step_message.name}"
+                        if step_message.name == "execute_code_plotting":
+                            plots = await get_plots_from_mcp(user, thumbnails_only=True) # thumbnails now, full images at the end
+            yield progress, text, plots
+        user.messages = user.messages + new_messages
+
+    # Keep the local dataframe in sync with the server's modifications
+    try:
+        await sync_df_memory(user)
+    except Exception as e:
+        print(f"Error syncing dataframe: {e}")
+
     # Check for plots
-    plots = await get_plots_from_mcp()
-    
-    return text_response, plots if plots else None
+    plots = await get_plots_from_mcp(user)
+    yield progress, user.messages[-1].content, plots if plots else None
 
 # ========== BUILD GRADIO INTERFACE ==========
 with gr.Blocks() as demo:
     gr.Markdown("# 🧠 LangChain MCP Chatbot")
-    # Initialize MCP connection button
+    # per browser session: its own MCP session, agent and conversation, closed when the session goes away
+    user_state = gr.State(None, time_to_live=USER_SESSION_TTL, delete_callback=close_user_session)
+    # Every browser session connects as soon as the page loads, the button reconnects after a failure
     init_btn = gr.Button("🔗 Connect to MCP Server")
-    init_status = gr.Markdown("")
-    
-    async def init_mcp_connection():
-        await setup_mcp()
-        return "✅ Connected to MCP and initialized agent."
-    
-    init_btn.click(init_mcp_connection, outputs=init_status)
-    
+    init_status = gr.Markdown("⏳ Connecting to MCP...")
+
+    async def init_mcp_connection(user):
+        try:
+            user = await setup_mcp(user)
+        except Exception as e:
+            return f"❌ Could not connect to MCP: {e}", user
+        return "✅ Connected to MCP and initialized agent.", user
+
+    init_btn.click(init_mcp_connection, inputs=user_state, outputs=[init_status, user_state])
+    demo.load(init_mcp_connection, inputs=user_state, outputs=[init_status, user_state])
+
     with gr.Tab("📂 Upload CSV"):
         file_input = gr.File(label="Upload your CSV file")
         upload_output = gr.Markdown()
         download_btn =  gr.Button("⬇️ Download CSV")
 
-        file_input.upload(handle_csv_upload, inputs=file_input, outputs=upload_output)
+        file_input.upload(handle_csv_upload, inputs=[file_input, user_state], outputs=[upload_output, user_state])
 
 
-        async def download_csv():
-            csv_file = await get_csv_from_mcp()
+        async def download_csv(user):
+            csv_file = await get_csv_from_mcp(user) if user is not None else None
             return csv_file if csv_file else None
 
-        download_btn.click(download_csv, inputs=None, outputs=download_btn)
-    
+        download_btn.click(download_csv, inputs=user_state, outputs=download_btn)
+
     with gr.Tab("💬 Chat"):
         with gr.Row():
             with gr.Column():
@@ -162,7 +421,7 @@ with gr.Blocks() as demo:
                 with gr.Row():
                     submit_btn = gr.Button("Send", variant="primary")
                     clear_btn = gr.Button("Clear")
-            
+
             with gr.Column():
                 plot_gallery = gr.Gallery(
                     label="Generated Plots",
@@ -171,37 +430,40 @@ with gr.Blocks() as demo:
                     height=500,
                     object_fit="contain"
                 )
-        
-        async def respond(message, chat_history):
+
+        async def respond(message, chat_history, user):
             if not message.strip():
-                return chat_history, "", None
-            
+                yield chat_history, "", None
+                return
+
             # Add user message to history
             chat_history.append((message, None))
-            
-            # Get response and plots
-            bot_response, plots = await chat_with_mcp(message, chat_history)
-            
-            # Update chat history with bot response
-            chat_history[-1] = (message, bot_response)
-            
-            return chat_history, "", plots
-        
+
+            # Stream tool progress, the response and plots as they arrive
+            async for progress, bot_response, plots in stream_chat_with_mcp(user, message):
+                chat_history[-1] = (message, "\n".join(progress + [bot_response]) if progress else bot_response)
+                yield chat_history, "", plots
+
         submit_btn.click(
             respond,
-            inputs=[msg_input, chatbot],
+            inputs=[msg_input, chatbot, user_state],
             outputs=[chatbot, msg_input, plot_gallery]
         )
-        
+
         msg_input.submit(
             respond,
-            inputs=[msg_input, chatbot],
+            inputs=[msg_input, chatbot, user_state],
             outputs=[chatbot, msg_input, plot_gallery]
         )
-        
+
         clear_btn.click(
             lambda: ([], None),
             outputs=[chatbot, plot_gallery]
         )
 
-demo.launch()
\ No newline at end of file
+if __name__ == "__main__":
+    # the agent libraries and the model client load while Gradio starts up
+    threading.Thread(target=warm_up, daemon=True).start()
+    # bounded concurrency with backpressure: events beyond the queue size are turned away instead of piling up
+    demo.queue(default_concurrency_limit=CONCURRENCY, max_size=QUEUE_SIZE)
+    demo.launch()
@@ -0,0 +1,119 @@
+import os
+import base64
+import numpy as np
+import pandas as pd
+from utils import encode_table, read_table
+
+BLOCK_ROWS = int(os.environ.get("EDA_DELTA_BLOCK_ROWS", 4096)) # rows per hashed block, the granularity of row changes
+DELTA_HISTORY = int(os.environ.get("EDA_DELTA_HISTORY", 8)) # deltas kept per session, clients further behind download everything
+
+
+def block_hashes(series: pd.Series, block_rows: int = BLOCK_ROWS) -> np.ndarray:
+    """One uint64 per block of rows. Row hashes are weighted by their position so reordering rows changes the block hash"""
+    try:
+        hashes = pd.util.hash_pandas_object(series, index=False).to_numpy()
+    except TypeError: # unhashable values: every block counts as changed
+        return np.arange(-(-len(series) // block_rows), dtype=np.uint64) ^ np.uint64(id(series))
+    weights = (np.arange(len(hashes), dtype=np.uint64) % np.uint64(block_rows)) * np.uint64(2) + np.uint64(1)
+    if not len(hashes):
+        return np.zeros(0, dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        return np.add.reduceat(hashes * weights, np.arange(0, len(hashes), block_rows))
+
+
+def dtype_key(dtype) -> tuple:
+    """
+    What a client copy has to match for a column to count as unchanged in type: the dtype, and for
+    categoricals their categories in order (str(dtype) is just "category", and block hashes see values only)
+    """
+    if isinstance(dtype, pd.CategoricalDtype):
+        return (str(dtype), dtype.ordered, tuple(dtype.categories))
+    return (str(dtype),)
+
+
+class FrameDigest():
+    """
+    Per-column block hashes of one dataframe version: enough to diff the next version against it
+    without keeping the old dataframe around
+    """
+    def __init__(self, df: pd.DataFrame, previous: "FrameDigest" = None, changed: list = None, block_rows: int = BLOCK_ROWS):
+        self.rows = len(df)
+        self.block_rows = block_rows
+        self.columns = [str(name) for name in df.columns]
+        self.dtypes = {str(name): str(dtype) for name, dtype in df.dtypes.items()}
+        self.dtype_keys = {str(name): dtype_key(dtype) for name, dtype in df.dtypes.items()}
+        self.blocks = {}
+        for position, name in enumerate(self.columns):
+            reuse = previous is not None and changed is not None and name not in changed and name in previous.blocks \
+                and previous.rows == self.rows and previous.block_rows == block_rows
+            self.blocks[name] = previous.blocks[name] if reuse else block_hashes(df.iloc[:, position], block_rows)
+
+
+def diff(old: FrameDigest, new: FrameDigest, df: pd.DataFrame) -> dict:
+    """
+    Structural delta from the old version to df (described by new): added, dropped and retyped columns
+    are sent whole, the other columns only for the row blocks whose hashes changed
+    """
+    if len(set(new.columns)) != len(new.columns):
+        return None # duplicated column names can't be diffed by name
+    added = [c for c in new.columns if c not in old.blocks]
+    dropped = [c for c in old.columns if c not in new.blocks]
+    retyped = [c for c in new.columns if c in old.blocks and old.dtype_keys[c] != new.dtype_keys[c]]
+    kept = [c for c in new.columns if c not in added and c not in retyped]
+    changed_blocks = set()
+    for name in kept:
+        before, after = old.blocks[name], new.blocks[name]
+        common = min(len(before), len(after))
+        changed_blocks.update(np.flatnonzero(before[:common] != after[:common]).tolist())
+        changed_blocks.update(range(common, len(after))) # appended rows
+    if old.rows % new.block_rows and old.rows < new.rows:
+        changed_blocks.add(old.rows // new.block_rows) # the old last block was partial
+    blocks = sorted(b for b in changed_blocks if b * new.block_rows < new.rows)
+    positions = np.concatenate([np.arange(b * new.block_rows, min((b + 1) * new.block_rows, new.rows)) for b in blocks]) if blocks else np.zeros(0, dtype=int)
+    frame = df.set_axis(new.columns, axis=1)
+    return {
+        "rows": new.rows,
+        "block_rows": new.block_rows,
+        "columns": new.columns,
+        "dtypes": new.dtypes,
+        "added": added,
+        "dropped": dropped,
+        "retyped": retyped,
+        "blocks": blocks,
+        # parquet keeps the dtypes, base64 so the delta is plain json
+        "column_data": base64.b64encode(encode_table(frame[added + retyped], "parquet")).decode() if added or retyped else None,
+        "row_data": base64.b64encode(encode_table(frame[kept].iloc[positions], "parquet")).decode() if blocks and kept else None
+    }
+
+
+def apply_delta(df: pd.DataFrame, delta: dict) -> pd.DataFrame:
+    """Brings a local copy of the previous version up to date with a delta from diff (the result has a RangeIndex)"""
+    block_rows, rows = delta["block_rows"], delta["rows"]
+    df = df.set_axis([str(c) for c in df.columns], axis=1).reset_index(drop=True)
+    kept = [c for c in delta["columns"] if c not in delta["added"] and c not in delta["retyped"]]
+    old = df[kept]
+    if delta["row_data"] is not None:
+        changed = read_table(base64.b64decode(delta["row_data"]), "parquet")
+        pieces, taken, start = [], 0, 0
+        for block in delta["blocks"]:
+            # unchanged rows before this block come from the local copy, the block itself from the delta
+            pieces.append(old.iloc[start:block * block_rows])
+            size = min(block_rows, rows - block * block_rows)
+            pieces.append(changed.iloc[taken:taken + size])
+            taken += size
+            start = block * block_rows + size
+        pieces.append(old.iloc[start:rows])
+        old = pd.concat([p for p in pieces if len(p)] or [old.iloc[:0]], ignore_index=True)
+    else:
+        old = old.iloc[:rows].reset_index(drop=True)
+    if delta["column_data"] is not None:
+        whole = read_table(base64.b64decode(delta["column_data"]), "parquet")
+        old = pd.concat([old, whole.reset_index(drop=True)], axis=1)
+    result = old[delta["columns"]]
+    for name, dtype in delta["dtypes"].items():
+        if str(result[name].dtype) != dtype:
+            try: # concatenating categories with different values falls back to object
+                result[name] = result[name].astype(dtype)
+            except (TypeError, ValueError):
+                pass
+    return result
@@ -0,0 +1,164 @@
+import os
+import ast
+import sys
+import types
+import time
+import pandas as pd
+import numpy as np
+from lazyframe import LazyFrame
+from plot_helpers import PLOT_HELPERS
+import vectorize
+
+os.environ.setdefault("MPLBACKEND", "Agg") # plots are only ever rendered to files
+if int(pd.__version__.split(".")[0]) < 3: # always on from pandas 3
+    # modifying code runs on df.copy(deep=False) and versions are shallow snapshots: without copy-on-write
+    # an in-place edit (df.loc[0, 'a'] = 99) would also reach the frame the copy was taken from
+    pd.options.mode.copy_on_write = True
+
+# how long user variables survive between tool calls: "lru" keeps them within the caps below, "none" starts fresh every call
+NAMESPACE_RETENTION = os.environ.get("EDA_NAMESPACE_RETENTION", "lru")
+NAMESPACE_MAX_VARS = int(os.environ.get("EDA_NAMESPACE_MAX_VARS", 64))
+NAMESPACE_MAX_BYTES = int(os.environ.get("EDA_NAMESPACE_MAX_BYTES", 512 * 1024 ** 2))
+
+BASE_NAMES = {"df", "df_sample", "pd", "np", "__builtins__"} | PLOT_HELPERS.keys()
+
+
+def object_nbytes(value) -> int:
+    """Rough memory footprint of a namespace value"""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    return sys.getsizeof(value)
+
+
+def referenced_names(code: str) -> set:
+    """Names read or written by a piece of code"""
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return set()
+    return {node.id for node in ast.walk(tree) if isinstance(node, ast.Name)}
+
+
+class ExecutionNamespace():
+    """
+    A long-lived REPL namespace. Imports, helper functions and intermediate results from earlier
+    tool calls stay available to later ones, within a variable count and memory cap.
+    Modules and functions are always kept; other variables are dropped least recently used first.
+    """
+    def __init__(self, retention: str = NAMESPACE_RETENTION, max_vars: int = NAMESPACE_MAX_VARS, max_bytes: int = NAMESPACE_MAX_BYTES):
+        self.retention = retention
+        self.max_vars = max_vars
+        self.max_bytes = max_bytes
+        self.tool = None # PythonAstREPLTool, created on the first run (langchain_experimental is slow to import)
+        self.reset()
+
+    def reset(self):
+        self.values = {"pd": pd, "np": np, **PLOT_HELPERS} # bin2d, lttb and stratified_sample for plotting large frames
+        if self.tool is not None:
+            self.bind()
+        self.last_used = {} # name -> call counter when it was last read or written
+        self.calls = 0
+        self.total_bytes = 0
+        self.vectorized = {} # rules rewritten and hints of the latest call
+
+    def run(self, code: str, df: pd.DataFrame):
+        """
+        Executes code against df and returns the output and the (possibly reassigned) df.
+        Row-wise loops and applies are rewritten into vectorized code first (see vectorize)
+        """
+        if self.retention == "none":
+            self.reset()
+        if self.tool is None:
+            from langchain_experimental.tools import PythonAstREPLTool
+            self.tool = PythonAstREPLTool()
+            self.bind()
+        self.calls += 1
+        frames = {name: value for name, value in (("df", df), ("df_sample", getattr(df, "sample_frame", None))) if isinstance(value, pd.DataFrame)}
+        code, rewritten, hints = vectorize.rewrite(code, frames=frames)
+        vectorize.record(rewritten)
+        self.vectorized = {key: value for key, value in (("rewritten", rewritten), ("hints", hints)) if value}
+        self.values["df"] = df
+        if isinstance(df, LazyFrame):
+            self.values["df_sample"] = df.sample_frame # in-memory rows to plot from
+        try:
+            output = self.tool.invoke(code)
+            df = self.values["df"]
+        finally:
+            # the dataframe is owned by the caller, never keep a stale reference to it here
+            self.values.pop("df", None)
+            self.values.pop("df_sample", None)
+            for name in referenced_names(code) & self.values.keys():
+                self.last_used[name] = self.calls
+            self.prune()
+        return output, df
+
+    def bind(self):
+        # one dict for globals and locals so functions defined in the REPL can see earlier variables
+        self.tool.globals = self.tool.locals = self.values
+
+    def user_variables(self) -> list:
+        """Names that count towards the caps (everything except modules, functions, classes and the base names)"""
+        return [
+            name for name, value in self.values.items()
+            if name not in BASE_NAMES and not isinstance(value, (types.ModuleType, types.FunctionType, type))
+        ]
+
+    def nbytes(self) -> int:
+        return sum(object_nbytes(self.values[name]) for name in self.user_variables())
+
+    def prune(self):
+        """Drops the least recently used variables until the namespace is within its caps"""
+        names = sorted(self.user_variables(), key=lambda name: self.last_used.get(name, 0))
+        sizes = {name: object_nbytes(self.values[name]) for name in names}
+        total = sum(sizes.values())
+        while names and (len(names) > self.max_vars or total > self.max_bytes):
+            name = names.pop(0)
+            total -= sizes[name]
+            del self.values[name]
+            self.last_used.pop(name, None)
+        self.total_bytes = total
+
+    def describe(self) -> dict:
+        """Summary of the variables currently kept"""
+        return {
+            name: {"type": type(self.values[name]).__name__, "nbytes": object_nbytes(self.values[name])}
+            for name in self.user_variables()
+        }
+
+
+def warm_up():
+    """Imports what the first tool call would otherwise import: the REPL tool, pyplot and PIL for plots"""
+    import langchain_experimental.tools
+    import matplotlib.pyplot
+    import PIL.Image
+    import plotting
+
+
+def execute(namespace: ExecutionNamespace, kind: str, code: str, df: pd.DataFrame) -> dict:
+    """
+    Runs one tool call of the given kind ("geninfo", "modifying" or "plotting") in a namespace.
+    Shared by the in-process path and the worker processes.
+    """
+    from plotting import capture_plots, close_figures, pyplot_lock
+    with pyplot_lock: # any kind of code may draw (df.plot() in a geninfo call), figures never outlive their call
+        close_figures()
+        try:
+            start = time.perf_counter()
+            output, new_df = namespace.run(code, df)
+            # timings travel back with the result so the server can record them for calls run in a worker
+            result = {"output": output, "timings": {"code": time.perf_counter() - start}}
+            if namespace.vectorized:
+                result["vectorize"] = namespace.vectorized
+            if kind == "modifying":
+                result["df"] = new_df
+            if kind == "plotting":
+                start = time.perf_counter()
+                result["plots"] = capture_plots(namespace.values) # every figure the code drew
+                result["timings"]["plot_render"] = time.perf_counter() - start
+        finally:
+            close_figures()
+    return result
@@ -0,0 +1,85 @@
+import os
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+from langchain_core.messages.utils import count_tokens_approximately
+
+HISTORY_TOKENS = int(os.environ.get("EDA_HISTORY_TOKENS", 12_000)) # budget for everything sent to the model
+TOOL_OUTPUT_TOKENS = int(os.environ.get("EDA_TOOL_OUTPUT_TOKENS", 1_000)) # longer tool outputs of past turns are elided
+KEEP_TURNS = int(os.environ.get("EDA_HISTORY_KEEP_TURNS", 2)) # most recent turns always kept verbatim (apart from elision)
+SUMMARY_CHARS = 300 # per question/answer in the summary of older turns
+
+SUMMARY_NAME = "history_summary" # marks the message holding the summary of older turns
+
+
+def elide(text: str, max_chars: int) -> str:
+    """Keeps the head and tail of a long text"""
+    if len(text) <= max_chars:
+        return text
+    half = max_chars // 2
+    return f"{text[:half]}\n... [{len(text) - 2 * half} characters elided] ...\n{text[-half:]}"
+
+
+def split_turns(messages: list) -> tuple:
+    """(system messages at the start, existing summary or None, turns), a turn starting at each human message"""
+    system, summary, turns = [], None, []
+    for message in messages:
+        if isinstance(message, SystemMessage) and message.name == SUMMARY_NAME:
+            summary = message
+        elif isinstance(message, SystemMessage) and not turns:
+            system.append(message)
+        elif isinstance(message, HumanMessage) or not turns:
+            turns.append([message])
+        else:
+            turns[-1].append(message)
+    return system, summary, turns
+
+
+def summarize_turn(turn: list) -> str:
+    """One line per turn: the question and the final answer. Tool calls and their outputs are dropped together"""
+    question = turn[0].content if isinstance(turn[0], HumanMessage) else ""
+    answers = [m.content for m in turn if isinstance(m, AIMessage) and not m.tool_calls and m.content]
+    tools = sum(len(m.tool_calls) for m in turn if isinstance(m, AIMessage))
+    line = f"- User: {elide(str(question), SUMMARY_CHARS)}"
+    if answers:
+        line += f" | Assistant: {elide(str(answers[-1]), SUMMARY_CHARS)}"
+    if tools:
+        line += f" ({tools} tool calls)"
+    return line.replace("\n", " ")
+
+
+class HistoryManager():
+    """
+    Keeps the conversation sent to the model within a token budget. The system prompt and the most recent
+    turns stay intact; large tool outputs of past turns are elided and older turns are folded into a
+    one-line-per-turn summary (question and answer), so the cost per turn stays flat over long sessions.
+    Tool calls are only ever dropped together with their outputs.
+    """
+    def __init__(self, budget: int = HISTORY_TOKENS, tool_output_tokens: int = TOOL_OUTPUT_TOKENS, keep_turns: int = KEEP_TURNS):
+        self.budget = budget
+        self.tool_output_chars = tool_output_tokens * 4 # roughly 4 characters per token
+        self.keep_turns = max(keep_turns, 1)
+
+    def elide_outputs(self, turn: list) -> list:
+        return [
+            m.model_copy(update={"content": elide(m.content, self.tool_output_chars)})
+            if isinstance(m, ToolMessage) and isinstance(m.content, str) and len(m.content) > self.tool_output_chars else m
+            for m in turn
+        ]
+
+    def compact(self, messages: list) -> list:
+        """Returns the messages to send: call it before invoking the agent with a new human message"""
+        system, summary, turns = split_turns(messages)
+        # the last turn is the one being answered, earlier ones have already been read by the model
+        turns = [self.elide_outputs(turn) for turn in turns[:-1]] + turns[-1:]
+        lines = summary.content.splitlines()[1:] if summary is not None else []
+
+        def build():
+            head = system + ([SystemMessage(content="Summary of the earlier conversation:\n" + "\n".join(lines), name=SUMMARY_NAME)] if lines else [])
+            return head + [m for turn in turns for m in turn]
+
+        # fold the oldest turns into the summary until the history fits (the recent turns are always kept)
+        while len(turns) > self.keep_turns and count_tokens_approximately(build()) > self.budget:
+            lines.append(summarize_turn(turns.pop(0)))
+        # then forget the oldest summary lines
+        while lines and count_tokens_approximately(build()) > self.budget:
+            lines.pop(0)
+        return build()
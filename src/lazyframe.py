@@ -0,0 +1,397 @@
+import os
+import uuid
+import tempfile
+import numpy as np
+import pandas as pd
+
+# uploads bigger than this (bytes on disk) are analysed out-of-core instead of being loaded into memory
+OUT_OF_CORE_BYTES = int(os.environ.get("EDA_OUT_OF_CORE_BYTES", 2 * 1024 ** 3))
+LAZY_DIR = os.environ.get("EDA_LAZY_DIR", os.path.join(tempfile.gettempdir(), "eda-agent-lazy"))
+ROW_GROUP_ROWS = int(os.environ.get("EDA_ROW_GROUP_ROWS", 256 * 1024)) # rows per chunk, bounds the memory of a streamed pass
+SAMPLE_ROWS = int(os.environ.get("EDA_SAMPLE_ROWS", 100_000)) # rows of the in-memory preview used for plotting
+MATERIALIZE_BYTES = int(os.environ.get("EDA_MATERIALIZE_BYTES", 512 * 1024 ** 2)) # largest result to_pandas() will build
+
+USAGE = (
+    "df is an out-of-core LazyFrame streamed from disk in row groups, not a pandas DataFrame. "
+    "Supported: df.columns, df.dtypes, df.shape, len(df), df.head(n), df.tail(n), df.sample(n), df['col'] / df[['a', 'b']], "
+    "df.query(expr), df.count(), df.sum(), df.min(), df.max(), df.mean(), df.std(), df.var(), df.nunique(), df.isna_sum(), "
+    "df.describe(), df['col'].value_counts(), df.groupby(by).agg({'col': 'mean'}) (sum, count, min, max, mean, size), "
+    "df.map_batches(func) and df.to_pandas() for small results. "
+    "Modifying the dataset is not supported. For plotting use df_sample, an in-memory pandas sample of the rows."
+)
+
+
+def convert_to_parquet(path: str, file_format: str, lazy_dir: str = LAZY_DIR) -> str:
+    """
+    Streams an uploaded parquet, arrow or csv file into a parquet file with bounded row groups
+    (so later passes never hold more than one row group in memory) and returns its path
+    """
+    import pyarrow as pa
+    import pyarrow.csv as pv
+    import pyarrow.parquet as pq
+    os.makedirs(lazy_dir, exist_ok=True)
+    dest = os.path.join(lazy_dir, f"{uuid.uuid4().hex}.parquet")
+    if file_format == "csv":
+        reader = pv.open_csv(path)
+        schema, batches = reader.schema, reader
+    elif file_format == "arrow":
+        source = pa.memory_map(path)
+        try:
+            ipc = pa.ipc.open_file(source)
+            schema, batches = ipc.schema, (ipc.get_batch(i) for i in range(ipc.num_record_batches))
+        except pa.ArrowInvalid:
+            source.seek(0)
+            ipc = pa.ipc.open_stream(source)
+            schema, batches = ipc.schema, ipc
+    else:
+        parquet = pq.ParquetFile(path, memory_map=True)
+        schema, batches = parquet.schema_arrow, parquet.iter_batches(batch_size=ROW_GROUP_ROWS)
+    with pq.ParquetWriter(dest, schema) as writer:
+        pending, rows = [], 0
+        for batch in batches:
+            pending.append(batch)
+            rows += batch.num_rows
+            if rows >= ROW_GROUP_ROWS:
+                writer.write_table(pa.Table.from_batches(pending, schema), row_group_size=ROW_GROUP_ROWS)
+                pending, rows = [], 0
+        if pending:
+            writer.write_table(pa.Table.from_batches(pending, schema), row_group_size=ROW_GROUP_ROWS)
+    return dest
+
+
+def merge_moments(a: tuple, b: tuple) -> tuple:
+    """Combines (count, mean, M2) of two chunks (Chan et al.), works element-wise on Series"""
+    n_a, mean_a, m2_a = a
+    n_b, mean_b, m2_b = b
+    n = n_a + n_b
+    delta = mean_b - mean_a
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = (mean_a * n_a + mean_b * n_b) / n
+        m2 = m2_a + m2_b + delta ** 2 * n_a * n_b / n
+    return n, mean.fillna(0) if isinstance(mean, pd.Series) else np.nan_to_num(mean), m2.fillna(0) if isinstance(m2, pd.Series) else np.nan_to_num(m2)
+
+
+class LazyFrame():
+    """
+    Read-only frame over a parquet file on disk. Nothing is loaded up-front: every operation streams
+    over the row groups one at a time, so memory stays bounded by the row group size, not the file size.
+    Projections (df[cols]) and filters (df.query) are lazy and applied per chunk; aggregations combine
+    per-chunk partial results.
+    """
+    def __init__(self, path: str, columns: list = None, filters: tuple = (), series: bool = False):
+        import pyarrow.parquet as pq
+        self.path = path
+        self.file = pq.ParquetFile(path, memory_map=True)
+        self._columns = list(columns) if columns is not None else list(self.file.schema_arrow.names)
+        self.filters = tuple(filters)
+        self.series = series # a single column: aggregations return scalars instead of Series
+        self._rows = None if filters else self.file.metadata.num_rows
+        self._sample = None
+
+    def _derive(self, columns: list = None, filters: tuple = None, series: bool = False):
+        return LazyFrame(self.path, self._columns if columns is None else columns, self.filters if filters is None else filters, series)
+
+    def __repr__(self):
+        return f"LazyFrame({self.path!r}, {self.shape[0]} rows x {len(self._columns)} columns)"
+
+    # ----- schema -----
+    @property
+    def columns(self) -> pd.Index:
+        return pd.Index(self._columns)
+
+    @property
+    def dtypes(self) -> pd.Series:
+        return self.file.schema_arrow.empty_table().to_pandas()[self._columns].dtypes
+
+    @property
+    def name(self):
+        return self._columns[0] if self.series else None
+
+    @property
+    def shape(self) -> tuple:
+        return (len(self),) if self.series else (len(self), len(self._columns))
+
+    def __len__(self) -> int:
+        if self._rows is None:
+            self._rows = sum(len(chunk) for chunk in self.iter_batches())
+        return self._rows
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held in memory: only the cached sample, the data stays on disk"""
+        return int(self._sample.memory_usage(deep=True).sum()) if self._sample is not None else 0
+
+    def copy(self, deep: bool = False):
+        return self # read-only, nothing to copy
+
+    # ----- streaming -----
+    def iter_batches(self):
+        """Yields the (filtered, projected) data one row group at a time as pandas DataFrames"""
+        read_columns = None if self.filters else self._columns
+        for i in range(self.file.num_row_groups):
+            chunk = self._read_row_group(i, read_columns)
+            for expr in self.filters:
+                chunk = chunk.query(expr)
+            yield chunk[self._columns]
+
+    def _read_row_group(self, i: int, columns: list = None) -> pd.DataFrame:
+        """One row group, indexed by its row positions in the whole file"""
+        chunk = self.file.read_row_group(i, columns=columns).to_pandas()
+        offset = sum(self.file.metadata.row_group(j).num_rows for j in range(i))
+        chunk.index = pd.RangeIndex(offset, offset + len(chunk))
+        return chunk
+
+    def _chunks(self):
+        """Like iter_batches, but yields Series for single-column frames"""
+        for chunk in self.iter_batches():
+            yield chunk[self._columns[0]] if self.series else chunk
+
+    def map_batches(self, func, combine=None):
+        """Applies func to every chunk and combines the results (pd.concat by default)"""
+        results = [func(chunk) for chunk in self._chunks()]
+        return (combine or pd.concat)(results)
+
+    def to_pandas(self) -> pd.DataFrame:
+        """Materializes the frame. Refuses when it would not fit in MATERIALIZE_BYTES"""
+        parts, nbytes = [], 0
+        for chunk in self._chunks():
+            parts.append(chunk)
+            nbytes += int(chunk.memory_usage(deep=True).sum()) if isinstance(chunk, pd.DataFrame) else int(chunk.memory_usage(deep=True))
+            if nbytes > MATERIALIZE_BYTES:
+                raise MemoryError(f"The result is over {MATERIALIZE_BYTES / 1024 ** 2:.0f} MiB, aggregate it or use df_sample instead")
+        return pd.concat(parts) if parts else self.head(0)
+
+    # ----- selection -----
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            if key not in self._columns:
+                raise KeyError(key)
+            return self._derive(columns=[key], series=True)
+        if isinstance(key, (list, tuple, pd.Index)):
+            missing = [c for c in key if c not in self._columns]
+            if missing:
+                raise KeyError(missing)
+            return self._derive(columns=list(key))
+        raise TypeError("LazyFrame supports df['col'] and df[['a', 'b']]; filter rows with df.query(expr)")
+
+    def __getattr__(self, name):
+        if not name.startswith("_") and name in self.__dict__.get("_columns", ()):
+            return self[name]
+        raise AttributeError(f"LazyFrame has no attribute '{name}'. {USAGE}")
+
+    def query(self, expr: str):
+        """Lazily filters the rows, evaluated chunk by chunk"""
+        return self._derive(filters=self.filters + (expr,))
+
+    def head(self, n: int = 5):
+        parts, rows = [], 0
+        for chunk in self._chunks():
+            parts.append(chunk.iloc[:n - rows])
+            rows += len(parts[-1])
+            if rows >= n:
+                break
+        if not parts:
+            empty = self.file.schema_arrow.empty_table().to_pandas()[self._columns]
+            return empty[self._columns[0]] if self.series else empty
+        return pd.concat(parts)
+
+    def tail(self, n: int = 5):
+        if not self.filters:
+            parts, rows = [], 0
+            for i in reversed(range(self.file.num_row_groups)):
+                chunk = self._read_row_group(i, self._columns)
+                parts.insert(0, chunk)
+                rows += len(chunk)
+                if rows >= n:
+                    break
+            result = pd.concat(parts).iloc[-n:] if parts else self.head(0)
+        else:
+            result = None
+            for chunk in self.iter_batches():
+                result = chunk if result is None else pd.concat([result, chunk]).iloc[-n:]
+            result = result.iloc[-n:] if result is not None else self.head(0)
+        return result[self._columns[0]] if self.series else result
+
+    def sample(self, n: int = SAMPLE_ROWS, random_state: int = 0):
+        """Uniform sample of about n rows, taking the same fraction of every chunk"""
+        fraction = min(1.0, n / max(len(self), 1))
+        parts = [chunk.sample(frac=fraction, random_state=random_state + i) for i, chunk in enumerate(self._chunks())]
+        return pd.concat(parts) if parts else self.head(0)
+
+    @property
+    def sample_frame(self) -> pd.DataFrame:
+        """Cached in-memory sample (the df_sample given to generated code)"""
+        if self._sample is None:
+            self._sample = self.sample(SAMPLE_ROWS)
+        return self._sample
+
+    def slice(self, start: int = None, stop: int = None) -> pd.DataFrame:
+        """Rows [start, stop), reading only the row groups that overlap them"""
+        if self.filters:
+            raise ValueError("slice is only supported on unfiltered frames")
+        start, stop, _ = slice(start, stop).indices(len(self))
+        parts, offset = [], 0
+        for i in range(self.file.num_row_groups):
+            rows = self.file.metadata.row_group(i).num_rows
+            if offset + rows > start and offset < stop:
+                chunk = self._read_row_group(i, self._columns)
+                parts.append(chunk.iloc[max(start - offset, 0):stop - offset])
+            offset += rows
+            if offset >= stop:
+                break
+        return pd.concat(parts) if parts else self.head(0)
+
+    # ----- aggregations -----
+    def _reduce(self, partial, combine):
+        result = None
+        for chunk in self._chunks():
+            value = partial(chunk)
+            result = value if result is None else combine(result, value)
+        return result
+
+    def _numeric(self, chunk):
+        return chunk if self.series else chunk.select_dtypes(include=["number", "bool"])
+
+    def count(self):
+        return self._reduce(lambda c: c.count(), lambda a, b: a + b)
+
+    def isna_sum(self):
+        """Null count per column"""
+        return self._reduce(lambda c: c.isna().sum(), lambda a, b: a + b)
+
+    def sum(self):
+        return self._reduce(lambda c: self._numeric(c).sum(), lambda a, b: a + b)
+
+    def _extreme(self, how: str):
+        def combine(a, b):
+            if isinstance(a, pd.Series):
+                return getattr(pd.concat([a, b], axis=1), how)(axis=1)
+            return getattr(pd.Series([a, b]), how)() # skips NaN like pandas does
+        return self._reduce(lambda c: getattr(self._numeric(c), how)(), combine)
+
+    def min(self):
+        return self._extreme("min")
+
+    def max(self):
+        return self._extreme("max")
+
+    def _moments(self):
+        def partial(chunk):
+            chunk = self._numeric(chunk)
+            return chunk.count(), chunk.mean(), chunk.var(ddof=0) * chunk.count()
+        return self._reduce(partial, merge_moments)
+
+    def mean(self):
+        return self._moments()[1]
+
+    def var(self, ddof: int = 1):
+        n, _, m2 = self._moments()
+        return m2 / (n - ddof)
+
+    def std(self, ddof: int = 1):
+        return np.sqrt(self.var(ddof))
+
+    def nunique(self, dropna: bool = True):
+        """Exact distinct counts (keeps the set of distinct values per column in memory)"""
+        def partial(chunk):
+            if self.series:
+                return {self._columns[0]: set(chunk.dropna().unique() if dropna else chunk.unique())}
+            return {c: set(chunk[c].dropna().unique() if dropna else chunk[c].unique()) for c in chunk.columns}
+        seen = self._reduce(partial, lambda a, b: {c: a[c] | b[c] for c in a}) or {}
+        counts = pd.Series({c: len(values) for c, values in seen.items()}, dtype="int64")
+        return int(counts.iloc[0]) if self.series else counts
+
+    def value_counts(self, normalize: bool = False, dropna: bool = True):
+        if not self.series:
+            raise TypeError("value_counts is supported on a single column: df['col'].value_counts()")
+        counts = self._reduce(lambda c: c.value_counts(dropna=dropna), lambda a, b: a.add(b, fill_value=0))
+        counts = counts.astype("int64").sort_values(ascending=False)
+        return counts / counts.sum() if normalize else counts
+
+    def describe(self) -> pd.DataFrame:
+        """count, mean, std, min and max of the numeric columns (quantiles need the data in memory, use df_sample)"""
+        n, mean, m2 = self._moments()
+        stats = {"count": n, "mean": mean, "std": np.sqrt(m2 / (n - 1)), "min": self.min(), "max": self.max()}
+        return pd.Series(stats) if self.series else pd.DataFrame(stats).T
+
+    def groupby(self, by):
+        return LazyGroupBy(self, by)
+
+
+class LazyGroupBy():
+    """Streaming groupby over a LazyFrame for decomposable aggregations (sum, count, min, max, mean, size)"""
+    PARTIALS = {"sum": ("sum",), "count": ("count",), "min": ("min",), "max": ("max",), "mean": ("sum", "count"), "size": ("size",)}
+    COMBINE = {"sum": "sum", "count": "sum", "min": "min", "max": "max", "size": "sum"}
+
+    def __init__(self, frame: LazyFrame, by):
+        self.frame = frame
+        self.by = [by] if isinstance(by, str) else list(by)
+        self.selection = None
+
+    def __getitem__(self, key):
+        grouped = LazyGroupBy(self.frame, self.by)
+        grouped.selection = key
+        return grouped
+
+    def _spec(self, func) -> dict:
+        if isinstance(func, dict):
+            return {col: [f] if isinstance(f, str) else list(f) for col, f in func.items()}
+        funcs = [func] if isinstance(func, str) else list(func)
+        if self.selection is not None:
+            columns = [self.selection] if isinstance(self.selection, str) else list(self.selection)
+        else:
+            columns = [c for c in self.frame._columns if c not in self.by]
+        return {col: funcs for col in columns}
+
+    def agg(self, func):
+        spec = self._spec(func)
+        for funcs in spec.values():
+            unsupported = [f for f in funcs if f not in self.PARTIALS]
+            if unsupported:
+                raise ValueError(f"Unsupported streaming aggregation {unsupported}; use sum, count, min, max, mean or size")
+        parts = sorted({(col, p) for col, funcs in spec.items() for f in funcs for p in self.PARTIALS[f]})
+        frame = self.frame._derive(columns=list(dict.fromkeys(self.by + [c for c in spec if c not in self.by])))
+
+        def partial(chunk):
+            grouped = chunk.groupby(self.by, observed=True, sort=False)
+            return pd.DataFrame({(col, p): grouped.size() if p == "size" else getattr(grouped[col], p)() for col, p in parts})
+
+        def combine(a, b):
+            both = pd.concat([a, b])
+            return both.groupby(level=list(range(both.index.nlevels))).agg({key: self.COMBINE[key[1]] for key in parts})
+
+        combined = None
+        for chunk in frame.iter_batches():
+            combined = partial(chunk) if combined is None else combine(combined, partial(chunk))
+        if combined is None:
+            combined = pd.DataFrame(columns=pd.MultiIndex.from_tuples(parts))
+        result = {}
+        multiple = any(len(funcs) > 1 for funcs in spec.values())
+        for col, funcs in spec.items():
+            for f in funcs:
+                key = (col, f) if multiple else col
+                result[key] = combined[(col, "sum")] / combined[(col, "count")] if f == "mean" else combined[(col, f)]
+        result = pd.DataFrame(result).sort_index()
+        result.index.names = self.by
+        if isinstance(func, str) and isinstance(self.selection, str):
+            return result[self.selection]
+        return result
+
+    def sum(self):
+        return self.agg("sum")
+
+    def count(self):
+        return self.agg("count")
+
+    def min(self):
+        return self.agg("min")
+
+    def max(self):
+        return self.agg("max")
+
+    def mean(self):
+        return self.agg("mean")
+
+    def size(self):
+        column = self.frame._columns[0]
+        return self.agg({column: "size"})[column].rename("size")
@@ -0,0 +1,166 @@
+import os
+import time
+import uuid
+import math
+import bisect
+import threading
+import contextvars
+from contextlib import contextmanager
+from collections import deque
+
+METRICS = os.environ.get("EDA_METRICS", "1") == "1" # record spans and payload sizes
+PROMETHEUS = os.environ.get("EDA_PROMETHEUS", "1") == "1" # serve the metrics in Prometheus text format on /metrics
+TRACE_SPANS = int(os.environ.get("EDA_TRACE_SPANS", 1024)) # most recent spans kept with their trace ids
+
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+BYTES_BUCKETS = tuple(4 ** i * 1024 for i in range(12)) # 1KB .. 4GB
+
+# trace id of the request being handled: set per turn by the client (start_turn) or by AgentReAct
+current_trace = contextvars.ContextVar("trace_id", default=None)
+
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def resource_label(uri: str) -> str:
+    """Groups uris of templated resources so they share a series: resource://plots/ab12 -> resource://plots/{...}"""
+    head, _, rest = str(uri).partition("://")
+    name, _, params = rest.partition("/")
+    return f"{head}://{name}" + ("/{...}" if params else "")
+
+
+class Histogram():
+    """Cumulative bucket counts plus count, sum, min and max of the observed values"""
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) # the last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile (the max for the +Inf bucket)"""
+        rank, seen = q * self.count, 0
+        for bound, count in zip(self.buckets + (self.max,), self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else 0.0,
+            "min": self.min if self.count else 0.0,
+            "max": self.max,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99)
+        }
+
+
+class Metrics():
+    """
+    Process-wide registry of timing spans and payload sizes. Every series is a histogram keyed by
+    (metric name, labels); spans are also kept in a bounded log with their trace id so a single
+    request can be followed through the tools it called.
+    """
+    def __init__(self, trace_spans: int = TRACE_SPANS):
+        self.histograms = {} # (name, ((label, value), ...)) -> Histogram
+        self.spans = deque(maxlen=trace_spans)
+        self.started = time.time()
+        self.lock = threading.Lock()
+
+    def observe(self, name: str, value: float, buckets: tuple = SECONDS_BUCKETS, **labels):
+        if not METRICS:
+            return
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def observe_bytes(self, name: str, size: int, **labels):
+        self.observe(name, size, BYTES_BUCKETS, **labels)
+
+    def record_span(self, span: str, seconds: float, **labels):
+        """Records a span timed elsewhere (e.g. inside a worker process)"""
+        self.observe("span_seconds", seconds, span=span, **labels)
+        if METRICS:
+            self.spans.append({"trace_id": current_trace.get(), "span": span, **labels, "end": time.time(), "seconds": seconds})
+
+    @contextmanager
+    def span(self, span: str, **labels):
+        """Times the block as span (failures are counted with error=true)"""
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            labels["error"] = "true"
+            raise
+        finally:
+            self.record_span(span, time.perf_counter() - start, **labels)
+
+    def traced(self, span: str, function, **labels):
+        """function wrapped in a span"""
+        def wrapper(*args, **kwargs):
+            with self.span(span, **labels):
+                return function(*args, **kwargs)
+        return wrapper
+
+    def trace(self, trace: str) -> list:
+        """Spans recorded for one trace id, oldest first"""
+        return [span for span in list(self.spans) if span["trace_id"] == trace]
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            histograms = [
+                {"name": name, "labels": dict(labels), **histogram.to_dict()}
+                for (name, labels), histogram in sorted(self.histograms.items())
+            ]
+        return {"uptime_s": time.time() - self.started, "histograms": histograms, "recent_spans": list(self.spans)[-50:]}
+
+    def prometheus(self, gauges: dict = None, prefix: str = "eda_") -> str:
+        """
+        Prometheus text exposition of the histograms, plus gauges given as {name: [(labels dict, value), ...]}
+        (dataframe memory, cache hit rates and the like, read at scrape time)
+        """
+        def format_labels(labels: dict) -> str:
+            if not labels:
+                return ""
+            escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in labels.values())
+            return "{" + ",".join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + "}"
+
+        lines = []
+        with self.lock:
+            series = sorted(self.histograms.items())
+            names = sorted({name for (name, _), _ in series})
+            for name in names:
+                lines.append(f"# TYPE {prefix}{name} histogram")
+                for (other, labels), histogram in series:
+                    if other != name:
+                        continue
+                    labels, cumulative = dict(labels), 0
+                    for bound, count in zip(histogram.buckets + ("+Inf",), histogram.counts):
+                        cumulative += count
+                        lines.append(f"{prefix}{name}_bucket{format_labels({**labels, 'le': bound})} {cumulative}")
+                    lines.append(f"{prefix}{name}_sum{format_labels(labels)} {histogram.sum}")
+                    lines.append(f"{prefix}{name}_count{format_labels(labels)} {histogram.count}")
+        for name, values in (gauges or {}).items():
+            lines.append(f"# TYPE {prefix}{name} gauge")
+            lines.extend(f"{prefix}{name}{format_labels(labels)} {value}" for labels, value in values)
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
@@ -0,0 +1,104 @@
+import os
+import datetime
+import pandas as pd
+
+OPTIMIZE = os.environ.get("EDA_OPTIMIZE", "1") == "1" # shrink dtypes at ingest and after modifications
+# categories reject values outside their categories (df.loc[mask, 'c'] = 'Other'), off by default
+CATEGORIES = os.environ.get("EDA_CATEGORIES", "0") == "1"
+CATEGORY_RATIO = float(os.environ.get("EDA_CATEGORY_RATIO", 0.5)) # max distinct/non-null ratio for category columns (0 disables)
+CATEGORY_MAX = int(os.environ.get("EDA_CATEGORY_MAX", 10_000)) # max distinct values of a category column
+# int64 -> narrower ints overflows silently in generated arithmetic (id * 1000), off by default
+DOWNCAST_INTS = os.environ.get("EDA_DOWNCAST_INTS", "0") == "1"
+INT_MIN_BITS = int(os.environ.get("EDA_INT_MIN_BITS", 32)) # narrowest integer width downcasting goes to
+DOWNCAST_FLOATS = os.environ.get("EDA_DOWNCAST_FLOATS", "0") == "1" # float64 -> float32 loses precision, off by default
+# parsed dates no longer have .str methods that cleaning code calls on them, off by default
+PARSE_DATETIMES = os.environ.get("EDA_PARSE_DATETIMES", "0") == "1"
+DATETIME_SAMPLE = 200 # values tried before parsing a whole text column as datetimes
+
+
+def is_text(series: pd.Series) -> bool:
+    return pd.api.types.is_object_dtype(series.dtype) or pd.api.types.is_string_dtype(series.dtype) and not isinstance(series.dtype, pd.CategoricalDtype)
+
+
+def parse_datetimes(series: pd.Series):
+    """The column as datetimes when its (ISO formatted) values all parse, otherwise None"""
+    values = series.dropna()
+    if values.empty:
+        return None
+    if all(isinstance(v, datetime.date) for v in values.iloc[:DATETIME_SAMPLE]): # e.g. date32 columns read by pyarrow
+        try:
+            return pd.to_datetime(series)
+        except (ValueError, TypeError, OverflowError):
+            return None
+    if not all(isinstance(v, str) for v in values.iloc[:DATETIME_SAMPLE]):
+        return None
+    sample = values.iloc[:DATETIME_SAMPLE]
+    if not sample.str.match(r"^\d{4}-\d{2}-\d{2}").all():
+        return None
+    try:
+        pd.to_datetime(sample, format="ISO8601")
+        parsed = pd.to_datetime(series, format="ISO8601", errors="coerce")
+    except (ValueError, TypeError, OverflowError):
+        return None
+    return parsed if parsed.isna().sum() == series.isna().sum() else None
+
+
+def optimize_column(series: pd.Series) -> pd.Series:
+    """Smallest dtype that holds the column's values exactly (returns the series unchanged when there is none)"""
+    if pd.api.types.is_bool_dtype(series.dtype) or isinstance(series.dtype, pd.CategoricalDtype):
+        return series
+    if pd.api.types.is_integer_dtype(series.dtype):
+        if not DOWNCAST_INTS:
+            return series
+        downcast = pd.to_numeric(series, downcast="integer") # signed, so arithmetic like x - 1 can't wrap around
+        if downcast.dtype.itemsize * 8 < INT_MIN_BITS:
+            downcast = series.astype(f"int{INT_MIN_BITS}") if series.dtype.itemsize * 8 > INT_MIN_BITS else series
+        return downcast
+    if pd.api.types.is_float_dtype(series.dtype):
+        return pd.to_numeric(series, downcast="float") if DOWNCAST_FLOATS else series
+    if not is_text(series):
+        return series
+    parsed = parse_datetimes(series) if PARSE_DATETIMES else None
+    if parsed is not None:
+        return parsed
+    if CATEGORIES:
+        try:
+            distinct = series.nunique(dropna=True)
+        except TypeError: # unhashable values (lists, dicts)
+            return series
+        if distinct <= CATEGORY_MAX and distinct <= CATEGORY_RATIO * series.count():
+            return series.astype("category")
+    if pd.api.types.is_object_dtype(series.dtype) and all(isinstance(v, str) for v in series.dropna().iloc[:DATETIME_SAMPLE]):
+        try:
+            return series.astype("string[pyarrow]")
+        except (TypeError, ValueError, ImportError):
+            return series
+    return series
+
+
+def optimize_frame(df: pd.DataFrame, columns: list = None) -> tuple:
+    """
+    Turns text into arrow-backed strings, and when enabled downcasts numbers, parses ISO datetimes and
+    turns low-cardinality text into categories. Only the given columns are looked at (all by default).
+    Returns the optimized dataframe and a report of the memory before and after and the converted columns.
+    """
+    before = int(df.memory_usage(deep=True).sum())
+    names = [name for name in (df.columns if columns is None else columns) if name in df.columns]
+    converted, new_columns = {}, {}
+    for position, name in enumerate(df.columns):
+        if name not in names or isinstance(df[name], pd.DataFrame): # skip duplicated column names
+            continue
+        series = df.iloc[:, position]
+        optimized = optimize_column(series)
+        if optimized.dtype != series.dtype:
+            new_columns[position] = optimized
+            converted[str(name)] = {"from": str(series.dtype), "to": str(optimized.dtype)}
+    if new_columns:
+        df = df.copy(deep=False)
+        for position, series in new_columns.items():
+            df.isetitem(position, series)
+    return df, {
+        "before_bytes": before,
+        "after_bytes": int(df.memory_usage(deep=True).sum()) if new_columns else before,
+        "converted": converted
+    }
@@ -0,0 +1,95 @@
+import os
+import re
+import hashlib
+import threading
+from collections import OrderedDict
+
+INLINE_CHARS = int(os.environ.get("EDA_OUTPUT_INLINE_CHARS", 4_000)) # longer tool outputs are returned as a head/tail preview
+PAGE_CHARS = int(os.environ.get("EDA_OUTPUT_PAGE_CHARS", 8_000)) # page size when reading a stored output back
+OUTPUT_ENTRIES = int(os.environ.get("EDA_OUTPUT_ENTRIES", 16)) # full outputs kept per session
+OUTPUT_BYTES = int(os.environ.get("EDA_OUTPUT_BYTES", 64 * 1024 ** 2)) # and their total size
+
+# pandas' footer of a truncated dataframe print, and of a truncated series print
+FRAME_SHAPE = re.compile(r"\[(\d+) rows x (\d+) columns\]\s*$")
+SERIES_LENGTH = re.compile(r"Length: (\d+)(?:, dtype: \w+)?\s*$")
+
+
+def preview(text: str, max_chars: int = INLINE_CHARS) -> str:
+    """Whole lines from the head and the tail of text within max_chars, with a marker for what was left out"""
+    lines = text.splitlines()
+    head, tail, size = [], [], 0
+    while lines and size + len(lines[0]) + 1 <= max_chars // 2:
+        size += len(lines[0]) + 1
+        head.append(lines.pop(0))
+    while lines and size + len(lines[-1]) + 1 <= max_chars:
+        size += len(lines[-1]) + 1
+        tail.insert(0, lines.pop())
+    if not head and not tail: # a single huge line
+        return f"{text[:max_chars // 2]}\n... [{len(text) - 2 * (max_chars // 2)} characters omitted] ...\n{text[-(max_chars // 2):]}"
+    omitted = sum(len(line) + 1 for line in lines)
+    return "\n".join(head + [f"... [{len(lines)} lines, {omitted} characters omitted] ..."] + tail)
+
+
+def describe(text: str, page_chars: int = PAGE_CHARS) -> dict:
+    """Size of an output, plus the table shape when it is a (truncated) dataframe or series print"""
+    meta = {"chars": len(text), "lines": text.count("\n") + 1, "pages": max(-(-len(text) // page_chars), 1)}
+    match = FRAME_SHAPE.search(text)
+    if match:
+        meta["table_shape"] = [int(match.group(1)), int(match.group(2))]
+    else:
+        match = SERIES_LENGTH.search(text)
+        if match:
+            meta["table_shape"] = [int(match.group(1))]
+    return meta
+
+
+class OutputStore():
+    """
+    Full outputs of tool calls that were too long to return inline, kept per session and read back in pages.
+    Ids are content hashes, so printing the same thing twice stores it once. Least recently stored outputs
+    are dropped beyond the entry and byte caps.
+    """
+    def __init__(self, max_entries: int = OUTPUT_ENTRIES, max_bytes: int = OUTPUT_BYTES, page_chars: int = PAGE_CHARS):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.page_chars = page_chars
+        self.outputs = OrderedDict() # output id -> text, oldest first
+        self.total = 0
+        self.lock = threading.Lock()
+
+    def put(self, text: str) -> str:
+        output_id = hashlib.sha256(text.encode()).hexdigest()[:16]
+        with self.lock:
+            if output_id not in self.outputs:
+                self.outputs[output_id] = text
+                self.total += len(text)
+            self.outputs.move_to_end(output_id)
+            while len(self.outputs) > 1 and (len(self.outputs) > self.max_entries or self.total > self.max_bytes):
+                _, dropped = self.outputs.popitem(last=False)
+                self.total -= len(dropped)
+        return output_id
+
+    def page(self, output_id: str, page: int) -> dict:
+        """Page (0-based) of a stored output. Raises KeyError for unknown ids and pages"""
+        text = self.outputs.get(output_id)
+        if text is None:
+            raise KeyError(f"Unknown output '{output_id}' (outputs are only kept for the latest {self.max_entries} long results)")
+        pages = max(-(-len(text) // self.page_chars), 1)
+        if not 0 <= page < pages:
+            raise KeyError(f"Output '{output_id}' has pages 0 to {pages - 1}")
+        return {
+            "output_id": output_id,
+            "page": page,
+            "pages": pages,
+            "text": text[page * self.page_chars:(page + 1) * self.page_chars]
+        }
+
+    def govern(self, text: str, max_chars: int = INLINE_CHARS) -> dict:
+        """
+        The inline result for an output: the output itself when it is short, otherwise a head/tail preview
+        with its size and shape, the full text being stored for reading back page by page
+        """
+        text = text if isinstance(text, str) else str(text)
+        if len(text) <= max_chars:
+            return {"output": text}
+        return {"output": preview(text, max_chars), "truncated": True, "output_id": self.put(text), **describe(text, self.page_chars)}
@@ -0,0 +1,119 @@
+"""
+Helpers given to generated plotting code next to df, pd and np. They reduce a large frame to roughly as
+many points as the figure has pixels before matplotlib sees it, so rendering time depends on the figure
+size rather than the number of rows.
+"""
+import os
+import numpy as np
+import pandas as pd
+
+PLOT_POINTS = int(os.environ.get("EDA_PLOT_POINTS", 2_000)) # default points kept by lttb (about the width of a plot in pixels)
+PLOT_BINS = int(os.environ.get("EDA_PLOT_BINS", 200)) # default bins per axis of bin2d
+SAMPLE_ROWS = int(os.environ.get("EDA_PLOT_SAMPLE_ROWS", 10_000)) # default rows kept by stratified_sample
+
+
+def _numeric(values) -> np.ndarray:
+    """float64 copy of numbers, datetimes (as nanoseconds) or timedeltas, missing values as NaN"""
+    if isinstance(values, (pd.Series, pd.Index)):
+        if isinstance(values.dtype, pd.DatetimeTZDtype):
+            values = values.dt.tz_convert(None) if isinstance(values, pd.Series) else values.tz_convert(None)
+        if values.dtype.kind not in "mM":
+            return values.to_numpy(dtype="float64", na_value=np.nan)
+        values = values.to_numpy()
+    values = np.asarray(values)
+    if values.dtype.kind in "mM":
+        numbers = values.astype("datetime64[ns]" if values.dtype.kind == "M" else "timedelta64[ns]").view("int64").astype("float64")
+        numbers[np.isnat(values)] = np.nan
+        return numbers
+    return values.astype("float64")
+
+
+def bin2d(x, y, bins: int = PLOT_BINS, range: list = None, weights=None, statistic: str = "count"):
+    """
+    2D histogram of x and y (one pass over the rows) to draw instead of a scatter plot of every point.
+    statistic is "count", "sum" or "mean" (of weights in each bin). Returns (values, xedges, yedges) with
+    values shaped (len(xedges) - 1, len(yedges) - 1); empty bins are NaN for "mean". Draw it with
+        values, xedges, yedges = bin2d(df["a"], df["b"])
+        ax.pcolormesh(xedges, yedges, values.T, cmap="viridis")
+    """
+    x, y = _numeric(x), _numeric(y)
+    keep = np.isfinite(x) & np.isfinite(y)
+    w = None
+    if weights is not None:
+        w = _numeric(weights)
+        keep &= np.isfinite(w)
+        w = w[keep]
+    x, y = x[keep], y[keep]
+    counts, xedges, yedges = np.histogram2d(x, y, bins=bins, range=range)
+    if statistic == "count":
+        return counts, xedges, yedges
+    if w is None:
+        raise ValueError(f"statistic '{statistic}' needs weights")
+    sums, _, _ = np.histogram2d(x, y, bins=[xedges, yedges], weights=w)
+    if statistic == "sum":
+        return sums, xedges, yedges
+    if statistic == "mean":
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(counts > 0, sums / counts, np.nan), xedges, yedges
+    raise ValueError(f"Unknown statistic '{statistic}', expected count, sum or mean")
+
+
+def lttb(x, y, n_out: int = PLOT_POINTS):
+    """
+    Largest-Triangle-Three-Buckets downsampling of a line: keeps n_out points that preserve its visual shape
+    (peaks and dips survive, unlike taking every k-th row). x is sorted first; rows with a missing x or y are
+    dropped. Returns (x, y) with the original dtypes (datetimes stay datetimes), e.g.
+        ax.plot(*lttb(daily["date"], daily["sales"]))
+    """
+    x_values = x.to_numpy() if isinstance(x, (pd.Series, pd.Index)) else np.asarray(x)
+    y_values = y.to_numpy() if isinstance(y, (pd.Series, pd.Index)) else np.asarray(y)
+    xs, ys = _numeric(x), _numeric(y)
+    keep = np.flatnonzero(np.isfinite(xs) & np.isfinite(ys))
+    order = keep[np.argsort(xs[keep], kind="stable")]
+    n = len(order)
+    if n_out >= n or n_out < 3:
+        return x_values[order], y_values[order]
+    xs, ys = xs[order], ys[order]
+    # first and last points are kept, the rest is split into n_out - 2 buckets
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    # averages of every bucket up front (the third point of each triangle is the next bucket's average)
+    sums_x, sums_y = np.add.reduceat(xs[1:n - 1], edges[:-1] - 1), np.add.reduceat(ys[1:n - 1], edges[:-1] - 1)
+    sizes = np.diff(edges)
+    mean_x, mean_y = np.append(sums_x / sizes, xs[-1]), np.append(sums_y / sizes, ys[-1])
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    previous = 0
+    for bucket in range(n_out - 2):
+        start, stop = edges[bucket], edges[bucket + 1]
+        ax, ay = xs[previous], ys[previous]
+        cx, cy = mean_x[bucket + 1], mean_y[bucket + 1]
+        # twice the triangle area for every candidate point of the bucket
+        areas = np.abs((ax - cx) * (ys[start:stop] - ay) - (ax - xs[start:stop]) * (cy - ay))
+        previous = start + int(np.argmax(areas))
+        selected[bucket + 1] = previous
+    rows = order[selected]
+    return x_values[rows], y_values[rows]
+
+
+def stratified_sample(df: pd.DataFrame, by, n: int = SAMPLE_ROWS, min_per_group: int = 1, random_state: int = 0) -> pd.DataFrame:
+    """
+    About n rows of df, sampled within each group of the by column(s) in proportion to the group's size,
+    with at least min_per_group rows from every group so small groups still show up. Rows keep their
+    original order. Use it before scatter plots or box plots colored by a category, e.g.
+        sample = stratified_sample(df, "species", n=5000)
+    """
+    if len(df) <= n:
+        return df
+    codes = df.groupby(by, sort=False, observed=True, dropna=False).ngroup().to_numpy()
+    sizes = np.bincount(codes)
+    quota = np.minimum(sizes, np.maximum(np.round(sizes * n / len(df)).astype(np.int64), min_per_group))
+    # a random rank within each group, the rows ranked below the group's quota are kept
+    keys = np.random.default_rng(random_state).random(len(df))
+    order = np.argsort(codes + keys) # by group, randomly within the group (keys are in [0, 1))
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    rank = np.empty(len(df), dtype=np.int64)
+    rank[order] = np.arange(len(df)) - starts[codes[order]]
+    return df[rank < quota[codes]]
+
+
+PLOT_HELPERS = {"bin2d": bin2d, "lttb": lttb, "stratified_sample": stratified_sample}
@@ -0,0 +1,118 @@
+import os
+import io
+import sys
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+import numpy as np
+
+PLOT_FORMAT = os.environ.get("EDA_PLOT_FORMAT", "webp").lower() # webp, png or svg
+PLOT_DPI = int(os.environ.get("EDA_PLOT_DPI", 100))
+THUMBNAIL_SIZE = int(os.environ.get("EDA_THUMBNAIL_SIZE", 256)) # longest side in pixels
+RENDER_THREADS = int(os.environ.get("EDA_RENDER_THREADS", 4)) # figures of one call encoded concurrently
+PLOT_STORE_ENTRIES = int(os.environ.get("EDA_PLOT_STORE_ENTRIES", 256))
+
+MIME_TYPES = {"webp": "image/webp", "png": "image/png", "svg": "image/svg+xml"}
+
+# pyplot's open figures are process-wide: calls running in the same process take turns so that
+# a figure left open by one call never ends up in another call's plots
+pyplot_lock = threading.Lock()
+
+
+def render_figure(fig, file_format: str = PLOT_FORMAT, dpi: int = PLOT_DPI) -> bytes:
+    """Renders a matplotlib figure straight to an encoded image (no intermediate RGB array)"""
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format=file_format, dpi=dpi, bbox_inches="tight")
+    return buffer.getvalue()
+
+
+def encode_array(image: np.ndarray, file_format: str = PLOT_FORMAT) -> bytes:
+    """Encodes a raw RGB array (the old plt_figure convention)"""
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.fromarray(image).save(buffer, format="PNG" if file_format == "svg" else file_format.upper())
+    return buffer.getvalue()
+
+
+def make_thumbnail(data: bytes, file_format: str, fig=None) -> bytes:
+    """Small webp preview of a rendered plot"""
+    from PIL import Image
+    if file_format == "svg":
+        # vector output can't be downscaled with PIL, render the figure again at a low dpi instead
+        data = render_figure(fig, "png", dpi=max(10, int(THUMBNAIL_SIZE / max(fig.get_size_inches()))))
+    image = Image.open(io.BytesIO(data))
+    image.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+    buffer = io.BytesIO()
+    image.save(buffer, format="WEBP", quality=80)
+    return buffer.getvalue()
+
+
+def capture_plots(values: dict, file_format: str = PLOT_FORMAT, dpi: int = PLOT_DPI) -> list:
+    """
+    Collects the plots produced by a code execution: every open pyplot figure plus plt_figure
+    (a Figure, a raw RGB array for older code, or a list of those). Each one is rendered once and closed.
+    Returns a list of {"format", "data", "thumbnail"} dicts.
+    """
+    import matplotlib.pyplot as plt
+    from matplotlib.figure import Figure
+    figures = [plt.figure(num) for num in plt.get_fignums()]
+    extra = values.pop("plt_figure", None)
+    arrays = []
+    for item in extra if isinstance(extra, (list, tuple)) else [extra]:
+        if isinstance(item, Figure) and item not in figures:
+            figures.append(item)
+        elif isinstance(item, np.ndarray):
+            arrays.append(item)
+
+    def render(fig):
+        data = render_figure(fig, file_format, dpi)
+        return {"format": file_format, "data": data, "thumbnail": make_thumbnail(data, file_format, fig)}
+
+    if len(figures) > 1 and RENDER_THREADS > 1:
+        # separate figures don't share state, encoding (zlib/webp) releases the GIL
+        with ThreadPoolExecutor(min(len(figures), RENDER_THREADS)) as executor:
+            plots = list(executor.map(render, figures))
+    else:
+        plots = [render(fig) for fig in figures]
+    for image in arrays if not figures else []: # an array is normally just a copy of a figure that was already captured
+        array_format = "png" if file_format == "svg" else file_format
+        data = encode_array(image, array_format)
+        plots.append({"format": array_format, "data": data, "thumbnail": make_thumbnail(data, array_format)})
+    plt.close("all")
+    return plots
+
+
+def close_figures():
+    """Closes every open pyplot figure, without importing pyplot when nothing used it yet"""
+    plt = sys.modules.get("matplotlib.pyplot")
+    if plt is not None:
+        plt.close("all")
+
+
+class PlotStore():
+    """
+    Content-addressed plot storage: a plot's id is the hash of its encoded bytes, so identical plots
+    (from any session) are stored once and a client that already has an id never downloads it again.
+    """
+    def __init__(self, max_entries: int = PLOT_STORE_ENTRIES):
+        self.max_entries = max_entries
+        self.plots = OrderedDict() # plot_id -> plot dict, least recently used first
+        self.lock = threading.Lock()
+
+    def put(self, plot: dict) -> str:
+        plot_id = hashlib.sha256(plot["data"]).hexdigest()[:32]
+        with self.lock:
+            if plot_id not in self.plots:
+                self.plots[plot_id] = plot
+            self.plots.move_to_end(plot_id)
+            while len(self.plots) > self.max_entries:
+                self.plots.popitem(last=False)
+        return plot_id
+
+    def get(self, plot_id: str) -> dict:
+        with self.lock:
+            return self.plots.get(plot_id)
+
+    def __contains__(self, plot_id: str) -> bool:
+        return plot_id in self.plots
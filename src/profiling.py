@@ -0,0 +1,139 @@
+import hashlib
+import pandas as pd
+import numpy as np
+from lazyframe import LazyFrame, USAGE
+
+MAX_SUMMARY_COLUMNS = 80 # columns listed in the text summary
+TOP_VALUES = 3
+
+
+def column_fingerprint(series: pd.Series) -> tuple:
+    """Cheap content fingerprint used to find the columns a modification changed"""
+    try:
+        # digest of the row hashes in order, so reordering rows also counts as a change
+        return str(series.dtype), len(series), hashlib.blake2b(pd.util.hash_pandas_object(series, index=False).to_numpy().tobytes(), digest_size=16).hexdigest()
+    except TypeError: # unhashable values (lists, dicts)
+        return str(series.dtype), len(series), id(series.array)
+
+
+def format_value(value) -> str:
+    text = f"{value:.4g}" if isinstance(value, (float, np.floating)) else str(value)
+    return text if len(text) <= 30 else text[:27] + "..."
+
+
+def profile_frame(df: pd.DataFrame) -> dict:
+    """Profiles every column of df with frame-level vectorized reductions"""
+    nulls = df.isna().sum()
+    try:
+        unique = df.nunique(dropna=True)
+    except TypeError:
+        unique = pd.Series({c: None for c in df.columns})
+    numeric = df.select_dtypes(include="number")
+    numeric = numeric.loc[:, ~numeric.columns.duplicated()]
+    stats = pd.DataFrame({"min": numeric.min(), "max": numeric.max(), "mean": numeric.mean(), "std": numeric.std()}) if len(numeric.columns) else None
+    profile = {}
+    for name in df.columns.unique():
+        series = df[name]
+        if isinstance(series, pd.DataFrame): # duplicated column names
+            series = series.iloc[:, 0]
+        column = {
+            "dtype": str(series.dtype),
+            "nulls": int(nulls[name]) if np.ndim(nulls[name]) == 0 else int(nulls[name].iloc[0]),
+            "unique": None if unique[name] is None or np.ndim(unique[name]) else int(unique[name])
+        }
+        if stats is not None and name in stats.index:
+            column.update({k: (None if pd.isna(v) else float(v)) for k, v in stats.loc[name].items()})
+        elif pd.api.types.is_datetime64_any_dtype(series):
+            column.update({"min": str(series.min()), "max": str(series.max())})
+        else:
+            try:
+                column["top"] = [format_value(v) for v in series.value_counts(dropna=True).index[:TOP_VALUES]]
+            except TypeError:
+                pass
+        profile[str(name)] = column
+    return profile
+
+
+def profile_lazy(frame: LazyFrame) -> dict:
+    """
+    Profiles an out-of-core frame without scanning it: null counts and ranges come from the parquet
+    row group statistics, cardinality, mean and top values are estimated on the in-memory sample
+    """
+    profile = profile_frame(frame.sample_frame)
+    metadata = frame.file.metadata
+    for j, name in enumerate(frame.file.schema_arrow.names):
+        column = profile[str(name)]
+        column["estimated"] = ["unique", "mean", "top"]
+        try:
+            stats = [metadata.row_group(i).column(j).statistics for i in range(metadata.num_row_groups)]
+        except (IndexError, ValueError):
+            stats = [None]
+        if any(s is None for s in stats):
+            column["estimated"].append("nulls")
+            continue
+        column["nulls"] = int(sum(s.null_count for s in stats))
+        if "min" in column and stats and all(s.has_min_max for s in stats):
+            column["min"] = min(s.min for s in stats)
+            column["max"] = max(s.max for s in stats)
+            column.update({k: str(column[k]) for k in ("min", "max") if not isinstance(column[k], (int, float))})
+    return profile
+
+
+class DatasetProfile():
+    """
+    Profile of a dataframe (dtype, nulls, cardinality, ranges or top values per column).
+    Built in one pass at upload and updated incrementally: only columns whose fingerprint
+    changed are profiled again.
+    """
+    def __init__(self, df: pd.DataFrame):
+        self.rows = len(df)
+        self.note = None
+        if isinstance(df, LazyFrame): # out-of-core datasets can't be modified, so never need updating
+            self.columns = profile_lazy(df)
+            self.fingerprints = {}
+            self.note = USAGE
+            return
+        self.columns = profile_frame(df)
+        self.fingerprints = {str(name): column_fingerprint(df[name]) for name in df.columns.unique() if not isinstance(df[name], pd.DataFrame)}
+
+    def update(self, df: pd.DataFrame) -> list:
+        """Re-profiles the columns that changed and returns their names (added and dropped columns included)"""
+        fingerprints = {str(name): column_fingerprint(df[name]) for name in df.columns.unique() if not isinstance(df[name], pd.DataFrame)}
+        changed = [name for name in fingerprints if self.fingerprints.get(name) != fingerprints[name]]
+        dropped = [name for name in self.columns if name not in fingerprints]
+        if len(df) != self.rows:
+            changed = list(fingerprints) # row counts changed, every column's stats moved
+        columns = profile_frame(df[[c for c in df.columns.unique() if str(c) in changed]]) if changed else {}
+        # keep the column order of the new frame
+        self.columns = {str(name): columns.get(str(name), self.columns.get(str(name))) for name in df.columns.unique()}
+        self.fingerprints = fingerprints
+        self.rows = len(df)
+        return changed + dropped
+
+    def column_summary(self, name: str) -> str:
+        column = self.columns[name]
+        approx = {key: "~" if key in column.get("estimated", ()) else "" for key in ("nulls", "unique", "mean", "top")}
+        parts = [f"nulls {approx['nulls']}{column['nulls']}"]
+        if column.get("unique") is not None:
+            parts.append(f"unique {approx['unique']}{column['unique']}")
+        if "min" in column:
+            parts.append(f"range [{format_value(column['min'])}, {format_value(column['max'])}]")
+        if column.get("mean") is not None:
+            parts.append(f"mean {approx['mean']}{format_value(column['mean'])}")
+        if column.get("top"):
+            parts.append(f"top {approx['top']}" + ", ".join(column["top"]))
+        return f"- {name} ({column['dtype']}): " + "; ".join(parts)
+
+    def summary(self) -> str:
+        """Compact text summary for the system prompt"""
+        names = list(self.columns)
+        lines = [f"{self.rows} rows, {len(names)} columns"]
+        if self.note:
+            lines.insert(0, self.note)
+        lines += [self.column_summary(name) for name in names[:MAX_SUMMARY_COLUMNS]]
+        if len(names) > MAX_SUMMARY_COLUMNS:
+            lines.append(f"... and {len(names) - MAX_SUMMARY_COLUMNS} more columns")
+        return "\n".join(lines)
+
+    def to_dict(self) -> dict:
+        return {"rows": self.rows, "columns": self.columns, "summary": self.summary(), "out_of_core": self.note is not None}
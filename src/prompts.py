@@ -18,19 +18,21 @@ Previous context:-
 system_prompt_template = PromptTemplate.from_template("""
 You are a helpful data analysis assistant that has access to a dataset read as a python dataframe with the variable name being "df". 
 The columns of the dataset are {columns}. Each column is comma seperated and case sensitive.
+Profile of the dataset (dtypes, null counts, cardinalities and ranges are already known, do not spend tool calls recomputing them):
+{profile}
 Your goal is to answer the user quries to the best of your understanding. Please make sure that your output is frinedly. When generating code, make sure to have neccessary imports
-For plotting, make sure to save the figure as a numpy array with a varaible name of plt_figure
+Variables, imports and helper functions from earlier code executions are kept, so reuse intermediate results instead of recomputing them.
+Print only what answers the question (aggregates, a few rows with head()), never a whole dataframe: long outputs are cut down to their head and tail.
+For plotting, draw the figure with matplotlib. Every open figure is captured automatically after the code runs, so do not convert it to an array or call plt.show()
+Never plot every row of a large dataframe, reduce it first with these helpers (already defined, do not import them):
+- bin2d(x, y, bins=200, weights=None, statistic="count") returns (values, xedges, yedges), a 2D histogram to draw with ax.pcolormesh(xedges, yedges, values.T) instead of a scatter plot. statistic can also be "sum" or "mean" of weights
+- lttb(x, y, n_out=2000) returns (x, y) downsampled to n_out points keeping the shape of the line, for line plots and time series: ax.plot(*lttb(df["date"], df["value"]))
+- stratified_sample(df, by, n=10000) returns about n rows sampled within each group of the by column(s), for scatter or box plots by category
+Histograms (ax.hist) and bar charts of aggregates are already cheap.
 A simple plotting example is given below:
 import matplotlib.pyplot as plt
-import numpy as np
 fig, ax = plt.subplots()
-ax.plot([1, 2, 3], [4, 5, 6]) 
-fig.canvas.draw()
-
-# Convert the canvas to a raw RGB buffer
-buf = fig.canvas.tostring_rgb()
-ncols, nrows = fig.canvas.get_width_height()
-plt_figure = np.frombuffer(buf, dtype=np.uint8).reshape(nrows, ncols, 3)                                              
+ax.plot([1, 2, 3], [4, 5, 6])
 """)
 
 
@@ -50,18 +52,14 @@ code_generation_prompt_template_plotting = PromptTemplate.from_template("""
 You are an assistant that has access to a dataset read as a python dataframe with the variable name being "df". 
 The columns of the dataset are {columns}. Each column is comma seperated and case sensitive.
 Your goal is to write python code that is sufficient for plotting using matplotlib, and/or numpy for a specific task.
-You need to have a numpy array with variable "plt_figure" as the final line (e.g. psudeo code: plt_figure = plot).
+Every open matplotlib figure is captured automatically after the code runs, so do not convert it to an array or call plt.show().
+For large dataframes use the predefined helpers instead of plotting every row: bin2d(x, y) -> (values, xedges, yedges) for ax.pcolormesh,
+lttb(x, y, n_out=2000) -> (x, y) for line plots, stratified_sample(df, by, n=10000) for scatter plots by category.
 The task is delimited by ```.
                                                                         
 A simple plotting example is given below:
 fig, ax = plt.subplots()
-ax.plot([1, 2, 3], [4, 5, 6]) 
-fig.canvas.draw()
-
-# Convert the canvas to a raw RGB buffer
-buf = fig.canvas.tostring_rgb()
-ncols, nrows = fig.canvas.get_width_height()
-plt_figure = np.frombuffer(buf, dtype=np.uint8).reshape(nrows, ncols, 3)
+ax.plot([1, 2, 3], [4, 5, 6])
 
 Task:
 ```{task}```
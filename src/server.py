@@ -1,47 +1,461 @@
-from fastmcp import FastMCP
+import time
+STARTED = time.perf_counter() # imports are the bulk of the cold start, timed from here
+from fastmcp import FastMCP, Context
+from fastmcp.server.middleware import Middleware
+from starlette.responses import PlainTextResponse
+from starlette.middleware import Middleware as ASGIMiddleware
 import pandas as pd
 import base64
-from io import StringIO
-from utils import csv_encoding, base64encoding
-from langchain_experimental.tools import PythonAstREPLTool
-import numpy as np
+import asyncio
+import json
+import copy
+import os
+import threading
+from utils import read_table, encode_table, TABLE_FORMATS
+from pydantic import AnyUrl
+import uploads
+from sessions import SessionStore
+from execution import execute, warm_up as warm_up_execution
+from cache import ResultCache, is_cacheable, normalize_code, import_statements, content_version, next_version, reads_only_df, is_deterministic
+from plotting import PlotStore, MIME_TYPES
+import ast
+from workers import WorkerPool, WorkerNamespace, WORKERS, write_frame, read_frame, remove_frame
+from profiling import DatasetProfile
+from lazyframe import LazyFrame, OUT_OF_CORE_BYTES, convert_to_parquet
+from optimize import OPTIMIZE, optimize_frame
+from delta import FrameDigest, diff, DELTA_HISTORY
+from metrics import metrics, current_trace, new_trace_id, resource_label, PROMETHEUS
+import vectorize
+from versions import share_unchanged, label
 
 # instantiate the server
 mcp = FastMCP("EDA Agent")
 
-df = None
-plots = []
+# dataframes and plots are kept per MCP session
+# with workers, session namespaces live in the worker processes and report back with every result
+store = SessionStore(new_namespace=lambda session_id: WorkerNamespace(lambda: pool, session_id) if WORKERS > 0 else None)
+
+pool = None # worker processes, started in the background at startup or on first use
+pool_lock = threading.Lock()
+# execute_code_geninfo outputs keyed on (dataframe content version, normalized code), shared by all sessions
+results = ResultCache()
+# rendered plots by content hash, and the plot ids produced by (dataframe content version, normalized code)
+plot_store = PlotStore()
+plot_results = ResultCache()
+# encoded dataframe exports keyed on (dataframe content version, export options), only invalidated by a new version
+exports = ResultCache(max_entries=int(os.environ.get("EDA_EXPORT_CACHE_ENTRIES", 8)))
+
+def get_session(ctx: Context):
+    return store.get(ctx.session_id if ctx is not None else "default")
+
+
+class MetricsMiddleware(Middleware):
+    """Times every tool call and resource read and records their payload sizes, under the session's current trace id"""
+    async def on_call_tool(self, context, call_next):
+        name = context.message.name
+        current_trace.set(get_session(context.fastmcp_context).trace_id)
+        metrics.observe_bytes("request_bytes", len(json.dumps(context.message.arguments or {}, default=str)), tool=name)
+        with metrics.span("tool", tool=name):
+            result = await call_next(context)
+        metrics.observe_bytes("response_bytes", sum(len(getattr(block, "text", None) or "") for block in result.content or []), tool=name)
+        return result
+
+    async def on_read_resource(self, context, call_next):
+        uri = resource_label(context.message.uri)
+        current_trace.set(get_session(context.fastmcp_context).trace_id)
+        with metrics.span("resource", resource=uri):
+            result = await call_next(context)
+        metrics.observe_bytes("response_bytes", sum(len(contents.content) for contents in result), resource=uri)
+        return result
+
+mcp.add_middleware(MetricsMiddleware())
+
+class ClosedSessionMiddleware():
+    """ASGI middleware dropping a session's data as soon as its client closes the MCP session (HTTP DELETE), not after EDA_SESSION_TTL"""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        await self.app(scope, receive, send)
+        if scope["type"] == "http" and scope["method"] == "DELETE":
+            session_id = dict(scope["headers"]).get(b"mcp-session-id")
+            if session_id is not None:
+                store.drop(session_id.decode())
+
+def get_pool():
+    global pool
+    with pool_lock: # the startup warm-up and the first tool call may race
+        if pool is None and WORKERS > 0:
+            pool = WorkerPool()
+    return pool
+
+def warm_up():
+    """
+    Starts the worker processes (which preload pandas, the REPL tool and pyplot) or, without workers, imports
+    the code execution libraries in-process, so the first tool call doesn't pay for it
+    """
+    with metrics.span("startup", phase="warm_up"):
+        if get_pool() is None:
+            warm_up_execution()
+
+async def notify_updated(ctx: Context, *uris: str):
+    """Tells the client which resources changed so it only re-reads those (best effort)"""
+    for uri in uris:
+        try:
+            await ctx.session.send_resource_updated(AnyUrl(uri))
+        except Exception:
+            pass
+
+def load_dataframe(session, df: pd.DataFrame, data_version: str):
+    """Makes df the session dataframe (fresh upload), shrinking its dtypes and profiling it once up-front"""
+    if OPTIMIZE and not isinstance(df, LazyFrame):
+        with metrics.span("optimize"):
+            df, session.optimization = optimize_frame(df)
+    store.set_df(session, df)
+    metrics.observe_bytes("dataframe_bytes", session.nbytes)
+    session.data_version = data_version
+    with metrics.span("profile"):
+        session.profile = DatasetProfile(df)
+    with metrics.span("digest"):
+        session.digest = FrameDigest(df) if not isinstance(df, LazyFrame) else None
+    session.deltas.clear()
+    session.history.clear()
+    if not isinstance(df, LazyFrame): # out-of-core data is read-only, there is nothing to undo
+        snapshot(session, "upload")
+
+def snapshot(session, description: str):
+    """Records the session's current dataframe (with its profile and digest) in its version history"""
+    session.history.push(session.df, session.data_version, session.profile, session.optimization, session.digest, description)
+
+def memory_report(session) -> dict:
+    """Short form of the optimization report for tool results"""
+    report = session.optimization
+    if report is None:
+        return None
+    return {"before_bytes": report["before_bytes"], "after_bytes": report["after_bytes"], "converted_columns": len(report["converted"])}
+
+def record_delta(session, df: pd.DataFrame, changed: list, base_version: str, digest: FrameDigest = None):
+    """
+    Diffs the new version against the previous one's block hashes and keeps the delta for clients to sync from.
+    digest is the new version's digest when it is already known (switching to a version from the history)
+    """
+    digest = digest or FrameDigest(df, session.digest, changed)
+    delta = diff(session.digest, digest, df) if session.digest is not None else None
+    session.digest = digest
+    if delta is None or base_version == session.data_version:
+        session.deltas.clear() # clients on older versions download everything again
+        return
+    session.deltas[base_version] = {**delta, "base_version": base_version, "version": session.data_version}
+    while len(session.deltas) > DELTA_HISTORY:
+        session.deltas.popitem(last=False)
+
+def store_modified(session, df: pd.DataFrame, code: str) -> tuple:
+    """
+    Stores a modified dataframe. Columns the code changed are profiled and dtype-optimized again.
+    Returns the names of the changed columns, whether optimizing replaced df and whether anything changed.
+    Code that failed or changed nothing keeps the stored frame and its data_version and takes no undo step
+    """
+    previous = session.df
+    if not session.history and previous is not None: # the history was dropped when the session was spilled
+        snapshot(session, "reloaded")
+    with metrics.span("profile"):
+        changed = session.profile.update(df)
+    # a frame read back from a worker has its own buffers, the columns it didn't change are shared with the previous version again
+    df = share_unchanged(previous, df, changed)
+    if previous is not None and not changed and df.index.identical(previous.index) and df.columns.identical(previous.columns):
+        return changed, False, False
+    optimized = False
+    if OPTIMIZE and changed:
+        with metrics.span("optimize"):
+            df, report = optimize_frame(df, changed)
+        if report["converted"]:
+            optimized = True
+            session.profile.update(df) # the converted columns' dtypes changed
+            previous = session.optimization or {"converted": {}}
+            session.optimization = {**report, "converted": {**previous["converted"], **report["converted"]}}
+    store.set_df(session, df)
+    metrics.observe_bytes("dataframe_bytes", session.nbytes)
+    base_version, session.data_version = session.data_version, next_version(session.data_version, code)
+    with metrics.span("delta"):
+        record_delta(session, df, changed, base_version)
+    snapshot(session, label(code))
+    return changed, optimized, True
+
+def restore(session, version) -> list:
+    """
+    Makes a version from the history the session dataframe again. Nothing is re-run, re-profiled or re-optimized:
+    the version's frame, profile and digest are reused. Returns the names of the columns that differ
+    """
+    before, after = session.profile.fingerprints, version.profile.fingerprints
+    changed = [name for name in after if before.get(name) != after[name]] + [name for name in before if name not in after]
+    base_version = session.data_version
+    store.set_df(session, version.df.copy(deep=False))
+    session.profile = copy.copy(version.profile)
+    session.optimization = version.optimization
+    session.data_version = version.data_version
+    with metrics.span("delta"):
+        record_delta(session, session.df, changed, base_version, version.digest)
+    return changed
+
+def changed_summary(profile, changed: list) -> str:
+    """The refreshed profile of the columns that changed, so the agent doesn't have to inspect them again"""
+    return "\n".join(profile.column_summary(name) if name in profile.columns else f"- {name}: dropped" for name in changed)
+
+def frame_for_workers(session, df):
+    """Writes the session dataframe for the workers to memory-map (once per dataframe version)"""
+    if isinstance(df, LazyFrame):
+        return df.path # workers open the same parquet file
+    if session.frame_version != session.version:
+        session.retire_frame(session.frame_path)
+        with metrics.span("frame_write"):
+            session.frame_path = write_frame(df, f"{session.session_id}-{session.version}")
+        session.frame_version = session.version
+    return session.frame_path
+
+async def run_code(session, kind: str, code: str, independent: bool = False) -> dict:
+    """
+    Runs tool code off the event loop: in a worker process when the pool is enabled, otherwise in a thread
+    against the session namespace. A modified dataframe is stored back in the session.
+    independent calls (read-only code that doesn't use earlier variables) may run on any idle worker,
+    in parallel with the session's other calls.
+    """
+    def record_timings(result):
+        # spans timed where the code ran (possibly a worker process)
+        for span, seconds in result.pop("timings", {}).items():
+            metrics.record_span(span, seconds, kind=kind)
+
+    def run_worker(*args, **kwargs):
+        with metrics.span("worker", kind=kind): # includes sending the call and result between processes
+            result = pool.run(session.session_id, kind, code, *args, **kwargs)
+        if "Error" in result:
+            raise RuntimeError(result["Error"])
+        record_timings(result)
+        vectorize.record(result.get("vectorize", {}).get("rewritten")) # counted in the worker's process otherwise
+        namespace = result.pop("namespace", None)
+        if namespace is not None: # only reported by the session's own worker
+            session.namespace.update(namespace)
+        return result
+
+    def run_independent():
+        with session.lock:
+            frame_path = frame_for_workers(session, store.get_df(session))
+            # a modifying call may replace the frame while this one runs, its file stays until this call is done
+            session.hold_frame(frame_path)
+        try:
+            return run_worker(frame_path, any_worker=True)
+        finally:
+            session.release_frame(frame_path)
+
+    def run():
+        with session.lock: # one call at a time per session
+            df = store.get_df(session)
+            if get_pool() is None:
+                # modifications get a shallow copy-on-write copy, the previous version stays intact for undo
+                result = execute(session.namespace, kind, code, df.copy(deep=False) if kind == "modifying" else df)
+                record_timings(result)
+                if "df" in result:
+                    result["changed_columns"], _, result["modified"] = store_modified(session, result["df"], code)
+                return result
+
+            result = run_worker(frame_for_workers(session, df))
+            if "frame_path" in result:
+                with metrics.span("frame_read"):
+                    df = read_frame(result["frame_path"])
+                result["changed_columns"], optimized, result["modified"] = store_modified(session, df, code)
+                session.retire_frame(session.frame_path)
+                if optimized: # the worker's frame has the old dtypes, write it again on the next call
+                    remove_frame(result["frame_path"])
+                    session.frame_path = session.frame_version = None
+                else: # the worker already wrote this version, no need to write it again
+                    session.frame_path, session.frame_version = result["frame_path"], session.version
+            return result
+    if independent and kind != "modifying" and get_pool() is not None:
+        return await asyncio.to_thread(run_independent)
+    return await asyncio.to_thread(run)
 
 @mcp.tool()
-def upload_csv(base64_csv: str):
+def upload_csv(base64_csv: str, ctx: Context):
     """Tool for uploading a csv file and saving it in memory"""
-    decoded_str = base64.b64decode(base64_csv).decode('utf-8')
-    global df # signals to modify the global df
-    df = pd.read_csv(StringIO(decoded_str))
+    session = get_session(ctx)
+    with metrics.span("base64", direction="decode"):
+        data = base64.b64decode(base64_csv)
+    # parse the raw bytes directly with pyarrow (no utf-8 decode + StringIO copy)
+    with metrics.span("parse", format="csv"):
+        df = read_table(data, "csv")
+    load_dataframe(session, df, content_version(data))
+    return {
+        "Message": "CSV file read successfully",
+        "optimization": memory_report(session)
+    }
+
+@mcp.tool()
+def upload_data(data: str, ctx: Context, file_format: str = "parquet"):
+    """
+    Tool for uploading a dataset as base64 encoded parquet, arrow (IPC) or csv bytes and saving it in memory.
+    Parquet/arrow payloads are columnar and compressed so they are parsed without a text round-trip.
+    """
+    try:
+        session = get_session(ctx)
+        with metrics.span("base64", direction="decode"):
+            data = base64.b64decode(data)
+        with metrics.span("parse", format=file_format):
+            df = read_table(data, file_format)
+        load_dataframe(session, df, content_version(data))
+    except Exception as e:
+        return {"Error": str(e)}
+    return {
+        "Message": f"{file_format} data read successfully",
+        "shape": list(df.shape),
+        "optimization": memory_report(session)
+    }
+
+@mcp.tool()
+def begin_upload(file_format: str = "csv", total_size: int = None):
+    """
+    Starts a chunked upload of a parquet, arrow or csv file.
+    Returns an upload_id to pass to append_chunk and commit_upload, and the recommended chunk size in bytes.
+    """
+    if file_format.lower() not in TABLE_FORMATS:
+        return {"Error": f"Unsupported format '{file_format}'. Expected one of {', '.join(TABLE_FORMATS)}"}
+    upload = uploads.begin(file_format.lower(), total_size)
+    return {
+        "upload_id": upload.upload_id,
+        "offset": 0,
+        "chunk_size": uploads.CHUNK_SIZE
+    }
+
+@mcp.tool()
+def append_chunk(upload_id: str, offset: int, data: str, checksum: str = None):
+    """
+    Appends a base64 encoded chunk of raw file bytes at the given byte offset.
+    checksum is the optional sha256 hex digest of the decoded chunk. Returns the next expected offset.
+    """
+    try:
+        upload = uploads.get(upload_id)
+        return {"offset": upload.append(offset, base64.b64decode(data), checksum)}
+    except (KeyError, ValueError) as e:
+        return {"Error": str(e)}
+
+@mcp.tool()
+def upload_status(upload_id: str):
+    """Returns the number of bytes received so far for an upload so an interrupted upload can resume from there"""
+    try:
+        return uploads.get(upload_id).status()
+    except KeyError as e:
+        return {"Error": str(e)}
+
+@mcp.tool()
+def commit_upload(upload_id: str, ctx: Context, checksum: str = None, out_of_core: bool = None):
+    """
+    Finishes a chunked upload and loads the file as the dataframe.
+    checksum is the optional sha256 hex digest of the whole file.
+    out_of_core keeps the data on disk and streams it instead of loading it into memory (read-only);
+    by default files over EDA_OUT_OF_CORE_BYTES are out-of-core.
+    """
+    try:
+        upload = uploads.get(upload_id)
+        session = get_session(ctx)
+        path = upload.finish(checksum)
+        if out_of_core is None:
+            out_of_core = os.path.getsize(path) > OUT_OF_CORE_BYTES
+        with metrics.span("parse", format=upload.file_format, out_of_core=bool(out_of_core)):
+            if out_of_core:
+                df = LazyFrame(convert_to_parquet(path, upload.file_format))
+            else:
+                df = read_table(path, upload.file_format)
+        load_dataframe(session, df, upload.hash.hexdigest())
+    except Exception as e:
+        return {"Error": str(e)}
+    uploads.remove(upload_id)
     return {
-        "Message": "CSV file read successfully"
+        "Message": f"{upload.file_format} data read successfully",
+        "shape": list(df.shape),
+        "out_of_core": isinstance(df, LazyFrame),
+        "optimization": memory_report(session)
     }
 
+def export(session, file_format: str = "csv", compression: str = None, columns: list = None, start: int = None, stop: int = None) -> str:
+    """Base64 encoded export of (a slice of) the session dataframe, encoded once per dataframe version"""
+    key = (session.data_version, file_format, compression, tuple(columns) if columns else None, start, stop)
+    encoded = exports.get(key) if session.data_version is not None else None
+    if encoded is None:
+        df = store.get_df(session)
+        if df is None:
+            return None
+        if columns:
+            df = df[columns]
+        if isinstance(df, LazyFrame):
+            if start is None and stop is None:
+                raise ValueError("Out-of-core datasets are only exported in row ranges (start, stop)")
+            df = df.slice(start, stop) # reads just the overlapping row groups
+        elif start is not None or stop is not None:
+            df = df.iloc[start:stop]
+        with metrics.span("encode", format=file_format):
+            data = encode_table(df, file_format, compression)
+        with metrics.span("base64", direction="encode"):
+            encoded = base64.b64encode(data).decode()
+        metrics.observe_bytes("export_bytes", len(data), format=file_format)
+        exports.put(key, encoded)
+    return encoded
+
 @mcp.resource("resource://csv_file")
-def get_csv():
+def get_csv(ctx: Context):
     """Provides the csv file as base64 encoded string"""
-    if df is not None:
-        return csv_encoding(df)
-    return None
+    return export(get_session(ctx))
+
+@mcp.resource("resource://csv_file/{start}/{stop}")
+def get_csv_rows(start: int, stop: int, ctx: Context):
+    """Provides rows [start, stop) of the csv file as base64 encoded string"""
+    return export(get_session(ctx), start=int(start), stop=int(stop))
 
 @mcp.tool()
-def execute_code_geninfo(code: str):
+def export_data(ctx: Context, file_format: str = "csv", compression: str = None, columns: list[str] = None, start: int = None, stop: int = None):
+    """
+    Exports the dataframe as base64 encoded csv, parquet or arrow bytes.
+    Optionally compressed (gzip or zstd), projected to some columns and limited to the rows [start, stop).
+    The result also carries the dataframe version so unchanged data does not need to be downloaded again.
+    """
+    session = get_session(ctx)
+    try:
+        data = export(session, file_format.lower(), compression, columns, start, stop)
+    except (KeyError, ValueError, ImportError) as e:
+        return {"Error": str(e)}
+    if data is None:
+        return {"Error": "No csv file uploaded. Please upload csv file first"}
+    return {
+        "data": data,
+        "file_format": file_format,
+        "compression": compression,
+        "version": session.data_version
+    }
+
+@mcp.tool()
+async def execute_code_geninfo(code: str, ctx: Context):
     """
     Tool for executing code that involves asking a question about the dataframe (e.g. who is the oldest person or what is the standard deviation of column x). It expects code generated from the CodeGeneration tool.
+    Variables, imports and functions defined in earlier calls are kept, so earlier results can be reused.
     Returns a string representing the output
     """
     try:
-        if df is not None:
-            code_execution_tool = PythonAstREPLTool(locals={"df": df, "pd": pd, "np": np})
-            output = code_execution_tool.invoke(code) # execute the code
-            return {
-                "output": output
-            }
+        session = get_session(ctx)
+        if store.get_df(session) is not None:
+            key = (session.data_version, normalize_code(code)) if is_cacheable(code) else None
+            output = results.get(key) if key is not None else None
+            if output is not None:
+                if import_statements(code):
+                    await run_code(session, "geninfo", import_statements(code)) # later calls may rely on the imports
+                vectorized = {}
+            else:
+                executed = await run_code(session, "geninfo", code) # execute the code
+                output, vectorized = executed["output"], executed.get("vectorize", {})
+                if key is not None:
+                    results.put(key, output)
+            # long outputs come back as a head/tail preview, the full text is kept to read page by page
+            result = session.outputs.govern(output)
+            if result.get("truncated"):
+                result["Message"] = (f"Output truncated ({result['chars']} characters). Print a summary instead, "
+                                     f"or read it with read_output(output_id, page) for pages 0 to {result['pages'] - 1}")
+            return {**result, **vectorized}
         else:
             return {
                 "Error": "No csv file uploaded. Please upload csv file first"
@@ -51,19 +465,33 @@ def execute_code_geninfo(code: str):
 
 
 @mcp.tool()
-def execute_code_modifying(code: str):
+async def execute_code_modifying(code: str, ctx: Context):
     """
     Tool for executing code involving dataframe 'df' modification.
+    Variables, imports and functions defined in earlier calls are kept, so earlier results can be reused.
     Returns a base64 encoded file representing a new csv file and internally modifies the dataframe
     """
     try:
-        global df
-        if df is not None:
-            code_execution_tool = PythonAstREPLTool(locals={"df": df, "pd": pd, "np": np})
-            code_execution_tool.invoke(code) # execute the code
-            df = code_execution_tool.locals['df']
+        session = get_session(ctx)
+        if isinstance(store.get_df(session), LazyFrame):
+            return {
+                "Error": "The dataset is out-of-core (read-only). Compute the result you need with execute_code_geninfo instead"
+            }
+        if store.get_df(session) is not None:
+            result = await run_code(session, "modifying", code) # execute the code
+            await notify_updated(ctx, "resource://csv_file", "resource://profile")
+            # the REPL reports exceptions as output: a failed call shows its error here
+            output = session.outputs.govern(result["output"])
+            if not result["modified"]:
+                return {"Message": "df was not modified", **output, **result.get("vectorize", {})}
+            profile = session.profile
             return {
-                "Message": "df modified successfully"
+                "Message": "df modified (undo reverts it)",
+                "version": session.history.current().number,
+                "shape": [profile.rows, len(profile.columns)],
+                "changed_columns": changed_summary(profile, result["changed_columns"]),
+                **output,
+                **result.get("vectorize", {})
             }
         else:
             return {
@@ -74,20 +502,34 @@ def execute_code_modifying(code: str):
 
 
 @mcp.tool()
-def execute_code_plotting(code: str):
+async def execute_code_plotting(code: str, ctx: Context):
     """
         "Tool for executing code that involves asking a question about the dataframe (e.g. who is the oldest person or what is the standard deviation of column x). It expects code generated from the CodeGeneration tool.
+        Variables, imports and functions defined in earlier calls are kept, so earlier results can be reused.
         Returns a string representing the output
     """
     try:
-        if df is not None:
-            global plots
-            plots = []
-            code_execution_tool = PythonAstREPLTool(locals={"df": df, "pd": pd, "np": np})
-            code_execution_tool.invoke(code) # execute the code
-            plots.append(base64encoding(code_execution_tool.locals['plt_figure'])) # add the plot
+        session = get_session(ctx)
+        if store.get_df(session) is not None:
+            tree = ast.parse(code)
+            independent = reads_only_df(tree)
+            key = (session.data_version, normalize_code(code)) if independent and is_deterministic(tree) else None
+            plot_ids = plot_results.get(key) if key is not None else None
+            vectorized = {}
+            if plot_ids is None or not all(plot_id in plot_store for plot_id in plot_ids):
+                # plots that only read df can render on any idle worker, in parallel with other plot calls
+                result = await run_code(session, "plotting", code, independent=independent) # execute the code
+                vectorized = result.get("vectorize", {})
+                plot_ids = [plot_store.put(plot) for plot in result["plots"]] # identical plots are stored once
+                if key is not None:
+                    plot_results.put(key, plot_ids)
+            # plots accumulate over the turn (start_turn clears them)
+            session.plots = session.plots + [plot_id for plot_id in plot_ids if plot_id not in session.plots]
+            session.plots_version += 1
+            await notify_updated(ctx, "resource://plots")
             return {
-                "Message": "plots generated successfully"
+                "Message": f"{len(plot_ids)} plots generated successfully",
+                **vectorized
             }
         else:
             return {
@@ -96,15 +538,223 @@ def execute_code_plotting(code: str):
     except Exception as e:
         return {"Message": e}
 
+async def switch_version(ctx: Context, pick) -> dict:
+    """Makes the version pick(history) returns the session dataframe"""
+    session = get_session(ctx)
+    def run():
+        with session.lock: # waits for the session's running tool call
+            df = store.get_df(session)
+            if df is None or isinstance(df, LazyFrame):
+                raise KeyError("No modifiable dataframe uploaded. Please upload csv file first")
+            if not session.history:
+                raise KeyError("No earlier versions are kept (the history is dropped when the session is spilled to disk)")
+            version = pick(session.history)
+            return version, restore(session, version)
+    try:
+        version, changed = await asyncio.to_thread(run)
+    except KeyError as e:
+        return {"Error": e.args[0]}
+    await notify_updated(ctx, "resource://csv_file", "resource://profile")
+    profile = session.profile
+    history = session.history
+    return {
+        "Message": f"df is now version {version.number} ({version.label})",
+        "version": version.number,
+        "shape": [profile.rows, len(profile.columns)],
+        "changed_columns": changed_summary(profile, changed),
+        "can_undo": history.position,
+        "can_redo": len(history) - 1 - history.position
+    }
+
+@mcp.tool()
+async def undo(ctx: Context, steps: int = 1):
+    """
+    Reverts the dataframe to how it was before the last execute_code_modifying call (or steps calls back).
+    Use it when a modification went wrong instead of asking for the file again: it takes milliseconds
+    """
+    return await switch_version(ctx, lambda history: history.move(-int(steps)))
+
+@mcp.tool()
+async def redo(ctx: Context, steps: int = 1):
+    """Re-applies modifications reverted by undo. A new modification after an undo drops what could be redone"""
+    return await switch_version(ctx, lambda history: history.move(int(steps)))
+
+@mcp.tool()
+async def checkout(version: int, ctx: Context):
+    """Switches the dataframe to a kept version by its number (returned by execute_code_modifying and list_versions)"""
+    return await switch_version(ctx, lambda history: history.checkout(int(version)))
+
+@mcp.tool()
+def list_versions(ctx: Context):
+    """Lists the kept dataframe versions: number, the first line of the code that made it, shape and memory"""
+    return get_session(ctx).history.describe()
+
+@mcp.tool()
+def read_output(output_id: str, ctx: Context, page: int = 0):
+    """
+    Reads one page of a long execute_code_geninfo output that was truncated (output_id is in its result).
+    Prefer printing a more specific summary over reading many pages
+    """
+    try:
+        return get_session(ctx).outputs.page(output_id, int(page))
+    except KeyError as e:
+        return {"Error": e.args[0]}
+
+@mcp.tool()
+async def start_turn(ctx: Context, trace_id: str = None):
+    """
+    Called by the app before each user message: clears the plots of the previous turn.
+    trace_id tags the spans of every call until the next turn (one is generated when not given)
+    """
+    session = get_session(ctx)
+    session.trace_id = trace_id or new_trace_id()
+    session.plots = []
+    session.plots_version += 1
+    await notify_updated(ctx, "resource://plots")
+    return {"Message": "turn started", "trace_id": session.trace_id}
+
+@mcp.resource("resource://delta/{base_version}")
+def get_delta(base_version: str, ctx: Context):
+    """
+    Provides the deltas that bring a copy of the dataframe at base_version up to the current version:
+    added/dropped/retyped columns sent whole and only the changed row blocks of the other columns,
+    as base64 parquet. Apply them in order. When base_version is too old, full is true and the
+    dataframe has to be downloaded again.
+    """
+    session = get_session(ctx)
+    deltas, version = [], base_version
+    while version != session.data_version:
+        delta = session.deltas.get(version)
+        if delta is None:
+            return {"Error": f"No delta from version {base_version}", "full": True, "version": session.data_version}
+        deltas.append(delta)
+        version = delta["version"]
+    return {"version": session.data_version, "deltas": deltas}
+
+@mcp.resource("resource://outputs/{output_id}/{page}")
+def get_output_page(output_id: str, page: int, ctx: Context):
+    """Provides one page of a truncated execute_code_geninfo output, with the number of pages"""
+    try:
+        return get_session(ctx).outputs.page(output_id, int(page))
+    except KeyError as e:
+        return {"Error": e.args[0]}
+
 @mcp.resource("resource://plots")
-def get_plots():
+def get_plots(ctx: Context):
     """
-    provides a list of plots encoded as base64 strings
+    provides the list of current plots: their ids, formats and base64 encoded thumbnails.
+    The full images are read from resource://plots/{plot_id}
     """
-    global plots
+    plots = []
+    for plot_id in get_session(ctx).plots:
+        plot = plot_store.get(plot_id)
+        if plot is not None:
+            plots.append({"id": plot_id, "format": plot["format"], "thumbnail": base64.b64encode(plot["thumbnail"]).decode()})
     return {
         "plots": plots
     }
 
+@mcp.resource("resource://plots/{plot_id}")
+def get_plot(plot_id: str):
+    """provides a single plot image as base64 encoded bytes. Plot ids are content hashes so the image never changes"""
+    plot = plot_store.get(plot_id)
+    if plot is None:
+        return None
+    return {"id": plot_id, "format": plot["format"], "mime_type": MIME_TYPES.get(plot["format"]), "data": base64.b64encode(plot["data"]).decode()}
+
+@mcp.resource("resource://profile")
+def get_profile(ctx: Context):
+    """
+    Provides the dataset profile: rows, and per column the dtype, null count, cardinality and range or top values.
+    summary is the compact text form used in the agent's system prompt.
+    """
+    profile = get_session(ctx).profile
+    if profile is None:
+        return {"Error": "No csv file uploaded. Please upload csv file first"}
+    return profile.to_dict()
+
+@mcp.resource("resource://optimization")
+def get_optimization(ctx: Context):
+    """
+    Provides the result of the dtype optimization done at ingest and after modifications:
+    dataframe memory before and after the latest optimization pass, and every column converted so far (integer downcasts, categories,
+    arrow strings, parsed datetimes)
+    """
+    session = get_session(ctx)
+    return session.optimization or {"before_bytes": session.nbytes, "after_bytes": session.nbytes, "converted": {}}
+
+@mcp.resource("resource://history")
+def get_history(ctx: Context):
+    """
+    Provides the session's dataframe versions for undo/redo/checkout with their memory: nbytes of each version,
+    unique_bytes held by no other kept version, and extra_bytes the history holds on top of the current version
+    """
+    return get_session(ctx).history.describe()
+
+@mcp.resource("resource://namespace")
+def get_namespace(ctx: Context):
+    """Provides the variables kept in the session's execution namespace with their types and sizes"""
+    return get_session(ctx).namespace.describe()
+
+@mcp.resource("resource://versions")
+def get_versions(ctx: Context):
+    """
+    Provides the current version of each changing resource, keyed by uri.
+    Clients compare these with the versions they last read to only fetch what changed.
+    """
+    session = get_session(ctx)
+    return {
+        "resource://csv_file": session.data_version,
+        "resource://profile": session.data_version,
+        "resource://plots": session.plots_version
+    }
+
+@mcp.resource("resource://cache")
+def get_cache_stats():
+    """Provides the hit/miss counters of the execute_code_geninfo result cache"""
+    return results.stats()
+
+@mcp.resource("resource://memory")
+def get_memory():
+    """Provides the dataframe memory usage of the server: sessions in memory, spilled sessions and the byte budget"""
+    return store.stats()
+
+def cache_stats() -> dict:
+    return {"results": results.stats(), "plots": plot_results.stats(), "exports": exports.stats()}
+
+@mcp.resource("resource://metrics")
+def get_metrics():
+    """
+    Provides the server metrics: histograms (count, sum, mean, min, max, p50/p95/p99) of the span durations
+    (tools, resources, code execution, plot rendering, encoding, base64, profiling, ...) and payload sizes,
+    the most recent spans with their trace ids, the cache hit rates, the dataframe memory and how often
+    each vectorization rule rewrote generated code
+    """
+    return {**metrics.snapshot(), "caches": cache_stats(), "memory": store.stats(), "vectorize": vectorize.stats()}
+
+@mcp.resource("resource://traces/{trace_id}")
+def get_trace(trace_id: str):
+    """Provides the spans recorded under one trace id (start_turn), oldest first"""
+    return {"trace_id": trace_id, "spans": metrics.trace(trace_id)}
+
+if PROMETHEUS:
+    @mcp.custom_route("/metrics", methods=["GET"])
+    async def prometheus_metrics(request):
+        """The metrics in Prometheus text format, with the cache and memory figures as gauges"""
+        memory = store.stats()
+        caches = cache_stats()
+        return PlainTextResponse(metrics.prometheus({
+            "cache_hit_rate": [({"cache": name}, stats["hit_rate"]) for name, stats in caches.items()],
+            "cache_entries": [({"cache": name}, stats["entries"]) for name, stats in caches.items()],
+            "dataframe_memory_bytes": [({}, memory["memory_bytes"])],
+            "dataframe_memory_budget_bytes": [({}, memory["memory_budget"])],
+            "vectorize_rewrites": [({"rule": rule}, count) for rule, count in vectorize.stats().items()],
+            "sessions": [({"state": "total"}, memory["sessions"]), ({"state": "in_memory"}, memory["in_memory"]), ({"state": "spilled"}, memory["spilled"])]
+        }), media_type="text/plain; version=0.0.4")
+
+metrics.record_span("startup", time.perf_counter() - STARTED, phase="imports")
+
 if __name__ == "__main__":
-    mcp.run(transport="http", host="127.0.0.1", port=8001)
+    threading.Thread(target=warm_up, daemon=True).start()
+    mcp.run(transport="http", host=os.environ.get("EDA_HOST", "127.0.0.1"), port=int(os.environ.get("EDA_PORT", 8001)),
+            middleware=[ASGIMiddleware(ClosedSessionMiddleware)])
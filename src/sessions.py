@@ -0,0 +1,190 @@
+import os
+import time
+import tempfile
+import threading
+from collections import OrderedDict
+import pandas as pd
+from execution import ExecutionNamespace
+from workers import remove_frame
+from lazyframe import LazyFrame
+from outputs import OutputStore
+from versions import VersionHistory
+
+# global byte budget for dataframes held in memory across all sessions
+MEMORY_BUDGET = int(os.environ.get("EDA_MEMORY_BUDGET", 4 * 1024 ** 3))
+SPILL_DIR = os.environ.get("EDA_SPILL_DIR", os.path.join(tempfile.gettempdir(), "eda-agent-spill"))
+SESSION_TTL = int(os.environ.get("EDA_SESSION_TTL", 24 * 60 * 60)) # seconds before an idle session is dropped
+
+
+def frame_nbytes(df: pd.DataFrame) -> int:
+    if isinstance(df, LazyFrame):
+        return df.nbytes # only its sample is in memory
+    return int(df.memory_usage(deep=True).sum()) if df is not None else 0
+
+
+class Session():
+    """State that belongs to a single MCP client session"""
+    def __init__(self, session_id: str, namespace=None):
+        self.session_id = session_id
+        self.df = None # None while spilled to disk
+        self.nbytes = 0
+        self.version = 0 # bumped every time the dataframe is replaced
+        self.data_version = None # content version of the dataframe, shared by sessions holding the same data
+        self.spill_path = None
+        self.frame_path = None # arrow file of the dataframe shared with the worker processes
+        self.frame_version = None
+        self.frame_readers = {} # frame path -> independent calls reading it without holding the session lock
+        self.retired_frames = set() # frames replaced while still being read, removed by their last reader
+        self.frame_lock = threading.Lock()
+        self.profile = None # DatasetProfile of the current dataframe
+        self.optimization = None # memory before/after the ingest dtype optimization and the converted columns
+        self.digest = None # block hashes of the current dataframe, to diff the next version against
+        self.deltas = OrderedDict() # base data_version -> delta to the version after it, oldest first
+        self.plots = []
+        self.plots_version = 0 # bumped every time new plots are generated
+        self.trace_id = None # trace id of the current turn, tags the metrics spans
+        # warm REPL namespace shared by the session's tool calls (a WorkerNamespace when they run in a worker)
+        self.namespace = namespace if namespace is not None else ExecutionNamespace()
+        self.outputs = OutputStore() # full text of tool outputs too long to return inline
+        self.history = VersionHistory() # earlier dataframe versions to undo to, sharing unchanged columns
+        self.last_active = time.monotonic()
+        self.lock = threading.RLock() # serializes tool calls within the session
+
+    def hold_frame(self, path: str):
+        with self.frame_lock:
+            self.frame_readers[path] = self.frame_readers.get(path, 0) + 1
+
+    def release_frame(self, path: str):
+        with self.frame_lock:
+            self.frame_readers[path] -= 1
+            if self.frame_readers[path] == 0:
+                del self.frame_readers[path]
+                if path in self.retired_frames:
+                    self.retired_frames.discard(path)
+                    remove_frame(path)
+
+    def retire_frame(self, path: str):
+        """Removes a frame file the session moved on from, or leaves it to the last independent call still reading it"""
+        with self.frame_lock:
+            if path in self.frame_readers:
+                self.retired_frames.add(path)
+            else:
+                remove_frame(path)
+
+
+class SessionStore():
+    """
+    Session-keyed dataframe store. Sessions are kept in LRU order and when the dataframes
+    in memory go over the byte budget the least recently used ones are spilled to parquet.
+    A spilled dataframe is reloaded the next time its session asks for it.
+    """
+    def __init__(self, memory_budget: int = MEMORY_BUDGET, spill_dir: str = SPILL_DIR, new_namespace=None):
+        self.memory_budget = memory_budget
+        self.spill_dir = spill_dir
+        self.new_namespace = new_namespace # session_id -> namespace of a new session, an ExecutionNamespace by default
+        self.sessions = OrderedDict() # session_id -> Session, least recently used first
+        self.lock = threading.RLock()
+
+    def get(self, session_id: str) -> Session:
+        """Returns the session (creating it if needed) and marks it as most recently used"""
+        with self.lock:
+            self.expire()
+            session = self.sessions.get(session_id)
+            if session is None:
+                namespace = self.new_namespace(session_id) if self.new_namespace is not None else None
+                session = self.sessions[session_id] = Session(session_id, namespace)
+            self.sessions.move_to_end(session_id)
+            session.last_active = time.monotonic()
+            return session
+
+    def get_df(self, session: Session) -> pd.DataFrame:
+        """Returns the session dataframe, reloading it from disk if it was spilled"""
+        with self.lock:
+            if session.df is None and session.spill_path is not None:
+                if session.spill_path.endswith(".parquet"):
+                    session.df = pd.read_parquet(session.spill_path)
+                else:
+                    session.df = pd.read_pickle(session.spill_path)
+                os.remove(session.spill_path)
+                session.spill_path = None
+                session.nbytes = frame_nbytes(session.df)
+                self.enforce_budget(keep=session)
+            return session.df
+
+    def set_df(self, session: Session, df: pd.DataFrame):
+        with self.lock:
+            if session.spill_path is not None:
+                os.remove(session.spill_path)
+                session.spill_path = None
+            if isinstance(session.df, LazyFrame) and session.df is not df:
+                session.retire_frame(session.df.path)
+            session.df = df
+            session.nbytes = frame_nbytes(df)
+            session.version += 1
+            self.enforce_budget(keep=session)
+
+    def memory_usage(self) -> int:
+        return sum(
+            (s.nbytes if s.df is not None else 0) + s.namespace.total_bytes + s.history.extra_bytes
+            for s in self.sessions.values()
+        )
+
+    def enforce_budget(self, keep: Session = None):
+        """Spills the least recently used dataframes until the store fits in the budget"""
+        for session in list(self.sessions.values()):
+            if self.memory_usage() <= self.memory_budget:
+                break
+            if session is keep or (session.df is None and session.namespace.total_bytes == 0 and not session.history):
+                continue
+            if not session.lock.acquire(blocking=False):
+                continue # busy sessions are not spilled under a running tool call
+            try:
+                self.spill(session)
+            finally:
+                session.lock.release()
+
+    def spill(self, session: Session):
+        session.namespace.reset() # intermediates and earlier versions are not persisted, only the dataframe
+        session.history.clear()
+        session.retire_frame(session.frame_path)
+        session.frame_path = session.frame_version = None
+        if session.df is None or isinstance(session.df, LazyFrame): # out-of-core data already lives on disk
+            return
+        os.makedirs(self.spill_dir, exist_ok=True)
+        path = os.path.join(self.spill_dir, f"{session.session_id}.parquet")
+        try:
+            session.df.to_parquet(path)
+        except Exception:
+            # parquet needs string column names and arrow-compatible dtypes
+            path = path.replace(".parquet", ".pkl")
+            session.df.to_pickle(path)
+        session.spill_path = path
+        session.df = None
+
+    def expire(self):
+        """Drops sessions that have been idle for longer than SESSION_TTL"""
+        now = time.monotonic()
+        for session_id in [k for k, s in self.sessions.items() if now - s.last_active > SESSION_TTL]:
+            self.drop(session_id)
+
+    def drop(self, session_id: str):
+        """Forgets a session and deletes its files (a no-op for unknown sessions)"""
+        with self.lock:
+            session = self.sessions.pop(session_id, None)
+        if session is None:
+            return
+        session.namespace.reset() # frees it in the worker too
+        if session.spill_path is not None and os.path.exists(session.spill_path):
+            os.remove(session.spill_path)
+        if isinstance(session.df, LazyFrame):
+            session.retire_frame(session.df.path)
+        session.retire_frame(session.frame_path)
+
+    def stats(self) -> dict:
+        return {
+            "sessions": len(self.sessions),
+            "in_memory": sum(1 for s in self.sessions.values() if s.df is not None),
+            "spilled": sum(1 for s in self.sessions.values() if s.spill_path is not None),
+            "memory_bytes": self.memory_usage(),
+            "memory_budget": self.memory_budget
+        }
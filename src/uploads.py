@@ -0,0 +1,84 @@
+import os
+import time
+import uuid
+import hashlib
+import tempfile
+
+# chunks are spooled to disk so the server only ever holds one chunk in memory
+UPLOAD_DIR = os.environ.get("EDA_UPLOAD_DIR", os.path.join(tempfile.gettempdir(), "eda-agent-uploads"))
+CHUNK_SIZE = int(os.environ.get("EDA_UPLOAD_CHUNK_SIZE", 8 * 1024 * 1024)) # recommended chunk size in bytes
+UPLOAD_TTL = int(os.environ.get("EDA_UPLOAD_TTL", 60 * 60)) # seconds before an idle upload is discarded
+
+
+class ChunkedUpload():
+    """An in-progress upload: raw bytes appended at increasing offsets to a spool file"""
+    def __init__(self, file_format: str, total_size: int = None):
+        os.makedirs(UPLOAD_DIR, exist_ok=True)
+        self.upload_id = uuid.uuid4().hex
+        self.file_format = file_format
+        self.total_size = total_size
+        self.path = os.path.join(UPLOAD_DIR, f"{self.upload_id}.{file_format}")
+        self.offset = 0 # number of bytes received so far
+        self.hash = hashlib.sha256() # running checksum of the whole file
+        self.last_active = time.monotonic()
+        open(self.path, "wb").close()
+
+    def append(self, offset: int, chunk: bytes, checksum: str = None) -> int:
+        """Appends a chunk at the given offset and returns the new offset"""
+        self.last_active = time.monotonic()
+        if checksum is not None and hashlib.sha256(chunk).hexdigest() != checksum:
+            raise ValueError(f"Checksum mismatch for chunk at offset {offset}")
+        if offset + len(chunk) <= self.offset:
+            return self.offset # chunk was already received (client retried after a lost reply)
+        if offset != self.offset:
+            raise ValueError(f"Expected chunk at offset {self.offset}, got {offset}. Resume from upload_status")
+        with open(self.path, "ab") as f:
+            f.write(chunk)
+        self.hash.update(chunk)
+        self.offset += len(chunk)
+        return self.offset
+
+    def finish(self, checksum: str = None) -> str:
+        """Validates the received file and returns its path"""
+        if self.total_size is not None and self.offset != self.total_size:
+            raise ValueError(f"Upload incomplete: received {self.offset} of {self.total_size} bytes")
+        if checksum is not None and self.hash.hexdigest() != checksum:
+            raise ValueError("Checksum mismatch for the uploaded file")
+        return self.path
+
+    def discard(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def status(self) -> dict:
+        return {
+            "upload_id": self.upload_id,
+            "offset": self.offset,
+            "total_size": self.total_size,
+            "sha256": self.hash.hexdigest()
+        }
+
+
+uploads = {} # upload_id -> ChunkedUpload
+
+def begin(file_format: str, total_size: int = None) -> ChunkedUpload:
+    expire()
+    upload = ChunkedUpload(file_format, total_size)
+    uploads[upload.upload_id] = upload
+    return upload
+
+def get(upload_id: str) -> ChunkedUpload:
+    if upload_id not in uploads:
+        raise KeyError(f"Unknown or expired upload '{upload_id}'. Start again with begin_upload")
+    return uploads[upload_id]
+
+def remove(upload_id: str):
+    upload = uploads.pop(upload_id, None)
+    if upload is not None:
+        upload.discard()
+
+def expire():
+    """Drops uploads that have been idle for longer than UPLOAD_TTL"""
+    now = time.monotonic()
+    for upload_id in [k for k, u in uploads.items() if now - u.last_active > UPLOAD_TTL]:
+        remove(upload_id)
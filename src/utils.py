@@ -1,10 +1,13 @@
-from PIL import Image
 import numpy as np
 import io
 import base64
 import pandas as pd 
 
+# binary formats accepted by the upload tools
+TABLE_FORMATS = ("parquet", "arrow", "csv")
+
 def base64encoding(image: np.ndarray) -> str:
+    from PIL import Image # only plots need it, not the server or client startup
     pil_image = Image.fromarray(image)
     buffer = io.BytesIO()
     pil_image.save(buffer, format='PNG')
@@ -14,4 +17,70 @@ def base64encoding(image: np.ndarray) -> str:
 def csv_encoding(df: pd.DataFrame):
     csv_buffer = io.StringIO()
     df.to_csv(csv_buffer, index=False) # write into the csv buffer instead of actual disk
-    return base64.b64encode(csv_buffer.getvalue().encode()).decode() # get the base64 encoded csv
\ No newline at end of file
+    return base64.b64encode(csv_buffer.getvalue().encode()).decode() # get the base64 encoded csv
+
+def parquet_encoding(df: pd.DataFrame) -> str:
+    """Encodes a dataframe as base64 parquet bytes (much smaller than csv and no re-parse on the server)"""
+    buffer = io.BytesIO()
+    df.to_parquet(buffer, index=False)
+    return base64.b64encode(buffer.getvalue()).decode()
+
+def table_format(path: str) -> str:
+    """Guesses the table format from a file extension (defaults to csv)"""
+    extension = path.rsplit(".", 1)[-1].lower() if "." in path else ""
+    return {"parquet": "parquet", "pq": "parquet", "arrow": "arrow", "feather": "arrow", "ipc": "arrow"}.get(extension, "csv")
+
+def read_table(data, file_format: str = "csv") -> pd.DataFrame:
+    """
+    Reads a dataframe straight from raw bytes (or a file path) in one of TABLE_FORMATS.
+    Everything goes through pyarrow so no intermediate python strings are built.
+    """
+    import pyarrow as pa
+    file_format = file_format.lower()
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(data)
+    elif file_format in ("arrow", "ipc", "feather"):
+        source = pa.memory_map(data) # arrow files on disk are mapped instead of read
+    else:
+        source = data
+    if file_format == "parquet":
+        return pd.read_parquet(source)
+    if file_format in ("arrow", "ipc", "feather"):
+        # accept both the arrow file format and the streaming format
+        try:
+            table = pa.ipc.open_file(source).read_all()
+        except pa.ArrowInvalid:
+            if hasattr(source, "seek"):
+                source.seek(0)
+            table = pa.ipc.open_stream(source).read_all()
+        return table.to_pandas()
+    if file_format == "csv":
+        return pd.read_csv(source, engine="pyarrow")
+    raise ValueError(f"Unsupported format '{file_format}'. Expected one of {', '.join(TABLE_FORMATS)}")
+
+def encode_table(df: pd.DataFrame, file_format: str = "csv", compression: str = None) -> bytes:
+    """
+    Serializes a dataframe to csv, parquet or arrow bytes.
+    compression is gzip or zstd (for parquet it is the codec used inside the file).
+    """
+    file_format = file_format.lower()
+    buffer = io.BytesIO()
+    if file_format == "parquet":
+        df.to_parquet(buffer, index=False, compression=compression or "snappy")
+        return buffer.getvalue()
+    if file_format in ("arrow", "ipc", "feather"):
+        df.reset_index(drop=True).to_feather(buffer, compression=compression or "uncompressed")
+        return buffer.getvalue()
+    if file_format != "csv":
+        raise ValueError(f"Unsupported format '{file_format}'. Expected one of {', '.join(TABLE_FORMATS)}")
+    df.to_csv(buffer, index=False)
+    data = buffer.getvalue()
+    if compression == "gzip":
+        import gzip
+        return gzip.compress(data, compresslevel=5)
+    if compression == "zstd":
+        import zstandard # optional dependency, only needed for zstd csv exports
+        return zstandard.ZstdCompressor().compress(data)
+    if compression is not None:
+        raise ValueError(f"Unsupported compression '{compression}'. Expected gzip or zstd")
+    return data
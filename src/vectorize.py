@@ -0,0 +1,766 @@
+"""
+Static pre-pass over generated code. Row-wise pandas idioms (df.iterrows() loops, df.apply(..., axis=1),
+Series.apply/map with a lambda, Python loops over a column) are rewritten into the equivalent vectorized
+pandas/NumPy expressions when their bodies are simple enough (arithmetic, comparisons, conditionals,
+string methods); the ones that can't be rewritten are reported back as hints.
+"""
+import os
+import ast
+import copy
+import logging
+import threading
+from collections import Counter
+import pandas as pd
+
+VECTORIZE = os.environ.get("EDA_VECTORIZE", "rewrite") # rewrite, hint (only report) or off
+
+logger = logging.getLogger(__name__)
+
+# str methods with a pandas .str equivalent of the same name and meaning
+STRING_METHODS = {
+    "upper", "lower", "title", "capitalize", "swapcase", "casefold", "strip", "lstrip", "rstrip", "startswith", "endswith",
+    "replace", "zfill", "center", "ljust", "rjust", "find", "rfind", "split", "rsplit", "isdigit", "isalpha", "isalnum",
+    "isnumeric", "isdecimal", "isspace", "islower", "isupper", "istitle", "removeprefix", "removesuffix"
+}
+# math functions with a NumPy ufunc of the same name
+MATH_FUNCTIONS = {"sqrt", "exp", "log", "log2", "log10", "log1p", "expm1", "sin", "cos", "tan", "floor", "ceil", "trunc", "fabs", "isnan", "isinf"}
+# the ones whose result is text again, so calls can be chained (x.strip().lower())
+STRING_RESULTS = {
+    "upper", "lower", "title", "capitalize", "swapcase", "casefold", "strip", "lstrip", "rstrip", "replace", "zfill",
+    "center", "ljust", "rjust", "removeprefix", "removesuffix"
+}
+CASTS = {"str": "str", "float": "float", "int": "int", "bool": "bool"}
+FRAME_ATTRIBUTES = set(dir(pd.DataFrame))
+COLUMN_ITERATORS = {"values", "tolist", "to_list", "to_numpy", "array"}
+# dataframe methods whose result has a subset of the frame's columns with the same dtypes
+SAME_COLUMNS = {"copy", "dropna", "query", "head", "tail", "sort_values", "sort_index", "drop_duplicates", "sample", "drop", "reset_index", "set_index"}
+TEXT_SAMPLE = 100 # values looked at to tell whether an object column holds text
+
+HINTS = {
+    "iterrows": "Row-by-row loops over df.iterrows() are slow. Compute the column in one vectorized expression, "
+                "e.g. df['c'] = np.where(df['a'] > 0, df['b'] * 2, 0)",
+    "itertuples": "Loops over df.itertuples() run in Python. Use vectorized column expressions, groupby or merge instead",
+    "apply_axis1": "df.apply(..., axis=1) calls Python once per row. Combine whole columns instead (arithmetic, np.where, "
+                   "np.select for several conditions, the .str accessor for strings)",
+    "series_apply": "Series.apply/map with a Python function runs per element. Prefer vectorized operations, the .str/.dt "
+                    "accessors, np.where or a dict passed to map",
+    "index_loop": "Looping over row positions or labels with df.loc/df.at/df.iloc is slow. Assign whole columns instead, "
+                  "e.g. df.loc[mask, 'c'] = value",
+    "column_loop": "Python loops over a column are slow. Use Series methods (sum, mean, count, value_counts, cumsum) "
+                   "or boolean masks instead"
+}
+
+counts = Counter() # rule -> times it fired in this process
+counts_lock = threading.Lock()
+
+
+class Unsupported(Exception):
+    """The expression can't be vectorized safely"""
+
+
+def record(rewritten: dict):
+    """Adds the rules that fired to the process-wide counters and logs them"""
+    if not rewritten:
+        return
+    with counts_lock:
+        counts.update(rewritten)
+        totals = {rule: counts[rule] for rule in rewritten}
+    for rule, total in totals.items():
+        logger.info("vectorize rule %s fired (%d times so far)", rule, total)
+
+
+def stats() -> dict:
+    with counts_lock:
+        return dict(counts)
+
+
+def is_pure(node: ast.AST) -> bool:
+    """Names, attributes and constant subscripts only: safe to evaluate more than once"""
+    if isinstance(node, ast.Name):
+        return True
+    if isinstance(node, ast.Attribute):
+        return is_pure(node.value)
+    if isinstance(node, ast.Subscript):
+        return is_pure(node.value) and isinstance(node.slice, ast.Constant)
+    return False
+
+
+def is_text(series: pd.Series) -> bool:
+    """Whether the column holds strings, i.e. str methods of its values have a .str equivalent"""
+    dtype = series.dtype
+    if isinstance(dtype, pd.CategoricalDtype):
+        return pd.api.types.is_string_dtype(dtype.categories.dtype) or dtype.categories.dtype == object and is_text(dtype.categories.to_series())
+    if pd.api.types.is_object_dtype(dtype):
+        values = series.iloc[:TEXT_SAMPLE * 10].dropna().iloc[:TEXT_SAMPLE]
+        return len(values) > 0 and all(isinstance(v, str) for v in values)
+    return pd.api.types.is_string_dtype(dtype)
+
+
+def names_in(node: ast.AST) -> set:
+    return {n.id for n in ast.walk(node) if isinstance(n, ast.Name)}
+
+
+def column_of(node: ast.AST, frame: str = None):
+    """(frame node, column name) when node is frame['col'] or frame.col, otherwise None"""
+    if isinstance(node, ast.Subscript) and isinstance(node.slice, ast.Constant) and isinstance(node.slice.value, str) and is_pure(node.value):
+        target = node.value
+    elif isinstance(node, ast.Attribute) and node.attr not in FRAME_ATTRIBUTES and is_pure(node.value):
+        target = node.value
+    else:
+        return None
+    if frame is not None and not (isinstance(target, ast.Name) and target.id == frame):
+        return None
+    return target, node.slice.value if isinstance(node, ast.Subscript) else node.attr
+
+
+def call(function: str, *args, **keywords) -> ast.Call:
+    """function is a dotted name like np.where"""
+    node = None
+    for part in function.split("."):
+        node = ast.Name(part, ast.Load()) if node is None else ast.Attribute(node, part, ast.Load())
+    return ast.Call(node, list(args), [ast.keyword(k, v) for k, v in keywords.items()])
+
+
+def method(receiver: ast.AST, name: str, *args, **keywords) -> ast.Call:
+    return ast.Call(ast.Attribute(receiver, name, ast.Load()), list(args), [ast.keyword(k, v) for k, v in keywords.items()])
+
+
+def column(frame: ast.AST, name: str) -> ast.Subscript:
+    return ast.Subscript(copy.deepcopy(frame), ast.Constant(name), ast.Load())
+
+
+class ExpressionVectorizer():
+    """
+    Turns an expression over one row (row['a'], row.a) or one element (the loop/lambda variable) into the same
+    expression over whole columns. convert returns (node, kind), kind being "scalar" (doesn't depend on the row),
+    "series" (a Series aligned with the frame) or "array" (a NumPy array, e.g. from np.where)
+    """
+    def __init__(self, row: str = None, frame: ast.AST = None, element: str = None, series: ast.AST = None, index: str = None,
+                 text_columns: set = frozenset(), element_text: bool = False):
+        self.row, self.frame = row, frame
+        self.element, self.series = element, series
+        self.index = index # the row label of an iterrows loop
+        self.text_columns = text_columns # columns of frame known to hold strings
+        self.element_text = element_text # whether series holds strings
+        self.columns = set() # columns read from the row
+        self.text = set() # ids of the converted nodes known to be text Series, the only ones given the .str accessor
+        self.accumulators = set() # names the loop updates, their value changes from one row to the next
+
+    def convert(self, node: ast.AST, condition: bool = False) -> tuple:
+        handler = getattr(self, f"convert_{type(node).__name__}", None)
+        if handler is None:
+            raise Unsupported(type(node).__name__)
+        return handler(node, condition)
+
+    def textual(self, node: ast.AST, text: bool) -> ast.AST:
+        if text:
+            self.text.add(id(node))
+        return node
+
+    @staticmethod
+    def vector(*kinds) -> str:
+        if "array" in kinds:
+            return "array"
+        return "series" if "series" in kinds else "scalar"
+
+    def convert_Constant(self, node, condition):
+        return node, "scalar"
+
+    def convert_Name(self, node, condition):
+        if node.id == self.element:
+            return self.textual(copy.deepcopy(self.series), self.element_text), "series"
+        if node.id == self.row:
+            raise Unsupported("the whole row is used")
+        if node.id == self.index:
+            return method(ast.Attribute(copy.deepcopy(self.frame), "index", ast.Load()), "to_series"), "series"
+        if node.id in self.accumulators:
+            raise Unsupported(f"{node.id} is updated by the loop and read in it")
+        return node, "scalar"
+
+    def convert_Subscript(self, node, condition):
+        if self.row is not None and isinstance(node.value, ast.Name) and node.value.id == self.row:
+            if isinstance(node.slice, ast.Constant) and isinstance(node.slice.value, str):
+                self.columns.add(node.slice.value)
+                return self.textual(column(self.frame, node.slice.value), node.slice.value in self.text_columns), "series"
+            raise Unsupported("row indexed by position or a variable")
+        value, kind = self.convert(node.value)
+        if kind != "scalar":
+            raise Unsupported("subscript of a column value")
+        _, key_kind = self.convert(node.slice)
+        if key_kind != "scalar":
+            # d[x] looks every value up in a dict or list of the namespace, keeping the node would read a stale x
+            raise Unsupported("lookup keyed on the column values (use .map(d) for a dict)")
+        return node, "scalar"
+
+    def convert_Slice(self, node, condition):
+        for bound in (node.lower, node.upper, node.step):
+            if bound is not None and self.convert(bound)[1] != "scalar":
+                raise Unsupported("slice bounds from the column values")
+        return node, "scalar"
+
+    def convert_Attribute(self, node, condition):
+        if self.row is not None and isinstance(node.value, ast.Name) and node.value.id == self.row:
+            if node.attr in FRAME_ATTRIBUTES or node.attr == "name":
+                raise Unsupported(f"row.{node.attr}")
+            self.columns.add(node.attr)
+            return self.textual(column(self.frame, node.attr), node.attr in self.text_columns), "series"
+        value, kind = self.convert(node.value)
+        if kind != "scalar":
+            raise Unsupported("attribute of a column value")
+        return node, "scalar"
+
+    def convert_BinOp(self, node, condition):
+        left, left_kind = self.convert(node.left)
+        right, right_kind = self.convert(node.right)
+        if isinstance(node.op, ast.Mod) and isinstance(node.left, ast.Constant) and isinstance(node.left.value, str) and right_kind != "scalar":
+            raise Unsupported("% formatting")
+        text = isinstance(node.op, ast.Add) and (id(left) in self.text or id(right) in self.text)
+        return self.textual(ast.BinOp(left, node.op, right), text), self.vector(left_kind, right_kind)
+
+    def convert_UnaryOp(self, node, condition):
+        operand, kind = self.convert(node.operand, condition)
+        if isinstance(node.op, ast.Not) and kind != "scalar":
+            if not condition:
+                raise Unsupported("not in a value")
+            return ast.UnaryOp(ast.Invert(), operand), kind
+        return ast.UnaryOp(node.op, operand), kind
+
+    def convert_BoolOp(self, node, condition):
+        values = [self.convert(value, condition) for value in node.values]
+        kind = self.vector(*(k for _, k in values))
+        if kind == "scalar":
+            return ast.BoolOp(node.op, [v for v, _ in values]), kind
+        if not condition: # `a or b` picks a value, only a condition can become a mask
+            raise Unsupported("and/or in a value")
+        op = ast.BitAnd() if isinstance(node.op, ast.And) else ast.BitOr()
+        result = values[0][0]
+        for value, _ in values[1:]:
+            result = ast.BinOp(result, op, value)
+        return result, kind
+
+    def convert_Compare(self, node, condition):
+        parts, left = [], node.left
+        for op, right in zip(node.ops, node.comparators):
+            parts.append(self.compare(left, op, right))
+            left = right
+        kind = self.vector(*(k for _, k in parts))
+        if len(parts) == 1:
+            return parts[0]
+        if kind == "scalar":
+            return node, kind
+        result = parts[0][0]
+        for part, _ in parts[1:]:
+            result = ast.BinOp(result, ast.BitAnd(), part)
+        return result, kind
+
+    def compare(self, left, op, right) -> tuple:
+        left_node, left_kind = self.convert(left)
+        right_node, right_kind = self.convert(right)
+        if isinstance(op, (ast.In, ast.NotIn)):
+            if right_kind != "scalar" and left_kind == "scalar":
+                if id(right_node) not in self.text:
+                    raise Unsupported("membership test on a column that isn't text")
+                result = method(ast.Attribute(right_node, "str", ast.Load()), "contains", left_node, regex=ast.Constant(False))
+            elif left_kind != "scalar" and right_kind == "scalar" and isinstance(right, (ast.List, ast.Tuple, ast.Set)):
+                result = method(left_node, "isin", right_node)
+            elif left_kind == right_kind == "scalar":
+                return ast.Compare(left_node, [op], [right_node]), "scalar"
+            else:
+                raise Unsupported("membership test")
+            if left_kind == "array" or right_kind == "array":
+                raise Unsupported("membership test on an array")
+            return (ast.UnaryOp(ast.Invert(), result) if isinstance(op, ast.NotIn) else result), "series"
+        if isinstance(op, (ast.Is, ast.IsNot)):
+            if isinstance(right, ast.Constant) and right.value is None and left_kind == "series":
+                return method(left_node, "isna" if isinstance(op, ast.Is) else "notna"), "series"
+            if left_kind == right_kind == "scalar":
+                return ast.Compare(left_node, [op], [right_node]), "scalar"
+            raise Unsupported("identity test")
+        return ast.Compare(left_node, [op], [right_node]), self.vector(left_kind, right_kind)
+
+    def convert_IfExp(self, node, condition):
+        test, test_kind = self.convert(node.test, condition=True)
+        body, body_kind = self.convert(node.body, condition)
+        orelse, orelse_kind = self.convert(node.orelse, condition)
+        if test_kind == "scalar":
+            return ast.IfExp(test, body, orelse), self.vector(body_kind, orelse_kind)
+        return call("np.where", test, body, orelse), "array"
+
+    def convert_List(self, node, condition):
+        values = [self.convert(value) for value in node.elts]
+        if any(kind != "scalar" for _, kind in values):
+            raise Unsupported("list of column values")
+        return node, "scalar"
+
+    convert_Tuple = convert_Set = convert_List
+
+    def convert_JoinedStr(self, node, condition):
+        """f-strings become string concatenation of the columns cast to str"""
+        parts, kinds = [], []
+        for value in node.values:
+            if isinstance(value, ast.Constant):
+                parts.append(value)
+                continue
+            if value.conversion not in (-1, 115) or value.format_spec is not None:
+                raise Unsupported("f-string conversion or format spec")
+            inner, kind = self.convert(value.value)
+            kinds.append(kind)
+            parts.append(self.textual(method(inner, "astype", ast.Name("str", ast.Load())), True) if kind == "series" else call("str", inner) if kind == "scalar" else None)
+            if kind == "array":
+                raise Unsupported("f-string of an array")
+        if self.vector(*kinds) == "scalar":
+            return node, "scalar"
+        result = parts[0]
+        for part in parts[1:]:
+            result = ast.BinOp(result, ast.Add(), part)
+        return self.textual(result, True), "series"
+
+    def convert_Call(self, node, condition):
+        if any(isinstance(a, ast.Starred) for a in node.args) or any(k.arg is None for k in node.keywords):
+            raise Unsupported("star arguments")
+        args = [self.convert(a) for a in node.args]
+        keywords = [(k.arg, self.convert(k.value)) for k in node.keywords]
+        kinds = [k for _, k in args] + [k for _, (_, k) in keywords]
+        function = node.func
+        # a method of the value itself: str methods go through the .str accessor
+        if isinstance(function, ast.Attribute):
+            receiver, receiver_kind = self.convert(function.value)
+            if receiver_kind != "scalar":
+                if self.vector(*kinds) != "scalar" or receiver_kind != "series":
+                    raise Unsupported(f"method {function.attr} of a column value")
+                if function.attr not in STRING_METHODS:
+                    raise Unsupported(f"method {function.attr}")
+                if id(receiver) not in self.text: # x.replace(year=2020) on datetimes is not str.replace
+                    raise Unsupported(f"method {function.attr} of a column that isn't known to hold text")
+                extra = {"regex": ast.Constant(False)} if function.attr == "replace" else {}
+                if function.attr in ("split", "rsplit") and not node.args and not node.keywords:
+                    raise Unsupported("split on whitespace") # str.split() collapses runs of whitespace, .str.split() doesn't
+                result = method(ast.Attribute(receiver, "str", ast.Load()), function.attr, *[a for a, _ in args],
+                                **{k: v for k, (v, _) in keywords}, **extra)
+                return self.textual(result, function.attr in STRING_RESULTS), "series"
+            if self.vector(*kinds) == "scalar":
+                return node, "scalar"
+            module = function.value.id if isinstance(function.value, ast.Name) else None
+            if module in ("np", "numpy"):
+                return ast.Call(function, [a for a, _ in args], [ast.keyword(k, v) for k, (v, _) in keywords]), self.vector("series", *kinds)
+            if module == "math" and function.attr in MATH_FUNCTIONS and not keywords:
+                return call(f"np.{function.attr}", *[a for a, _ in args]), self.vector(*kinds)
+            raise Unsupported(f"call of {ast.unparse(function)}")
+        if self.vector(*kinds) == "scalar":
+            return node, "scalar"
+        if not isinstance(function, ast.Name) or keywords:
+            raise Unsupported("call with column values")
+        (first, first_kind), rest = args[0], args[1:]
+        name = function.id
+        if name == "len" and not rest and first_kind == "series":
+            return method(ast.Attribute(first, "str", ast.Load()), "len"), "series"
+        if name == "abs" and not rest:
+            return call("np.abs", first), first_kind
+        if name == "round" and len(rest) <= 1:
+            return call("np.round", first, *[a for a, _ in rest]), first_kind
+        if name in ("min", "max") and len(args) == 2:
+            return call("np.minimum" if name == "min" else "np.maximum", first, rest[0][0]), self.vector(*kinds)
+        if name in CASTS and not rest and first_kind == "series":
+            return self.textual(method(first, "astype", ast.Name(CASTS[name], ast.Load())), name == "str"), "series"
+        raise Unsupported(f"call of {name}")
+
+
+def finish(node: ast.AST, kind: str, frame: ast.AST) -> ast.AST:
+    """A Series aligned with frame, whatever the expression produced"""
+    if kind == "series":
+        return node
+    return call("pd.Series", node, index=ast.Attribute(copy.deepcopy(frame), "index", ast.Load()))
+
+
+def single_lambda(node: ast.AST):
+    if isinstance(node, ast.Lambda) and len(node.args.args) == 1 and not node.args.defaults and not node.args.vararg and not node.args.kwarg:
+        return node.args.args[0].arg, node.body
+    return None
+
+
+class Vectorizer(ast.NodeTransformer):
+    """
+    Rewrites the code's row-wise idioms in place, collecting the rules that fired and hints for the rest.
+    Only columns of names known to hold a dataframe (the ones passed in, and frames or columns the code
+    derives from them) are rewritten: g['a'].apply(...) on a groupby must stay as it is
+    """
+    def __init__(self, code: str, frames: dict = None):
+        self.code = code
+        self.rewritten = Counter()
+        self.hints = []
+        self.data = dict(frames or {}) # name -> the dataframe it holds when the code starts
+        self.frames = {name: None for name in self.data} # known dataframe names -> their text columns (None until looked up)
+        self.series = {} # names known to hold a column -> whether it holds text
+
+    def text_columns(self, name: str) -> set:
+        if self.frames.get(name) is None:
+            data = self.data.get(name)
+            self.frames[name] = {str(c) for c in data.columns if is_text(data[c])} if data is not None else set()
+        return self.frames[name]
+
+    def known_column(self, node: ast.AST):
+        """None unless node is a column of a known dataframe (frame['c'], frame.c) or a name holding one, else whether it holds text"""
+        if isinstance(node, ast.Name):
+            return self.series.get(node.id)
+        found = column_of(node)
+        if found is None or not isinstance(found[0], ast.Name) or found[0].id not in self.frames:
+            return None
+        return found[1] in self.text_columns(found[0].id)
+
+    def frame_expression(self, node: ast.AST):
+        """None unless node builds a dataframe from a known one, else the text columns it keeps"""
+        if isinstance(node, ast.Name) and node.id in self.frames:
+            return set(self.text_columns(node.id))
+        if (isinstance(node, ast.Subscript) and isinstance(node.value, ast.Name) and node.value.id in self.frames
+                and isinstance(node.slice, (ast.List, ast.Compare, ast.BinOp, ast.UnaryOp))): # df[['a', 'b']], df[df['a'] > 0]
+            return set(self.text_columns(node.value.id))
+        if (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr in SAME_COLUMNS
+                and isinstance(node.func.value, ast.Name) and node.func.value.id in self.frames):
+            return set(self.text_columns(node.func.value.id))
+        return None
+
+    def track(self, statement: ast.AST, nested: bool):
+        """
+        Keeps the known dataframes and columns current after a statement: names it rebinds are forgotten and
+        columns it writes lose their known type. Only unconditional top level assignments add names
+        """
+        frame, series = None, None
+        if not nested and isinstance(statement, ast.Assign) and len(statement.targets) == 1 and isinstance(statement.targets[0], ast.Name):
+            frame, series = self.frame_expression(statement.value), self.known_column(statement.value)
+        for node in ast.walk(statement):
+            if isinstance(node, ast.Name) and isinstance(node.ctx, (ast.Store, ast.Del)):
+                self.frames.pop(node.id, None)
+                self.series.pop(node.id, None)
+            elif isinstance(node, (ast.Subscript, ast.Attribute)) and isinstance(node.ctx, (ast.Store, ast.Del)):
+                self.written(node)
+            elif isinstance(node, ast.Call) and any(k.arg == "inplace" for k in node.keywords):
+                self.written(node.func)
+            elif isinstance(node, (ast.Import, ast.ImportFrom)):
+                for alias in node.names:
+                    self.frames.pop((alias.asname or alias.name).split(".")[0], None)
+            elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                self.frames.pop(node.name, None)
+        if frame is not None:
+            self.frames[statement.targets[0].id] = frame
+        elif series is not None:
+            self.series[statement.targets[0].id] = series
+
+    def written(self, target: ast.AST):
+        """target (df['c'], df.loc[..., 'c'], s[0], ...) is written in place"""
+        base = target
+        while isinstance(base, (ast.Subscript, ast.Attribute)):
+            base = base.value
+        if not isinstance(base, ast.Name):
+            return
+        if base.id in self.series:
+            self.series[base.id] = False
+        if base.id not in self.frames:
+            return
+        found = column_of(target)
+        if found is None and isinstance(target, ast.Subscript) and isinstance(target.value, ast.Attribute) and target.value.attr in ("loc", "at") \
+                and isinstance(target.slice, ast.Tuple) and len(target.slice.elts) == 2 and isinstance(target.slice.elts[1], ast.Constant):
+            found = (base, target.slice.elts[1].value)
+        if found is not None and found[0] is base:
+            self.text_columns(base.id).discard(str(found[1]))
+        else:
+            self.frames[base.id] = set()
+
+    def hint(self, rule: str, node: ast.AST, reason: str = None):
+        segment = ast.get_source_segment(self.code, node) or ast.unparse(node)
+        entry = {"rule": rule, "line": getattr(node, "lineno", None), "code": segment.splitlines()[0][:200], "hint": HINTS[rule]}
+        if reason:
+            entry["reason"] = reason
+        self.hints.append(entry)
+
+    # ---------- expressions: df.apply(lambda row: ..., axis=1), s.apply(lambda v: ...), s.map(lambda v: ...)
+    def visit_Call(self, node):
+        self.generic_visit(node)
+        function = node.func
+        if not isinstance(function, ast.Attribute) or function.attr not in ("apply", "map"):
+            return node
+        axis = next((k.value for k in node.keywords if k.arg == "axis"), None)
+        if function.attr == "apply" and isinstance(axis, ast.Constant) and axis.value in (1, "columns"):
+            return self.rewrite_apply_rows(node)
+        text = self.known_column(function.value)
+        if text is not None and axis is None:
+            return self.rewrite_apply_elements(node, text)
+        return node
+
+    def rewrite_apply_rows(self, node):
+        frame = node.func.value
+        if not (isinstance(frame, ast.Name) and frame.id in self.frames):
+            return node # not known to be a dataframe
+        lam = single_lambda(node.args[0]) if len(node.args) == 1 else None
+        if lam is None or len(node.keywords) != 1:
+            self.hint("apply_axis1", node, "not a one-argument lambda on a dataframe variable")
+            return node
+        try:
+            result, kind = ExpressionVectorizer(row=lam[0], frame=frame, text_columns=self.text_columns(frame.id)).convert(lam[1])
+        except Unsupported as e:
+            self.hint("apply_axis1", node, str(e))
+            return node
+        self.rewritten["apply_axis1"] += 1
+        return ast.copy_location(finish(result, kind, frame), node)
+
+    def rewrite_apply_elements(self, node, text: bool):
+        series = node.func.value
+        lam = single_lambda(node.args[0]) if len(node.args) == 1 and not node.keywords else None
+        if lam is None:
+            if node.args and isinstance(node.args[0], (ast.Dict, ast.Name)) and node.func.attr == "map":
+                return node # map with a dict or Series is already vectorized
+            self.hint("series_apply", node, "not a one-argument lambda")
+            return node
+        try:
+            result, kind = ExpressionVectorizer(element=lam[0], series=series, element_text=text).convert(lam[1])
+        except Unsupported as e:
+            self.hint("series_apply", node, str(e))
+            return node
+        self.rewritten["series_apply"] += 1
+        return ast.copy_location(finish(result, kind, series), node)
+
+    # ---------- statements: loops over rows or over a column
+    def visit_Module(self, node):
+        node.body = self.rewrite_body(node.body)
+        return node
+
+    def rewrite_body(self, body: list, nested: bool = False) -> list:
+        result = []
+        for position, statement in enumerate(body):
+            if isinstance(statement, ast.For) and not statement.orelse:
+                later = names_in(ast.Module(body[position + 1:], type_ignores=[]))
+                replacement = self.rewrite_loop(statement, later)
+                if replacement is not None:
+                    result.extend(ast.copy_location(r, statement) for r in replacement)
+                    self.track(statement, nested)
+                    continue
+            for field in ("body", "orelse", "finalbody"):
+                if isinstance(getattr(statement, field, None), list) and not isinstance(statement, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                    setattr(statement, field, self.rewrite_body(getattr(statement, field), nested=True))
+            result.append(self.visit(statement))
+            self.track(statement, nested)
+        return result
+
+    def rewrite_loop(self, loop: ast.For, later: set):
+        """Vectorized statements replacing the loop, or None (with a hint when it's a known slow idiom)"""
+        target, iterator = loop.target, loop.iter
+        if isinstance(iterator, ast.Call) and isinstance(iterator.func, ast.Attribute) and not iterator.args:
+            if iterator.func.attr == "itertuples":
+                self.hint("itertuples", loop)
+                return None
+            if iterator.func.attr == "iterrows":
+                frame = iterator.func.value
+                if not (isinstance(frame, ast.Name) and isinstance(target, ast.Tuple) and len(target.elts) == 2
+                        and all(isinstance(e, ast.Name) for e in target.elts)):
+                    self.hint("iterrows", loop, "loop target or dataframe too complex")
+                    return None
+                index, row = target.elts[0].id, target.elts[1].id
+                if {index, row} & later:
+                    self.hint("iterrows", loop, "the loop variables are used after the loop")
+                    return None
+                text_columns = self.text_columns(frame.id) if frame.id in self.frames else set()
+                try:
+                    statements = self.loop_body(loop.body, ExpressionVectorizer(row=row, frame=frame, index=index, text_columns=text_columns), frame, index)
+                except Unsupported as e:
+                    self.hint("iterrows", loop, str(e))
+                    return None
+                self.rewritten["iterrows"] += 1
+                return statements
+        series, text = self.iterated_column(iterator)
+        if series is not None and isinstance(target, ast.Name):
+            if target.id in later:
+                self.hint("column_loop", loop, "the loop variable is used after the loop")
+                return None
+            try:
+                statements = self.loop_body(loop.body, ExpressionVectorizer(element=target.id, series=series, element_text=text), series, None)
+            except Unsupported as e:
+                self.hint("column_loop", loop, str(e))
+                return None
+            self.rewritten["column_loop"] += 1
+            return statements
+        if self.is_index_loop(iterator):
+            self.hint("index_loop", loop)
+        return None
+
+    def iterated_column(self, iterator: ast.AST) -> tuple:
+        """(Series node, whether it holds text) when the loop iterates over a known column (df['c'], df.c, df['c'].values, .tolist(), ...)"""
+        if isinstance(iterator, ast.Call) and not iterator.args and isinstance(iterator.func, ast.Attribute) and iterator.func.attr in COLUMN_ITERATORS:
+            iterator = iterator.func.value
+        elif isinstance(iterator, ast.Attribute) and iterator.attr in ("values", "array") and self.known_column(iterator.value) is not None:
+            iterator = iterator.value
+        text = self.known_column(iterator)
+        return (iterator, text) if text is not None else (None, None)
+
+    @staticmethod
+    def is_index_loop(iterator: ast.AST) -> bool:
+        """for i in range(len(df)) / for i in df.index"""
+        if isinstance(iterator, ast.Attribute) and iterator.attr == "index":
+            return True
+        return (isinstance(iterator, ast.Call) and isinstance(iterator.func, ast.Name) and iterator.func.id == "range"
+                and any(isinstance(a, ast.Call) and isinstance(a.func, ast.Name) and a.func.id == "len" for a in iterator.args))
+
+    def loop_body(self, body: list, vectorizer: ExpressionVectorizer, frame: ast.AST, index: str) -> list:
+        """
+        The loop body as whole-column statements. Supported statements: assigning the row's cell
+        (df.at[i, 'c'] = ..., df.loc[i, 'c'] = ...), acc += ..., lst.append(...), and ifs around them
+        """
+        statements, assigned = [], set()
+        # acc += ... and lst.append(...) run row after row: once vectorized, any other read of acc or lst
+        # (in a condition, in another update) would see the value from before the loop
+        vectorizer.accumulators = self.accumulators(body)
+        if vectorizer.accumulators & {vectorizer.row, vectorizer.element, vectorizer.index}:
+            raise Unsupported("a loop variable is updated in the loop")
+        for statement in body:
+            statements.extend(self.loop_statement(statement, vectorizer, frame, index, None, assigned))
+        return statements
+
+    def loop_statement(self, statement, vectorizer, frame, index, mask, assigned) -> list:
+        if isinstance(statement, ast.If):
+            test, kind = vectorizer.convert(statement.test, condition=True)
+            if kind == "scalar":
+                raise Unsupported("condition doesn't depend on the row")
+            cell = self.cell_target(statement.body, frame, index) if len(statement.body) == 1 else None
+            if cell is not None and statement.orelse and mask is None:
+                # if/else assigning the same cell: one np.where (elif chains nest)
+                values = self.branch_value(statement, vectorizer, frame, index, cell)
+                if values is not None:
+                    self.check_assigned(vectorizer, assigned, cell)
+                    return [self.assign_column(frame, cell, values)]
+            inner = test if mask is None else ast.BinOp(mask, ast.BitAnd(), test)
+            statements = []
+            for child in statement.body:
+                statements.extend(self.loop_statement(child, vectorizer, frame, index, inner, assigned))
+            if statement.orelse:
+                negated = ast.UnaryOp(ast.Invert(), copy.deepcopy(test))
+                other = negated if mask is None else ast.BinOp(copy.deepcopy(mask), ast.BitAnd(), negated)
+                for child in statement.orelse:
+                    statements.extend(self.loop_statement(child, vectorizer, frame, index, other, assigned))
+            return statements
+        if isinstance(statement, ast.Assign) and len(statement.targets) == 1:
+            cell = self.cell_target([statement], frame, index)
+            if cell is None:
+                raise Unsupported("assignment other than the row's cell")
+            value, kind = vectorizer.convert(statement.value)
+            self.check_assigned(vectorizer, assigned, cell)
+            if mask is None:
+                return [self.assign_column(frame, cell, (value, kind))]
+            # only the rows matching the condition change, the others keep their value (or NaN for a new column)
+            target = ast.Subscript(ast.Attribute(copy.deepcopy(frame), "loc", ast.Load()), ast.Tuple([mask, ast.Constant(cell)], ast.Load()), ast.Store())
+            return [ast.Assign([target], finish(value, kind, frame) if kind == "array" else value)]
+        if isinstance(statement, ast.AugAssign) and isinstance(statement.target, ast.Name) and isinstance(statement.op, ast.Add):
+            value, kind = vectorizer.convert(statement.value)
+            return [ast.AugAssign(ast.Name(statement.target.id, ast.Store()), ast.Add(), self.reduce(value, kind, frame, mask, "sum"))]
+        if (isinstance(statement, ast.Expr) and isinstance(statement.value, ast.Call) and isinstance(statement.value.func, ast.Attribute)
+                and statement.value.func.attr == "append" and isinstance(statement.value.func.value, ast.Name)
+                and len(statement.value.args) == 1 and not statement.value.keywords):
+            value, kind = vectorizer.convert(statement.value.args[0])
+            return [ast.Expr(method(ast.Name(statement.value.func.value.id, ast.Load()), "extend", self.reduce(value, kind, frame, mask, "tolist")))]
+        if isinstance(statement, ast.Pass):
+            return []
+        raise Unsupported(f"{type(statement).__name__} statement in the loop")
+
+    @staticmethod
+    def accumulators(body: list) -> set:
+        names = set()
+        for node in ast.walk(ast.Module(body, type_ignores=[])):
+            if isinstance(node, ast.AugAssign) and isinstance(node.target, ast.Name):
+                names.add(node.target.id)
+            elif isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == "append" and isinstance(node.func.value, ast.Name):
+                names.add(node.func.value.id)
+        return names
+
+    @staticmethod
+    def check_assigned(vectorizer, assigned: set, cell: str):
+        # the row is a snapshot: reading a column the loop already wrote differs once vectorized
+        if vectorizer.columns & assigned or cell in vectorizer.columns and cell in assigned:
+            raise Unsupported("the loop reads a column it writes")
+        assigned.add(cell)
+
+    @staticmethod
+    def cell_target(body: list, frame, index):
+        """The column name when body is a single df.at[i, 'c'] = ... / df.loc[i, 'c'] = ... for the loop's row"""
+        statement = body[0]
+        if index is None or not isinstance(statement, ast.Assign) or len(statement.targets) != 1:
+            return None
+        target = statement.targets[0]
+        if not (isinstance(target, ast.Subscript) and isinstance(target.value, ast.Attribute) and target.value.attr in ("at", "loc")
+                and isinstance(target.value.value, ast.Name) and target.value.value.id == frame.id):
+            return None
+        key = target.slice
+        if (isinstance(key, ast.Tuple) and len(key.elts) == 2 and isinstance(key.elts[0], ast.Name) and key.elts[0].id == index
+                and isinstance(key.elts[1], ast.Constant) and isinstance(key.elts[1].value, str)):
+            return key.elts[1].value
+        return None
+
+    def branch_value(self, statement, vectorizer, frame, index, cell):
+        """(np.where(...), "array") for if/elif/else chains that all assign cell, otherwise None"""
+        if len(statement.body) != 1 or self.cell_target(statement.body, frame, index) != cell:
+            return None
+        test, _ = vectorizer.convert(statement.test, condition=True)
+        body, _ = vectorizer.convert(statement.body[0].value)
+        if len(statement.orelse) != 1:
+            return None
+        other = statement.orelse[0]
+        if isinstance(other, ast.If):
+            nested = self.branch_value(other, vectorizer, frame, index, cell)
+            if nested is None:
+                return None
+            orelse = nested[0]
+        elif self.cell_target([other], frame, index) == cell:
+            orelse, _ = vectorizer.convert(other.value)
+        else:
+            return None
+        return call("np.where", test, body, orelse), "array"
+
+    @staticmethod
+    def assign_column(frame, cell: str, value: tuple) -> ast.Assign:
+        node, kind = value
+        target = ast.Subscript(copy.deepcopy(frame), ast.Constant(cell), ast.Store())
+        return ast.Assign([target], node if kind != "scalar" else node)
+
+    @staticmethod
+    def reduce(value, kind: str, frame, mask, how: str) -> ast.AST:
+        """sum (acc += ...) or tolist (lst.append(...)) of the loop's values, over the rows where mask holds"""
+        if kind == "scalar":
+            count = call("len", copy.deepcopy(frame)) if mask is None else call("int", method(call("np.sum", mask), "item"))
+            if how == "sum":
+                return ast.BinOp(value, ast.Mult(), count)
+            return ast.BinOp(ast.List([value], ast.Load()), ast.Mult(), count)
+        series = finish(value, kind, frame)
+        if mask is not None:
+            series = ast.Subscript(series, mask, ast.Load())
+        # Python's sum propagates NaN, pandas skips it unless told not to
+        return method(series, "sum", skipna=ast.Constant(False)) if how == "sum" else method(series, "tolist")
+
+
+def rewrite(code: str, mode: str = VECTORIZE, frames: dict = None) -> tuple:
+    """
+    (code to run, {rule: times rewritten}, hints). frames are the dataframes in the namespace by name, only
+    their columns are rewritten. The code is returned unchanged when nothing was rewritten, when mode is not
+    "rewrite" or when it can't be parsed
+    """
+    if mode == "off":
+        return code, {}, []
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return code, {}, []
+    vectorizer = Vectorizer(code, frames)
+    new_tree = ast.fix_missing_locations(vectorizer.visit(copy.deepcopy(tree)))
+    rewritten = dict(vectorizer.rewritten)
+    if mode != "rewrite":
+        # only report: everything that would have been rewritten becomes a hint too
+        hints = vectorizer.hints + [{"rule": rule, "hint": HINTS[rule]} for rule in rewritten]
+        return code, {}, hints
+    if not rewritten:
+        return code, {}, vectorizer.hints
+    return ast.unparse(new_tree), rewritten, vectorizer.hints
+
+
+def notes(vectorized: dict) -> str:
+    """Text form of a call's rewrites and hints, appended to tool outputs that are plain strings"""
+    lines = []
+    if vectorized.get("rewritten"):
+        lines.append("[row-wise code was rewritten into vectorized code: " + ", ".join(f"{rule} x{n}" for rule, n in vectorized["rewritten"].items()) + "]")
+    for hint in vectorized.get("hints", []):
+        lines.append(f"[hint, line {hint.get('line')}: {hint['hint']}]")
+    return "\n" + "\n".join(lines) if lines else ""
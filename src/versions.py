@@ -0,0 +1,187 @@
+import os
+import copy
+import time
+import threading
+import numpy as np
+import pandas as pd
+
+VERSION_HISTORY = int(os.environ.get("EDA_VERSION_HISTORY", 10)) # dataframe versions kept per session for undo/redo
+VERSION_BYTES = int(os.environ.get("EDA_VERSION_BYTES", 1024 ** 3)) # memory the other versions may hold on top of the current one
+
+
+def column_buffers(series: pd.Series) -> dict:
+    """
+    The memory behind a column as {buffer key: bytes}. Keys are buffer addresses, so columns that share
+    their data between versions (copy-on-write views) get the same keys and are counted once
+    """
+    array, dtype = series.array, series.dtype
+    if isinstance(dtype, pd.CategoricalDtype):
+        return {**column_buffers(pd.Series(array.codes, copy=False)), **column_buffers(pd.Series(array.categories, copy=False))}
+    if isinstance(array, pd.arrays.ArrowExtensionArray): # arrow strings and other arrow dtypes, no copy
+        chunks = array.__arrow_array__().chunks
+        return {(buffer.address, buffer.size): buffer.size for chunk in chunks for buffer in chunk.buffers() if buffer is not None}
+    if isinstance(dtype, pd.DatetimeTZDtype): # the UTC values, no copy
+        values = series.to_numpy(dtype=f"datetime64[{dtype.unit}]", copy=False)
+        return {(values.__array_interface__["data"][0], values.nbytes): int(values.nbytes)}
+    if isinstance(array, (pd.arrays.IntegerArray, pd.arrays.FloatingArray)):
+        # nullable numbers: arrow wraps their values without a copy (only the validity bitmap is built on each call)
+        values = array.__arrow_array__().buffers()[1]
+        return {(values.address, values.size): int(series.memory_usage(deep=True, index=False))}
+    if isinstance(dtype, np.dtype): # numpy backed, naive datetimes and timedeltas included
+        values = series.to_numpy(copy=False)
+        # the python objects of object columns live outside the array, count them with it
+        nbytes = int(series.memory_usage(deep=True, index=False)) if values.dtype == object else int(values.nbytes)
+        return {(values.__array_interface__["data"][0], values.nbytes): nbytes}
+    # other extension arrays (booleans, periods, intervals, ...) are counted whole, keyed on the array itself
+    return {("array", id(array)): int(series.memory_usage(deep=True, index=False))}
+
+
+def frame_buffers(df: pd.DataFrame) -> dict:
+    buffers = {}
+    for position in range(df.shape[1]):
+        buffers.update(column_buffers(df.iloc[:, position]))
+    if isinstance(df.index, pd.RangeIndex):
+        buffers[("range", df.index.start, df.index.stop, df.index.step)] = int(df.index.memory_usage())
+    else:
+        buffers.update(column_buffers(pd.Series(df.index, index=pd.RangeIndex(len(df.index)), copy=False)))
+    return buffers
+
+
+def share_unchanged(previous: pd.DataFrame, df: pd.DataFrame, changed: list) -> pd.DataFrame:
+    """
+    df with the columns a modification didn't change taken from the previous version, so both versions share
+    their buffers. Used when df was rebuilt from scratch (read back from a worker) rather than modified in place
+    """
+    if previous is None or previous is df or not df.columns.is_unique or not previous.columns.is_unique or not df.index.equals(previous.index):
+        return df
+    unchanged = [name for name in df.columns if str(name) not in changed and name in previous.columns]
+    if not unchanged:
+        return df
+    return pd.DataFrame({name: previous[name] if name in unchanged else df[name] for name in df.columns}, index=previous.index, copy=False)
+
+
+class Version():
+    """One dataframe version with everything needed to switch back to it without recomputing anything"""
+    def __init__(self, number: int, df: pd.DataFrame, data_version: str, profile, optimization: dict, digest, label: str):
+        self.number = number
+        self.df = df.copy(deep=False) # copy-on-write snapshot (turned on by execution on pandas 2), later in-place edits of the session frame don't reach it
+        self.data_version = data_version
+        self.profile = copy.copy(profile) # updates replace the profile's dicts, so a shallow copy is a snapshot
+        self.optimization = optimization
+        self.digest = digest
+        self.label = label
+        self.created = time.time()
+        self.buffers = frame_buffers(self.df)
+        self.nbytes = sum(self.buffers.values())
+
+
+class VersionHistory():
+    """
+    Linear undo/redo history of a session's dataframe. Versions are shallow copy-on-write snapshots, so the
+    columns a modification didn't touch are the same buffers in every version and only changed columns cost
+    memory. Modifying after an undo drops the versions that could have been redone. The oldest versions are
+    dropped beyond the version count and beyond the memory they hold on top of the current version.
+    """
+    def __init__(self, max_versions: int = VERSION_HISTORY, max_bytes: int = VERSION_BYTES):
+        self.max_versions = max_versions
+        self.max_bytes = max_bytes
+        self.versions = [] # oldest first
+        self.position = -1 # index of the current version
+        self.counter = 0
+        self.extra_bytes = 0 # memory held by the versions other than the current one
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.versions)
+
+    def current(self) -> Version:
+        return self.versions[self.position] if self.versions else None
+
+    def push(self, df: pd.DataFrame, data_version: str, profile, optimization: dict, digest, label: str) -> Version:
+        """Records the session's new current version"""
+        with self.lock:
+            self.counter += 1
+            version = Version(self.counter, df, data_version, profile, optimization, digest, label)
+            del self.versions[self.position + 1:] # no redo past a new modification
+            self.versions.append(version)
+            self.position = len(self.versions) - 1
+            self.trim()
+            return version
+
+    def clear(self):
+        with self.lock:
+            self.versions, self.position, self.extra_bytes = [], -1, 0
+
+    def move(self, steps: int) -> Version:
+        """The version steps away from the current one (negative to undo), which becomes the current one. Raises KeyError when there is none"""
+        with self.lock:
+            target = self.position + steps
+            if steps == 0 or not 0 <= target < len(self.versions):
+                available = self.position if steps < 0 else len(self.versions) - 1 - self.position
+                raise KeyError(f"Can only {'undo' if steps < 0 else 'redo'} {available} step(s)")
+            self.position = target
+            self.account()
+            return self.versions[target]
+
+    def checkout(self, number: int) -> Version:
+        """Makes the version with this number the current one. Raises KeyError when it is not kept"""
+        with self.lock:
+            for position, version in enumerate(self.versions):
+                if version.number == number:
+                    self.position = position
+                    self.account()
+                    return version
+            raise KeyError(f"Unknown version {number}, kept versions are {[v.number for v in self.versions]}")
+
+    def trim(self):
+        self.account()
+        while len(self.versions) > 1 and (len(self.versions) > self.max_versions or self.extra_bytes > self.max_bytes):
+            if self.position > 0: # oldest first
+                self.versions.pop(0)
+                self.position -= 1
+            else: # then the furthest redo
+                self.versions.pop()
+            self.account()
+
+    def account(self):
+        current = self.versions[self.position].buffers if self.versions else {}
+        self.extra_bytes = sum(nbytes for key, nbytes in self.total_buffers().items() if key not in current)
+
+    def describe(self) -> dict:
+        """Kept versions with their memory: nbytes in total, unique_bytes held by no other kept version"""
+        with self.lock:
+            holders = {}
+            for version in self.versions:
+                for key in version.buffers:
+                    holders[key] = holders.get(key, 0) + 1
+            versions = [{
+                "version": version.number,
+                "label": version.label,
+                "created": version.created,
+                "current": position == self.position,
+                "shape": list(version.df.shape),
+                "data_version": version.data_version,
+                "nbytes": version.nbytes,
+                "unique_bytes": sum(nbytes for key, nbytes in version.buffers.items() if holders[key] == 1),
+            } for position, version in enumerate(self.versions)]
+            return {
+                "versions": versions,
+                "can_undo": max(self.position, 0),
+                "can_redo": len(self.versions) - 1 - self.position,
+                "total_bytes": sum(self.total_buffers().values()),
+                "extra_bytes": self.extra_bytes,
+                "max_versions": self.max_versions,
+                "max_bytes": self.max_bytes
+            }
+
+    def total_buffers(self) -> dict:
+        buffers = {}
+        for version in self.versions:
+            buffers.update(version.buffers)
+        return buffers
+
+
+def label(code: str, max_chars: int = 80) -> str:
+    """Short description of a modification: the first line of its code"""
+    line = next((line.strip() for line in code.splitlines() if line.strip() and not line.strip().startswith("#")), "")
+    return line if len(line) <= max_chars else line[:max_chars - 3] + "..."
@@ -0,0 +1,244 @@
+import os
+import time
+import uuid
+import atexit
+import shutil
+import tempfile
+import threading
+import multiprocessing as mp
+from collections import OrderedDict
+import pandas as pd
+
+# number of worker processes executing tool code (0 runs the code inside the server process)
+WORKERS = int(os.environ.get("EDA_WORKERS", 2))
+TIMEOUT = float(os.environ.get("EDA_WORKER_TIMEOUT", 120)) # wall-clock seconds per call
+RSS_LIMIT = int(os.environ.get("EDA_WORKER_RSS_LIMIT", 4 * 1024 ** 3)) # bytes per worker process
+WORKER_SESSIONS = int(os.environ.get("EDA_WORKER_SESSIONS", 16)) # warm namespaces kept per worker
+# dataframes are handed to workers as arrow files that they memory-map (point this at /dev/shm to keep them in RAM)
+FRAME_DIR = os.path.join(os.environ.get("EDA_FRAME_DIR", tempfile.gettempdir()), f"eda-agent-frames-{os.getpid()}")
+
+
+class WorkerError(Exception):
+    pass
+
+
+def write_frame(df: pd.DataFrame, name: str, frame_dir: str = FRAME_DIR) -> str:
+    """Writes a dataframe where workers can memory-map it and returns the path"""
+    import pyarrow as pa
+    os.makedirs(frame_dir, exist_ok=True)
+    path = os.path.join(frame_dir, f"{name}.arrow")
+    try:
+        table = pa.Table.from_pandas(df)
+        with pa.OSFile(path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    except (pa.ArrowException, TypeError, ValueError):
+        # mixed-type object columns can't go through arrow
+        path = path.replace(".arrow", ".pkl")
+        df.to_pickle(path)
+    return path
+
+def read_frame(path: str) -> pd.DataFrame:
+    """Reads a frame written by write_frame. Arrow buffers are mapped, not copied, where the dtype allows it"""
+    import pyarrow as pa
+    if path.endswith(".pkl"):
+        return pd.read_pickle(path)
+    if path.endswith(".parquet"): # out-of-core dataset, streamed from disk by the code itself
+        from lazyframe import LazyFrame
+        return LazyFrame(path)
+    with pa.memory_map(path) as source:
+        return pa.ipc.open_file(source).read_all().to_pandas(split_blocks=True)
+
+def remove_frame(path: str):
+    if path is not None and os.path.exists(path):
+        os.remove(path)
+
+def rss_bytes(pid: int) -> int:
+    """Resident memory of a process (linux only, 0 elsewhere)"""
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+
+def worker_main(conn):
+    """
+    Worker loop: keeps a warm namespace and the mapped dataframe per session. Calls with keep=False (another
+    session's worker helping out with an independent call) run in a throwaway namespace and leave nothing behind
+    """
+    from execution import ExecutionNamespace, execute
+    namespaces = OrderedDict() # session_id -> ExecutionNamespace, least recently used first
+    frames = {} # session_id -> (path, df)
+    while True:
+        request = conn.recv()
+        if request is None:
+            break
+        session_id, kind, code, frame_path, keep = request
+        if kind == "reset": # the server spilled or dropped the session
+            namespaces.pop(session_id, None)
+            frames.pop(session_id, None)
+            conn.send({})
+            continue
+        try:
+            start, mapped = time.perf_counter(), None
+            frame = frames.get(session_id)
+            if frame is None or frame[0] != frame_path:
+                frame = (frame_path, read_frame(frame_path))
+                mapped = time.perf_counter() - start
+                if keep:
+                    frames[session_id] = frame
+            df = frame[1]
+            # mapped buffers are read-only: modifications get their own copy, other calls a shallow one
+            df = df.copy() if kind == "modifying" else df.copy(deep=False)
+            if keep:
+                if session_id not in namespaces:
+                    namespaces[session_id] = ExecutionNamespace()
+                    if len(namespaces) > WORKER_SESSIONS:
+                        evicted, _ = namespaces.popitem(last=False)
+                        frames.pop(evicted, None)
+                namespaces.move_to_end(session_id)
+                namespace = namespaces[session_id]
+            else:
+                namespace = ExecutionNamespace()
+            result = execute(namespace, kind, code, df)
+            if keep:
+                # the server can't see this namespace: its variables and size travel back with every result
+                result["namespace"] = {"variables": namespace.describe(), "nbytes": namespace.total_bytes}
+            if mapped is not None:
+                result["timings"]["frame_map"] = mapped
+            if "df" in result:
+                # written next to the input frame, in the server's frame directory
+                start = time.perf_counter()
+                result["frame_path"] = write_frame(result.pop("df"), f"{session_id}-{uuid.uuid4().hex}", os.path.dirname(frame_path))
+                result["timings"]["frame_write"] = time.perf_counter() - start
+            result["output"] = result["output"] if isinstance(result["output"], str) else str(result["output"])
+            conn.send(result)
+        except Exception as e:
+            conn.send({"Error": f"{type(e).__name__}: {e}"})
+
+
+class Worker():
+    def __init__(self, context):
+        self.context = context
+        self.lock = threading.Lock() # one call at a time per worker
+        self.start()
+
+    def start(self):
+        self.conn, child_conn = self.context.Pipe()
+        self.process = self.context.Process(target=worker_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def restart(self):
+        self.process.kill()
+        self.process.join()
+        self.start()
+
+    def call(self, request, timeout: float, rss_limit: int, blocking: bool = True) -> dict:
+        """
+        Sends a request and waits for the reply, killing the worker if it runs out of time or memory.
+        With blocking=False returns None straight away when the worker is busy.
+        """
+        if not self.lock.acquire(blocking):
+            return None
+        try:
+            if not self.process.is_alive():
+                self.start()
+            self.conn.send(request)
+            deadline = time.monotonic() + timeout
+            while not self.conn.poll(0.05):
+                if not self.process.is_alive():
+                    self.start()
+                    raise WorkerError("Execution worker crashed")
+                if time.monotonic() > deadline:
+                    self.restart()
+                    raise WorkerError(f"Execution timed out after {timeout:.0f}s")
+                if rss_bytes(self.process.pid) > rss_limit:
+                    self.restart()
+                    raise WorkerError(f"Execution exceeded the memory limit of {rss_limit} bytes")
+            return self.conn.recv()
+        finally:
+            self.lock.release()
+
+
+class WorkerNamespace():
+    """
+    The server's side of a session namespace that lives in a worker: the variables and size the worker
+    reported with the session's latest result, and resets forwarded to the worker
+    """
+    def __init__(self, get_pool, session_id: str):
+        self.get_pool = get_pool # the pool, or None when it was never started
+        self.session_id = session_id
+        self.variables = {}
+        self.total_bytes = 0
+
+    def update(self, report: dict):
+        self.variables, self.total_bytes = report["variables"], report["nbytes"]
+
+    def describe(self) -> dict:
+        return dict(self.variables)
+
+    def reset(self):
+        self.variables, self.total_bytes = {}, 0
+        pool = self.get_pool()
+        if pool is not None:
+            pool.reset(self.session_id)
+
+
+class WorkerPool():
+    """
+    Pre-forked worker processes that execute tool code outside the server process.
+    Each session is pinned to one worker so its namespace stays warm there.
+    """
+    def __init__(self, size: int = WORKERS, timeout: float = TIMEOUT, rss_limit: int = RSS_LIMIT):
+        self.timeout = timeout
+        self.rss_limit = rss_limit
+        context = mp.get_context("forkserver")
+        # workers fork from a process that already imported the server's modules (so the server script they run
+        # again as __mp_main__ finds its imports done), the REPL tool, pyplot (after execution picked the Agg backend)
+        # and PIL. Modules are preloaded by name, never __main__, which would run whatever script started the pool
+        context.set_forkserver_preload(["pandas", "numpy", "pyarrow", "server", "execution", "langchain_experimental.tools",
+                                        "matplotlib.pyplot", "PIL.Image", "plotting"])
+        self.workers = [Worker(context) for _ in range(size)]
+        self.pending_resets = set() # sessions whose worker was busy when their namespace was reset
+        self.lock = threading.Lock()
+        atexit.register(self.close)
+
+    def worker_for(self, session_id: str) -> Worker:
+        return self.workers[sum(session_id.encode()) % len(self.workers)]
+
+    def run(self, session_id: str, kind: str, code: str, frame_path: str, any_worker: bool = False) -> dict:
+        """
+        Executes code in the session's worker. frame_path is the session dataframe written with write_frame.
+        With any_worker=True (code that doesn't need the warm namespace) an idle worker is used when the
+        session's own worker is busy, so independent calls run in parallel. Only the session's own worker keeps
+        its namespace and frame, so resets never need to reach the others.
+        """
+        pinned = self.worker_for(session_id)
+        with self.lock:
+            pending = session_id in self.pending_resets
+            self.pending_resets.discard(session_id)
+        if pending:
+            pinned.call((session_id, "reset", None, None, True), self.timeout, self.rss_limit)
+        if any_worker:
+            for worker in [pinned] + [w for w in self.workers if w is not pinned]:
+                result = worker.call((session_id, kind, code, frame_path, worker is pinned), self.timeout, self.rss_limit, blocking=False)
+                if result is not None:
+                    return result
+        return pinned.call((session_id, kind, code, frame_path, True), self.timeout, self.rss_limit)
+
+    def reset(self, session_id: str):
+        """
+        Drops the session's namespace and mapped frame in its worker. Never waits for a busy worker (the
+        session store calls this under its lock): the reset is then sent ahead of the session's next call
+        """
+        result = self.worker_for(session_id).call((session_id, "reset", None, None, True), self.timeout, self.rss_limit, blocking=False)
+        if result is None:
+            with self.lock:
+                self.pending_resets.add(session_id)
+
+    def close(self):
+        for worker in self.workers:
+            if worker.process.is_alive():
+                worker.process.kill()
+        shutil.rmtree(FRAME_DIR, ignore_errors=True)
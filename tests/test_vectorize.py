@@ -0,0 +1,125 @@
+"""
+Every rewrite must behave like the code it replaces: each snippet runs once as written and once as rewritten,
+on copies of the same dataframe, and the dataframe and the variables it leaves behind must match.
+"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import vectorize
+
+
+def frame() -> pd.DataFrame:
+    return pd.DataFrame({
+        "a": [10, 20, 30, -5],
+        "b": [1.5, np.nan, 3.0, 4.0],
+        "name": ["Paris", "lyon", "Nice", "metz"],
+        "when": pd.to_datetime(["2021-01-05", "2022-03-01", "2023-07-14", "2024-12-31"]),
+    }, index=[0, 1, 2, 3])
+
+
+def run(code: str, namespace: dict = None) -> dict:
+    namespace = {"df": frame(), "pd": pd, "np": np, **(namespace or {})}
+    exec(code, namespace)
+    return {k: v for k, v in namespace.items() if k not in ("__builtins__", "pd", "np")}
+
+
+def rewrite(code: str, mode: str = "rewrite") -> tuple:
+    return vectorize.rewrite(code, mode, frames={"df": frame()})
+
+
+LOOP_VARIABLES = {"i", "row", "x"} # only rewritten when nothing reads them after the loop
+
+
+def assert_same(original: dict, rewritten: dict):
+    assert original.keys() - LOOP_VARIABLES == rewritten.keys() - LOOP_VARIABLES
+    for name, value in original.items():
+        if name in LOOP_VARIABLES:
+            continue
+        if isinstance(value, pd.DataFrame):
+            pd.testing.assert_frame_equal(rewritten[name], value, check_dtype=False)
+        elif isinstance(value, pd.Series):
+            pd.testing.assert_series_equal(rewritten[name], value, check_dtype=False, check_names=False)
+        elif isinstance(value, list):
+            assert pd.Series(rewritten[name], dtype=object).equals(pd.Series(value, dtype=object)), name
+        else:
+            assert rewritten[name] == pytest.approx(value, nan_ok=True), name
+
+
+REWRITTEN = {
+    "iterrows_cell": "for i, row in df.iterrows():\n    df.at[i, 'c'] = row['a'] * 2 + row['b']\n",
+    "iterrows_index": "for i, row in df.iterrows():\n    df.at[i, 'c'] = row['a'] + i\n",
+    "iterrows_if_else": (
+        "for i, row in df.iterrows():\n"
+        "    if row['a'] > 15:\n        df.loc[i, 'c'] = 'high'\n"
+        "    elif row['a'] > 0:\n        df.loc[i, 'c'] = 'low'\n"
+        "    else:\n        df.loc[i, 'c'] = 'negative'\n"
+    ),
+    "iterrows_masked": "for i, row in df.iterrows():\n    if row['a'] > 15:\n        df.loc[i, 'c'] = row['a'] - 1\n",
+    "apply_axis1": "df['c'] = df.apply(lambda row: row['a'] if row['a'] > 0 else -row['a'], axis=1)\n",
+    "series_apply": "df['c'] = df['name'].apply(lambda v: v.upper())\n",
+    "series_map": "df['c'] = df['a'].map(lambda v: v * 3 + 1)\n",
+    "f_string": "df['c'] = df.apply(lambda row: f\"{row['name']}-{row['a']}\", axis=1)\n",
+    "column_sum": "total = 0\nfor x in df['a']:\n    total += x * 2\n",
+    "column_count": "n = 0\nfor x in df['a']:\n    if x > 0:\n        n += 1\n",
+    "column_append": "out = []\nfor x in df['name']:\n    out.append(x.lower())\n",
+    "two_accumulators": "total = 0\nn = 0\nfor x in df['a']:\n    total += x\n    n += 1\n",
+    "named_column": "s = df['name']\ndf['c'] = s.apply(lambda v: v.strip().upper())\n",
+    "derived_frame": "top = df[df['a'] > 0]\ntop['c'] = top['name'].map(lambda v: v.lower() + '!')\n",
+}
+
+REFUSED = {
+    "accumulator_read_by_other_update": "n = 0\ntotal = 0\nfor x in df['a']:\n    n += 1\n    total += x * n\n",
+    "accumulator_in_condition": "total = 0\nfor x in df['a']:\n    if total < 25:\n        total += x\n",
+    "list_read_in_loop": "out = []\nfor x in df['a']:\n    out.append(x + len(out))\n",
+    "loop_variable_updated": "for x in df['a']:\n    x += 1\n",
+    "reads_written_column": "for i, row in df.iterrows():\n    df.at[i, 'a'] = row['a'] + 1\n    df.at[i, 'c'] = row['a']\n",
+    "whole_row": "df['c'] = df.apply(lambda row: row.sum(), axis=1)\n",
+    "dict_lookup": "d = {10: 1, 20: 2, 30: 1, -5: 2}\ndf['c'] = df['a'].map(lambda x: d[x])\n",
+    "str_method_on_dates": "df['c'] = df['when'].apply(lambda x: x.replace(year=2020))\n",
+    "overwritten_text_column": "df['name'] = df['when']\ndf['c'] = df['name'].apply(lambda x: x.replace(year=2020))\n",
+    "str_method_on_numbers": "df['c'] = df['a'].apply(lambda x: x.upper())\n",
+}
+
+# not known to be columns of a dataframe, so not even hinted at
+UNTOUCHED = {
+    "groupby_column": "g = df.groupby('name')\nout = g['a'].apply(lambda v: v * 2)\n",
+    "rebound_frame": "df = df.groupby('name')\nout = df['a'].apply(lambda v: v * 2)\n",
+}
+
+
+@pytest.mark.parametrize("name", sorted(REWRITTEN))
+def test_rewrite_matches_the_loop(name):
+    code = REWRITTEN[name]
+    new_code, rewritten, _ = rewrite(code)
+    assert rewritten, f"{name} was not rewritten"
+    # a stale i in the namespace must not leak into the rewritten code
+    assert_same(run(code, {"i": 100}), run(new_code, {"i": 100}))
+
+
+@pytest.mark.parametrize("name", sorted(REFUSED))
+def test_unsafe_loops_are_left_alone(name):
+    code = REFUSED[name]
+    new_code, rewritten, hints = rewrite(code)
+    assert not rewritten and new_code == code
+    assert hints
+
+
+@pytest.mark.parametrize("name", sorted(UNTOUCHED))
+def test_other_objects_are_left_alone(name):
+    code = UNTOUCHED[name]
+    assert rewrite(code) == (code, {}, [])
+    run(code)
+
+
+def test_modes():
+    code = REWRITTEN["iterrows_cell"]
+    assert rewrite(code, "off") == (code, {}, [])
+    new_code, rewritten, hints = rewrite(code, "hint")
+    assert new_code == code and not rewritten and hints[0]["rule"] == "iterrows"
+    assert rewrite("for x in") == ("for x in", {}, [])
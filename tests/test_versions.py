@@ -0,0 +1,118 @@
+"""
+Undo/redo history: moving between versions, and counting the buffers that versions share once.
+"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from versions import VersionHistory, column_buffers, frame_buffers, share_unchanged
+
+if pd.__version__ < "3": # the server turns it on in execution
+    pd.options.mode.copy_on_write = True
+
+
+def frame(rows: int = 1000) -> pd.DataFrame:
+    return pd.DataFrame({"a": np.arange(rows), "b": np.linspace(0, 1, rows)})
+
+
+def push(history: VersionHistory, df: pd.DataFrame, name: str):
+    return history.push(df, name, None, None, None, name)
+
+
+def test_undo_redo_and_checkout():
+    history = VersionHistory()
+    df = frame()
+    push(history, df, "v1")
+    for name in ("v2", "v3"):
+        df = df.copy(deep=False)
+        df[name] = 1
+        push(history, df, name)
+    assert history.move(-1).data_version == "v2"
+    assert history.move(-1).data_version == "v1"
+    with pytest.raises(KeyError):
+        history.move(-1)
+    assert history.move(2).data_version == "v3"
+    with pytest.raises(KeyError):
+        history.move(1)
+    assert history.checkout(1).data_version == "v1"
+    assert list(history.current().df.columns) == ["a", "b"]
+    with pytest.raises(KeyError):
+        history.checkout(99)
+    # a modification after an undo drops the versions that could have been redone
+    push(history, history.current().df.assign(c=2), "v4")
+    assert [v.data_version for v in history.versions] == ["v1", "v4"]
+    assert history.describe()["can_redo"] == 0
+
+
+def test_versions_are_snapshots():
+    history = VersionHistory()
+    df = frame()
+    push(history, df, "v1")
+    df.loc[0, "a"] = -1 # an in-place edit of the session frame after the snapshot
+    push(history, df, "v2")
+    assert history.move(-1).df.loc[0, "a"] == 0
+
+
+COLUMNS = {
+    "int64": np.arange(100),
+    "float64": np.linspace(0, 1, 100),
+    "object": pd.Series([f"v{i}" for i in range(100)], dtype=object),
+    "datetime": pd.date_range("2024-01-01", periods=100),
+    "datetime_tz": pd.date_range("2024-01-01", periods=100, tz="UTC"),
+    "timedelta": pd.to_timedelta(np.arange(100), unit="s"),
+    "nullable_int": pd.array([1, None] * 50, dtype="Int64"),
+    "nullable_float": pd.array([1.5, None] * 50, dtype="Float64"),
+    "category": pd.Categorical(["x", "y"] * 50),
+    "arrow_string": pd.Series([f"v{i}" for i in range(100)], dtype="string[pyarrow]"),
+}
+
+
+@pytest.mark.parametrize("name", sorted(COLUMNS))
+def test_shallow_copies_share_buffers(name):
+    df = pd.DataFrame({"c": COLUMNS[name]})
+    shallow, deep = df.copy(deep=False), df.copy()
+    buffers = column_buffers(df["c"])
+    assert buffers and all(nbytes > 0 for nbytes in buffers.values())
+    assert column_buffers(shallow["c"]).keys() == buffers.keys()
+    if name not in ("arrow_string", "category"): # arrow buffers and categories are immutable, deep copies keep them
+        assert not column_buffers(deep["c"]).keys() & buffers.keys()
+
+
+def test_unchanged_columns_are_counted_once():
+    history = VersionHistory()
+    df = frame()
+    push(history, df, "v1")
+    modified = df.copy(deep=False)
+    modified["b"] = modified["b"] * 2
+    push(history, modified, "v2")
+    described = history.describe()
+    column = df["a"].nbytes
+    assert described["total_bytes"] == sum(frame_buffers(df).values()) + column # a's buffer is held once
+    assert [v["unique_bytes"] for v in described["versions"]] == [column, column] # only b differs
+    assert described["extra_bytes"] == column
+
+
+def test_rebuilt_frames_share_the_unchanged_columns():
+    previous = frame()
+    rebuilt = previous.copy() # read back from a worker: every column has its own buffers
+    rebuilt["b"] = 0.0
+    shared = share_unchanged(previous, rebuilt, ["b"])
+    assert column_buffers(shared["a"]).keys() == column_buffers(previous["a"]).keys()
+    assert column_buffers(shared["b"]).keys() == column_buffers(rebuilt["b"]).keys()
+
+
+def test_history_is_trimmed_by_memory():
+    df = frame()
+    history = VersionHistory(max_bytes=df["b"].nbytes * 2)
+    push(history, df, "v0")
+    for number in range(1, 5):
+        df = df.copy(deep=False)
+        df["b"] = df["b"] + 1 # a new buffer per version
+        push(history, df, f"v{number}")
+    assert [v.data_version for v in history.versions] == ["v2", "v3", "v4"]
+    assert history.extra_bytes <= history.max_bytes